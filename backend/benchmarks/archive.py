@@ -0,0 +1,112 @@
+"""Size of the active todo set and list latency before and after archiving.
+
+    python -m benchmarks.archive [--users 200] [--todos 500] [--completed 0.9] [--cache-kb 2048] [--requests 500]
+
+Seeds ``--users`` users with ``--todos`` todos each, ``--completed`` of
+them completed long ago, then times GET /todos/ (the full default list and
+a ``limit=50`` page) for random users with a ``--cache-kb`` page cache and
+mmap off, so reads that miss the cache go to the file. It then archives
+with the app's own job and times the same requests again, plus a page of
+``include_archived`` completed todos. ``hot_bytes`` is the size of the
+todos table and its indexes (from dbstat), the part every list request
+touches. SQLite only; exits 1 if anything is left unarchived or the archive
+listing misses todos.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from benchmarks.common import client, load_app, summarize
+
+
+def _bytes(conn, table):
+    row = conn.execute(
+        "SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_schema WHERE tbl_name = ?)", (table,)
+    ).fetchone()
+    return row[0] or 0
+
+
+async def _time(http, tokens, path, requests, rng):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await http.get(path, cookies={"session_token": rng.choice(tokens)})
+        response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+async def run(args):
+    os.environ.update({"SQLITE_CACHE_SIZE_KB": str(args.cache_kb), "SQLITE_MMAP_SIZE": "0",
+                       "STORAGE_BACKEND": "sqlite", "TODO_ARCHIVE_AFTER_DAYS": "30"})
+    app = load_app()
+    import database
+    import main
+
+    rng = random.Random(1)
+    tokens = []
+    for i in range(args.users):
+        user = await main.repo.create_user(f"user{i}", f"user{i}@example.com", b"unused")
+        tokens.append(await main.repo.create_session(user['id']))
+        rows = [{'title': f"todo {j}", 'description': "x" * 60, 'completed': rng.random() < args.completed}
+                for j in range(args.todos)]
+        await main.repo.import_todos(user['id'], rows)
+    with database.get_connection() as conn:
+        conn.execute("UPDATE todos SET last_modified_at = '2000-01-01 00:00:00' WHERE completed = 1")
+        conn.commit()
+        completed = conn.execute("SELECT COUNT(*) FROM todos WHERE completed = 1").fetchone()[0]
+
+    async def measure():
+        with database.get_connection() as conn:
+            sizes = {"hot_bytes": _bytes(conn, "todos"), "archive_bytes": _bytes(conn, "todos_archive")}
+        return {
+            **sizes,
+            "list_all": await _time(http, tokens, "/todos/", args.requests, rng),
+            "list_page_50": await _time(http, tokens, "/todos/?limit=50", args.requests, rng),
+        }
+
+    async with client(app) as http:
+        before = await measure()
+        start = time.perf_counter()
+        archived = await main.archive_completed_todos()
+        archive_seconds = time.perf_counter() - start
+        after = await measure()
+        after["archived_page_50"] = await _time(
+            http, tokens, "/todos/?include_archived=true&completed=true&limit=50", args.requests, rng
+        )
+        listed = 0
+        for token in tokens:
+            response = await http.get("/todos/?include_archived=true&completed=true",
+                                      cookies={"session_token": token})
+            listed += len(response.json())
+
+    with database.get_connection() as conn:
+        left = conn.execute("SELECT COUNT(*) FROM todos WHERE completed = 1").fetchone()[0]
+    return {
+        "users": args.users, "todos": args.users * args.todos, "completed": completed,
+        "cache_kb": args.cache_kb, "archived": archived, "archive_seconds": round(archive_seconds, 3),
+        "left_unarchived": left, "listed_with_include_archived": listed,
+        "before": before, "after": after,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--todos", type=int, default=500)
+    parser.add_argument("--completed", type=float, default=0.9)
+    parser.add_argument("--cache-kb", type=int, default=2048)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    if result["left_unarchived"] or result["listed_with_include_archived"] != result["completed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
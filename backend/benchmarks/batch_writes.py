@@ -0,0 +1,44 @@
+"""Creating N todos one request at a time versus one POST /todos/batch.
+
+    python -m benchmarks.batch_writes [--todos 1000]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import client, load_app, signup_and_login
+
+
+async def run(args):
+    app = load_app()
+    async with client(app) as http:
+        cookies = {"session_token": await signup_and_login(http, "writer")}
+
+        start = time.perf_counter()
+        for i in range(args.todos):
+            (await http.post("/todos/", json={"title": f"single {i}"}, cookies=cookies)).raise_for_status()
+        single = time.perf_counter() - start
+
+        operations = [{"op": "create", "title": f"batch {i}"} for i in range(args.todos)]
+        start = time.perf_counter()
+        (await http.post("/todos/batch", json={"operations": operations}, cookies=cookies)).raise_for_status()
+        batch = time.perf_counter() - start
+
+    return {
+        "todos": args.todos,
+        "single_requests_s": round(single, 3),
+        "batch_request_s": round(batch, 3),
+        "speedup": round(single / batch, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--todos", type=int, default=1000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
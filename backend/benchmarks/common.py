@@ -0,0 +1,54 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks drive the real ``main:app`` in-process through httpx's ASGI
+transport, against a throwaway SQLite file, so they never touch todos.db.
+"""
+import os
+import statistics
+import tempfile
+from typing import Dict, List
+
+
+def load_app(db_dir: str = None):
+    """Import ``main`` against a fresh database in ``db_dir`` and return the app."""
+    db_dir = db_dir or tempfile.mkdtemp(prefix="taskmaster-bench-")
+    os.environ["SQLITE_PATH"] = os.path.join(db_dir, "todos.db")
+    import main
+    # httpx's ASGI transport does not run the lifespan, where the schema is set up
+    if main.repo.name in ("sqlite", "sharded"):
+        import database
+        database.init_db()
+    return main.app
+
+
+def client(app):
+    import httpx
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+
+async def signup_and_login(http, username: str, password: str = "bench-password"):
+    await http.post("/auth/signup", json={
+        "username": username, "email": f"{username}@example.com", "password": password,
+    })
+    response = await http.post("/auth/login", json={"username": username, "password": password})
+    response.raise_for_status()
+    return response.cookies["session_token"]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Return count and p50/p95/p99/max latency in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(pct(50), 3),
+        "p95_ms": round(pct(95), 3),
+        "p99_ms": round(pct(99), 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
@@ -0,0 +1,60 @@
+"""Compare two ``benchmarks.load`` result files endpoint by endpoint.
+
+    python -m benchmarks.compare OLD.json NEW.json [--threshold 10]
+
+Exits non-zero if any endpoint's throughput dropped, or its p99 rose, by more
+than ``--threshold`` percent.
+"""
+import argparse
+import json
+import sys
+
+
+def _delta(old, new):
+    if not old:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(old, new, threshold):
+    rows, regressions = [], []
+    for name in sorted(set(old["endpoints"]) | set(new["endpoints"])):
+        before, after = old["endpoints"].get(name), new["endpoints"].get(name)
+        if not before or not after:
+            rows.append(f"{name:<24} only in {'new' if after else 'old'}")
+            continue
+        rps = _delta(before["throughput_rps"], after["throughput_rps"])
+        p50 = _delta(before.get("p50_ms"), after.get("p50_ms", 0))
+        p99 = _delta(before.get("p99_ms"), after.get("p99_ms", 0))
+        rows.append(
+            f"{name:<24} rps {before['throughput_rps']:>9.1f} -> {after['throughput_rps']:>9.1f} ({rps:+6.1f}%)"
+            f"  p50 {after.get('p50_ms', 0):>8.2f}ms ({p50:+6.1f}%)"
+            f"  p99 {after.get('p99_ms', 0):>8.2f}ms ({p99:+6.1f}%)"
+        )
+        if rps is not None and rps < -threshold or p99 is not None and p99 > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args()
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    for key in ("git_commit", "timestamp"):
+        print(f"{key}: {old['meta'].get(key)} -> {new['meta'].get(key)}")
+    rows, regressions = compare(old, new, args.threshold)
+    print("\n".join(rows))
+    if regressions:
+        print(f"regressions over {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Bytes sent and latency for unchanged GET /todos/ polls, with and without ETags.
+
+    python -m benchmarks.conditional_get [--todos 500] [--requests 300]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import client, load_app, signup_and_login, summarize
+
+
+async def _poll(http, token, requests, etag=None):
+    samples, sent = [], 0
+    headers = {"If-None-Match": etag} if etag else {}
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await http.get("/todos/", cookies={"session_token": token}, headers=headers)
+        samples.append(time.perf_counter() - start)
+        sent += len(response.content)
+    return {"bytes_per_poll": sent / requests, "status": response.status_code, **summarize(samples)}
+
+
+async def run(args):
+    app = load_app()
+    async with client(app) as http:
+        token = await signup_and_login(http, "poller")
+        for i in range(args.todos):
+            await http.post("/todos/", json={"title": f"todo {i}", "description": "x" * 40},
+                            cookies={"session_token": token})
+        first = await http.get("/todos/", cookies={"session_token": token})
+        return {
+            "unconditional": await _poll(http, token, args.requests),
+            "if_none_match": await _poll(http, token, args.requests, first.headers["etag"]),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--todos", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Server memory and throughput of /todos/import and /todos/export for one big user.
+
+    python -m benchmarks.export_import [--rows 1000000] [--backend sqlite|memory]
+                                       [--max-anon-mb N] [--output FILE]
+
+Runs ``uvicorn main:app`` on a throwaway database, imports ``--rows`` todos
+for one user from a generated NDJSON file, then exports them as NDJSON and
+as CSV, reading the downloads in small chunks. For each phase it reports the
+time, rows/s and the server's peak RSS (VmHWM, reset between phases through
+/proc/<pid>/clear_refs) next to the RSS right after startup. Peak RSS
+includes the SQLite mmap (SQLITE_MMAP_SIZE) as the file is read, so the peak
+anonymous RSS, sampled every 20 ms, is reported as well; that is the memory
+that would grow with the row count. With ``--max-anon-mb`` the exit status is
+non-zero when any phase's anonymous peak is above it. Linux only for the
+memory figures.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import signup_and_login
+from benchmarks.load import BACKEND_DIR, RESULTS_DIR, _free_port, _git_commit, _wait_ready
+
+
+def _rss_mb(pid: int, field: str):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak(pid: int) -> None:
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def _write_upload(path: str, rows: int) -> None:
+    with open(path, "w") as out:
+        for i in range(rows):
+            out.write(json.dumps({
+                "title": f"imported todo {i}", "description": f"row {i} of the export benchmark",
+                "completed": i % 3 == 0,
+            }) + "\n")
+
+
+async def _phase(pid: int, rows: int, call) -> dict:
+    _reset_peak(pid)
+    anon = []
+
+    async def sample():
+        while True:
+            anon.append(_rss_mb(pid, "RssAnon"))
+            await asyncio.sleep(0.02)
+
+    sampler = asyncio.create_task(sample())
+    start = time.perf_counter()
+    try:
+        detail = await call()
+    finally:
+        sampler.cancel()
+    elapsed = time.perf_counter() - start
+    anon = [mb for mb in anon if mb is not None]
+    return {
+        "seconds": round(elapsed, 2), "rows_per_s": round(rows / elapsed), "peak_rss_mb": _rss_mb(pid, "VmHWM"),
+        "peak_anon_mb": max(anon) if anon else None, **detail,
+    }
+
+
+async def run(args) -> dict:
+    db_dir = tempfile.mkdtemp(prefix="taskmaster-export-")
+    upload = os.path.join(db_dir, "upload.ndjson")
+    _write_upload(upload, args.rows)
+
+    port = _free_port()
+    env = {**os.environ, "STORAGE_BACKEND": args.backend, "SQLITE_PATH": os.path.join(db_dir, "todos.db"),
+           "LOG_LEVEL": "WARNING"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await _wait_ready(base_url)
+        async with httpx.AsyncClient(base_url=base_url, timeout=None) as http:
+            await signup_and_login(http, "exporter")
+            startup = {"startup_rss_mb": _rss_mb(server.pid, "VmRSS"),
+                       "startup_anon_mb": _rss_mb(server.pid, "RssAnon")}
+
+            async def do_import():
+                with open(upload, "rb") as body:
+                    response = await http.post("/todos/import", files={"file": ("todos.ndjson", body)})
+                response.raise_for_status()
+                lines = response.text.splitlines()
+                final = json.loads(lines[-1])
+                return {"status": final["status"], "imported": final["imported"], "progress_lines": len(lines)}
+
+            async def do_export(fmt):
+                exported = size = 0
+                async with http.stream("GET", "/todos/export", params={"format": fmt}) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(65536):
+                        size += len(chunk)
+                        exported += chunk.count(b"\n")
+                return {"exported": exported - (fmt == "csv"), "mb": round(size / 2 ** 20, 1)}
+
+            result = dict(startup)
+            result["import"] = await _phase(server.pid, args.rows, do_import)
+            result["export_ndjson"] = await _phase(server.pid, args.rows, lambda: do_export("ndjson"))
+            result["export_csv"] = await _phase(server.pid, args.rows, lambda: do_export("csv"))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "args": vars(args),
+        },
+        **result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--backend", choices=("sqlite", "memory"), default="sqlite")
+    parser.add_argument("--max-anon-mb", type=float, help="fail if any phase's peak anonymous RSS is above this")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<time>-export-import.json)")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-export-import.json")
+    with open(output, "w") as out:
+        json.dump(result, out, indent=2)
+    print(json.dumps(result, indent=2))
+
+    peaks = [result[phase]["peak_anon_mb"] for phase in ("import", "export_ndjson", "export_csv")]
+    peaks = [peak for peak in peaks if peak is not None]
+    if args.max_anon_mb is not None and peaks and max(peaks) > args.max_anon_mb:
+        print(f"over budget: peak anonymous RSS {max(peaks)}MB > {args.max_anon_mb}MB")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
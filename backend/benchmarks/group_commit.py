@@ -0,0 +1,96 @@
+"""Concurrent write throughput and read latency: rollback journal vs. WAL vs. WAL + group commit.
+
+    python -m benchmarks.group_commit [--writers 32] [--readers 4] [--seconds 10]
+
+Each configuration runs in its own process (settings are read at import)
+against a freshly seeded database. Writers create and toggle todos; readers
+list todos at the same time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIGS = {
+    "rollback_journal": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_GROUP_COMMIT": "0"},
+    "wal": {"SQLITE_JOURNAL_MODE": "WAL", "SQLITE_SYNCHRONOUS": "NORMAL", "SQLITE_GROUP_COMMIT": "0"},
+    "wal_group_commit": {"SQLITE_JOURNAL_MODE": "WAL", "SQLITE_GROUP_COMMIT": "1", "SQLITE_WRITER_SYNCHRONOUS": "FULL"},
+}
+
+
+async def _writer(http, user, rng, deadline, samples):
+    cookies = {"session_token": user["session_token"]}
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if user["todo_ids"] and rng.random() < 0.5:
+            todo_id = rng.choice(user["todo_ids"])
+            response = await http.patch(f"/todos/{todo_id}", json={"completed": rng.random() < 0.5}, cookies=cookies)
+        else:
+            response = await http.post("/todos/", json={"title": "write bench"}, cookies=cookies)
+            user["todo_ids"].append(response.json()["id"])
+        response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+
+
+async def _reader(http, user, deadline, samples):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await http.get("/todos/", params={"limit": 50}, cookies={"session_token": user["session_token"]})
+        response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+
+
+async def _child(args):
+    from benchmarks.common import client, load_app, summarize
+    from benchmarks.seed import seed
+
+    db_dir = tempfile.mkdtemp(prefix="taskmaster-gc-")
+    users = seed(os.path.join(db_dir, "todos.db"), args.writers + args.readers, 50)
+    app = load_app(db_dir)
+    writes, reads = [], []
+    async with client(app) as http:
+        deadline = time.perf_counter() + args.seconds
+        await asyncio.gather(
+            *(_writer(http, users[i], random.Random(i), deadline, writes) for i in range(args.writers)),
+            *(_reader(http, users[args.writers + i], deadline, reads) for i in range(args.readers)),
+        )
+    return {
+        "writes_per_second": round(len(writes) / args.seconds, 1),
+        "write_latency": summarize(writes),
+        "read_latency": summarize(reads),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--config", choices=sorted(CONFIGS), help="run only this configuration")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(_child(args))))
+        return
+
+    results = {}
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for name in [args.config] if args.config else CONFIGS:
+        env = {**os.environ, **CONFIGS[name], "LOG_LEVEL": "WARNING"}
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.group_commit", "--child", "--writers", str(args.writers),
+             "--readers", str(args.readers), "--seconds", str(args.seconds)],
+            cwd=backend_dir, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        results[name] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Throughput and per-endpoint latency for read-heavy, write-heavy and login-storm mixes.
+
+    python -m benchmarks.load [--mix read|write|login] [--target asgi|uvicorn]
+                              [--workers 4] [--concurrency 32] [--seconds 20]
+                              [--users 200] [--mean-todos 50] [--output FILE]
+
+A fresh database is seeded (see ``benchmarks.seed``) and then hit by
+``--concurrency`` client tasks for ``--seconds`` after a short warmup. With
+``--target asgi`` the real ``main:app`` runs in this process; with
+``--target uvicorn`` it is served by ``uvicorn --workers N`` on localhost, so
+multi-process behaviour (SQLite locking across workers) is included.
+
+Results are written as JSON to ``benchmarks/results/`` (or ``--output``);
+compare two runs with ``python -m benchmarks.compare OLD NEW``.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.common import client, load_app, summarize
+from benchmarks.seed import PASSWORD, seed
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+
+# Operations. Each takes the client, a seeded user and the worker's RNG and
+# returns the response; the endpoint label is the operation name.
+
+async def list_todos(http, user, rng):
+    return await http.get("/todos/", params={"limit": 50}, cookies={"session_token": user["session_token"]})
+
+
+async def list_todos_conditional(http, user, rng):
+    headers = {"If-None-Match": user["etag"]} if user.get("etag") else {}
+    response = await http.get("/todos/", params={"limit": 50}, headers=headers,
+                              cookies={"session_token": user["session_token"]})
+    user["etag"] = response.headers.get("etag", user.get("etag"))
+    return response
+
+
+async def get_todo(http, user, rng):
+    todo_id = rng.choice(user["todo_ids"]) if user["todo_ids"] else 0
+    return await http.get(f"/todos/{todo_id}", cookies={"session_token": user["session_token"]})
+
+
+async def search(http, user, rng):
+    return await http.get("/todos/search", params={"q": rng.choice(("report", "buy", "fix", "plan"))},
+                          cookies={"session_token": user["session_token"]})
+
+
+async def changes(http, user, rng):
+    response = await http.get("/todos/changes", params={"since": user.get("version", 0)},
+                              cookies={"session_token": user["session_token"]})
+    if response.status_code == 200:
+        user["version"] = response.json()["version"]
+    return response
+
+
+async def create_todo(http, user, rng):
+    response = await http.post("/todos/", json={"title": f"load {rng.random():.6f}", "description": "x" * 40},
+                               cookies={"session_token": user["session_token"]})
+    if response.status_code == 200:
+        user["todo_ids"].append(response.json()["id"])
+    return response
+
+
+async def toggle_todo(http, user, rng):
+    todo_id = rng.choice(user["todo_ids"]) if user["todo_ids"] else 0
+    return await http.patch(f"/todos/{todo_id}", json={"completed": rng.random() < 0.5},
+                            cookies={"session_token": user["session_token"]})
+
+
+async def delete_todo(http, user, rng):
+    if not user["todo_ids"]:
+        return await create_todo(http, user, rng)
+    todo_id = user["todo_ids"].pop(rng.randrange(len(user["todo_ids"])))
+    return await http.delete(f"/todos/{todo_id}", cookies={"session_token": user["session_token"]})
+
+
+async def login(http, user, rng):
+    return await http.post("/auth/login", json={"username": user["username"], "password": PASSWORD})
+
+
+MIXES = {
+    "read": [
+        (55, list_todos), (15, list_todos_conditional), (20, get_todo), (5, search), (5, changes),
+    ],
+    "write": [
+        (40, create_todo), (35, toggle_todo), (10, delete_todo), (15, list_todos),
+    ],
+    # Logins with ordinary traffic alongside, to show what bcrypt does to it
+    "login": [
+        (30, login), (60, list_todos), (10, get_todo),
+    ],
+}
+
+
+async def _worker(http, users, mix, rng, deadline, samples, statuses, errors):
+    weights = [weight for weight, _ in mix]
+    operations = [operation for _, operation in mix]
+    while time.perf_counter() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        user = rng.choice(users)
+        start = time.perf_counter()
+        try:
+            response = await operation(http, user, rng)
+        except httpx.HTTPError as e:
+            errors[operation.__name__][type(e).__name__] += 1
+            continue
+        samples[operation.__name__].append(time.perf_counter() - start)
+        statuses[operation.__name__][response.status_code] += 1
+
+
+async def _drive(http, users, args, seconds, rng_seed):
+    samples: Dict[str, List[float]] = collections.defaultdict(list)
+    statuses = collections.defaultdict(collections.Counter)
+    errors = collections.defaultdict(collections.Counter)
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _worker(http, users, MIXES[args.mix], random.Random(rng_seed * 1000 + i), deadline, samples, statuses, errors)
+        for i in range(args.concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    endpoints = {
+        name: {
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "statuses": {str(code): count for code, count in sorted(statuses[name].items())},
+            "errors": dict(errors[name]),
+            **summarize(values),
+        }
+        for name, values in sorted(samples.items())
+    }
+    total = sum(len(values) for values in samples.values())
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "endpoints": endpoints,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_ready(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        while True:
+            try:
+                if (await http.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"uvicorn did not become ready within {timeout}s")
+            await asyncio.sleep(0.2)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args):
+    db_dir = tempfile.mkdtemp(prefix="taskmaster-load-")
+    db_path = os.path.join(db_dir, "todos.db")
+    users = seed(db_path, args.users, args.mean_todos, args.seed)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    server = None
+    if args.target == "asgi":
+        http = client(load_app(db_dir))
+    else:
+        port = _free_port()
+        env = {**os.environ, "SQLITE_PATH": db_path}
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+            cwd=BACKEND_DIR, env=env,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        await _wait_ready(base_url)
+        http = httpx.AsyncClient(base_url=base_url, timeout=60,
+                                 limits=httpx.Limits(max_connections=args.concurrency))
+    try:
+        async with http:
+            if args.warmup:
+                await _drive(http, users, args, args.warmup, args.seed + 1)
+            result = await _drive(http, users, args, args.seconds, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+            "seeded_todos": sum(len(user["todo_ids"]) for user in users),
+        },
+        **result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", choices=sorted(MIXES), default="read")
+    parser.add_argument("--target", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--mean-todos", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<time>-<mix>-<target>.json)")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{args.mix}-{args.target}.json")
+    with open(output, "w") as out:
+        json.dump(result, out, indent=2)
+    print(json.dumps({name: {key: stats.get(key) for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")}
+                      for name, stats in result["endpoints"].items()}, indent=2))
+    print(f"total {result['throughput_rps']} req/s, results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
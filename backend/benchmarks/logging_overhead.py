@@ -0,0 +1,74 @@
+"""Caller-side cost of a log line: print vs. synchronous handler vs. queue handler.
+
+    python -m benchmarks.logging_overhead [--records 20000] [--sink-latency-us 50]
+
+``--sink-latency-us`` makes every write to the output stream sleep, to mimic
+a slow or back-pressured stdout (a container log driver, a full pipe). The
+queue handler should keep the per-call cost flat regardless.
+"""
+import argparse
+import io
+import json
+import logging
+import time
+
+import logging_config
+from benchmarks.common import summarize
+
+
+class SlowStream(io.StringIO):
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+
+    def write(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().write(text)
+
+
+def _time_calls(emit, records):
+    samples = []
+    for i in range(records):
+        start = time.perf_counter()
+        emit(i)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def run(args):
+    latency = args.sink_latency_us / 1e6
+    logger = logging.getLogger("bench")
+    results = {}
+
+    stream = SlowStream(latency)
+    results["print"] = _time_calls(
+        lambda i: print(f"Session token created for user {i}", file=stream, flush=True), args.records
+    )
+
+    for name, use_queue in (("sync_handler", False), ("queue_handler", True)):
+        logging_config.configure_logging("INFO", "json", use_queue, SlowStream(latency))
+        results[name] = _time_calls(
+            lambda i: logger.info("Session created", extra={"user_id": i, "event": "auth.session"}),
+            args.records,
+        )
+
+    # Below the configured level: the cost of leaving debug calls in hot paths
+    results["debug_disabled"] = _time_calls(
+        lambda i: logger.debug("Session verified", extra={"user_id": i, "event": "auth.session"}),
+        args.records,
+    )
+    logging_config.configure_logging("INFO", "json", False, SlowStream(latency))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--sink-latency-us", type=float, default=50)
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""GET /todos/ latency while logins run at the same time.
+
+    python -m benchmarks.login_contention [--readers 8] [--login-rate 50] [--seconds 5]
+
+Logins arrive at a fixed ``--login-rate`` per second whether or not earlier
+ones have finished, like a burst from many clients. Phases: ``idle``;
+``login_storm`` with neither rate limits nor bcrypt admission control;
+``login_storm_admission`` with admission control shedding excess hashes
+(429); ``login_storm_rate_limited`` with the default login rate limits as
+well. Each reports read latency, login latency and status codes, and how
+many logins were still unanswered at the end of the phase.
+
+Pass ``--inline-bcrypt`` to run bcrypt directly on the event loop, which is
+how login used to behave, to see the difference in read tail latency.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import time
+
+import bcrypt
+
+from benchmarks.common import client, load_app, signup_and_login, summarize
+
+
+async def _reader(http, token, deadline, samples):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await http.get("/todos/", cookies={"session_token": token})
+        response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+
+
+async def _login(http, samples, statuses):
+    start = time.perf_counter()
+    response = await http.post("/auth/login", json={"username": "storm", "password": "bench-password"})
+    if response.status_code != 429:
+        response.raise_for_status()
+    statuses[response.status_code] += 1
+    samples.append(time.perf_counter() - start)
+
+
+async def _login_storm(http, rate, deadline, samples, statuses):
+    """Start a login every 1/rate seconds; return how many never finished."""
+    tasks = []
+    next_start = time.perf_counter()
+    while rate and next_start < deadline:
+        tasks.append(asyncio.create_task(_login(http, samples, statuses)))
+        next_start += 1 / rate
+        await asyncio.sleep(max(0.0, next_start - time.perf_counter()))
+    pending = [task for task in tasks if not task.done()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return len(pending)
+
+
+async def run(args):
+    app = load_app()
+    import main
+    import passwords
+    limits, max_in_flight = main.auth_limiter.limits, passwords.PASSWORD_HASH_MAX_IN_FLIGHT
+    main.auth_limiter.limits = {scope: (0, 0) for scope in limits}
+    if args.inline_bcrypt:
+
+        async def inline_check(password, password_hash):
+            return bcrypt.checkpw(password.encode("utf-8"), password_hash)
+
+        main.check_password = inline_check
+
+    async with client(app) as http:
+        token = await signup_and_login(http, "reader")
+        for i in range(args.todos):
+            await http.post("/todos/", json={"title": f"todo {i}"}, cookies={"session_token": token})
+        await signup_and_login(http, "storm")
+
+        results = {}
+        phases = (
+            ("idle", 0, False, False),
+            ("login_storm", args.login_rate, False, False),
+            ("login_storm_admission", args.login_rate, True, False),
+            ("login_storm_rate_limited", args.login_rate, True, True),
+        )
+        for phase, rate, admission, rate_limited in phases:
+            passwords.PASSWORD_HASH_MAX_IN_FLIGHT = max_in_flight if admission else 0
+            if rate_limited:
+                main.auth_limiter.limits = limits
+            reads, login_samples, statuses = [], [], collections.Counter()
+            deadline = time.perf_counter() + args.seconds
+            *_, unanswered = await asyncio.gather(
+                *(_reader(http, token, deadline, reads) for _ in range(args.readers)),
+                _login_storm(http, rate, deadline, login_samples, statuses),
+            )
+            results[phase] = {
+                "get_todos": summarize(reads), "login": summarize(login_samples),
+                "login_status": dict(statuses), "login_unanswered": unanswered,
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--login-rate", type=float, default=50, help="login attempts per second")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--todos", type=int, default=50)
+    parser.add_argument("--inline-bcrypt", action="store_true")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Coalesced and cached GET /todos/ reads: throughput, and a stale-read check.
+
+    python -m benchmarks.read_coalescing [--todos 500] [--readers 50] [--seconds 5] [--writes 200]
+
+``burst``: ``--readers`` tabs of one user poll the same list for
+``--seconds`` with coalescing off, on, and on with a 250 ms micro-cache,
+reporting reads per second, latency and how each read was served.
+
+``stale_reads``: with coalescing and a long (5 s) cache, the readers keep
+polling while a writer creates, toggles, renames and deletes todos, a
+quarter of them straight through the repository as another worker would
+(so nothing in this process invalidates). The writer reads back after
+every write and must see it; every other read that started after a write
+completed must show that write or a later one. Exits 1 if any read is
+stale.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from benchmarks.common import client, load_app, signup_and_login, summarize
+
+CONFIGS = {
+    "off": {"coalescing": False, "ttl": 0},
+    "coalescing": {"coalescing": True, "ttl": 0},
+    "coalescing_cache_250ms": {"coalescing": True, "ttl": 0.25},
+}
+
+
+def _snapshot(todos):
+    return frozenset((todo["id"], todo["title"], todo["completed"]) for todo in todos)
+
+
+def _served(metrics, before):
+    after = dict(metrics.TODO_READS._values)
+    return {key[0]: after.get(key, 0) - before.get(key, 0) for key in after if after.get(key, 0) != before.get(key, 0)}
+
+
+async def _burst(http, cookies, readers, seconds):
+    samples = []
+    deadline = time.perf_counter() + seconds
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await http.get("/todos/", cookies=cookies)
+            response.raise_for_status()
+            samples.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(reader() for _ in range(readers)))
+    return {"reads_per_second": round(len(samples) / seconds, 1), **summarize(samples)}
+
+
+async def _stale_reads(main, http, cookies, user_id, args):
+    rng = random.Random(7)
+    # states[k] is the list after the k-th write; done[k] when that write returned
+    listed = (await http.get("/todos/", cookies=cookies)).json()
+    states, done = [_snapshot(listed)], [time.perf_counter()]
+    reads, stop = [], asyncio.Event()
+
+    async def reader():
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = await http.get("/todos/", cookies=cookies)
+            reads.append((start, _snapshot(response.json())))
+
+    async def write():
+        ids = sorted(todo_id for todo_id, _, _ in states[-1])
+        kind = rng.choice(["create", "toggle", "rename", "delete"] if ids else ["create"])
+        todo_id = rng.choice(ids) if ids else None
+        elsewhere = rng.random() < 0.25
+        if kind == "create":
+            if elsewhere:
+                await main.repo.create_todo(user_id, f"new {len(states)}")
+            else:
+                await http.post("/todos/", json={"title": f"new {len(states)}"}, cookies=cookies)
+        elif kind == "toggle":
+            completed = not next(c for i, _, c in states[-1] if i == todo_id)
+            if elsewhere:
+                await main.repo.update_todo_status(user_id, todo_id, completed)
+            else:
+                await http.patch(f"/todos/{todo_id}", json={"completed": completed}, cookies=cookies)
+        elif kind == "rename":
+            if elsewhere:
+                await main.repo.update_todo(user_id, todo_id, f"renamed {len(states)}")
+            else:
+                await http.put(f"/todos/{todo_id}", json={"title": f"renamed {len(states)}"}, cookies=cookies)
+        elif elsewhere:
+            await main.repo.delete_todo(user_id, todo_id)
+        else:
+            await http.delete(f"/todos/{todo_id}", cookies=cookies)
+        done.append(time.perf_counter())
+        # Read your own write: the list must be exactly the new state
+        own = _snapshot((await http.get("/todos/", cookies=cookies)).json())
+        expected = _snapshot(await main.repo.get_user_todos(user_id))
+        states.append(expected)
+        return own == expected
+
+    tasks = [asyncio.create_task(reader()) for _ in range(args.readers)]
+    own_stale = 0
+    for _ in range(args.writes):
+        own_stale += not await write()
+        await asyncio.sleep(0)
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    stale = 0
+    for start, snapshot in reads:
+        newest_done = max(k for k, t in enumerate(done) if t <= start)
+        seen = max((k for k, state in enumerate(states) if state == snapshot), default=-1)
+        stale += seen < newest_done
+    return {"writes": args.writes, "reads": len(reads), "own_reads_stale": own_stale, "stale_reads": stale}
+
+
+async def run(args):
+    app = load_app()
+    import main
+    import metrics
+    from read_cache import TodoReads
+
+    async with client(app) as http:
+        token = await signup_and_login(http, "tabs")
+        cookies = {"session_token": token}
+        for i in range(args.todos):
+            await http.post("/todos/", json={"title": f"todo {i}", "description": "x" * 40}, cookies=cookies)
+        user_id = (await main.repo.get_user_credentials("tabs"))["id"]
+
+        burst = {}
+        for name, config in CONFIGS.items():
+            main.todo_reads = TodoReads(**config)
+            before = dict(metrics.TODO_READS._values)
+            burst[name] = {**await _burst(http, cookies, args.readers, args.seconds),
+                           "served": _served(metrics, before)}
+        baseline = burst["off"]["reads_per_second"]
+        for result in burst.values():
+            result["vs_off"] = round(result["reads_per_second"] / baseline, 2) if baseline else None
+
+        main.todo_reads = TodoReads(coalescing=True, ttl=5.0)
+        before = dict(metrics.TODO_READS._values)
+        stale = await _stale_reads(main, http, cookies, user_id, args)
+        stale["served"] = _served(metrics, before)
+    return {"readers": args.readers, "todos": args.todos, "burst": burst, "stale_reads": stale}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--todos", type=int, default=500)
+    parser.add_argument("--readers", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writes", type=int, default=200)
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    stale = result["stale_reads"]
+    if stale["own_reads_stale"] or stale["stale_reads"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
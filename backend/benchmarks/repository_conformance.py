@@ -0,0 +1,367 @@
+"""Conformance checks and timings for every storage backend (see repository.py).
+
+    python -m benchmarks.repository_conformance [--backend sqlite|sharded|memory|mongo] [--todos 2000]
+
+Each backend runs the same behavioural checks (users, sessions, revocations,
+ownership, listing order and cursors, change versions, batches, search,
+export, import and archiving) and then the same timed workload. SQLite (and sharded,
+with its shards next to it) runs against a throwaway file, in a process of
+its own when database.py is already bound to another one, and mongo against MONGODB_DATABASE=taskmaster_conformance,
+which is dropped afterwards; mongo is skipped when MONGODB_URL is
+unreachable. Exits non-zero if any check fails.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import summarize
+from repository import TodoConflict, decode_cursor, encode_cursor
+
+
+class Checker:
+    def __init__(self):
+        self.failures = []
+        self.passed = 0
+
+    def check(self, name: str, condition: bool, detail=None) -> None:
+        if condition:
+            self.passed += 1
+        else:
+            self.failures.append(f"{name}: {detail!r}" if detail is not None else name)
+
+
+def _ids(todos):
+    return [todo['id'] for todo in todos]
+
+
+async def conformance(repo, c: Checker) -> None:
+    alice = await repo.create_user("alice", "alice@example.com", b"hash-a")
+    bob = await repo.create_user("bob", "bob@example.com", b"hash-b")
+    c.check("create_user", alice and alice['username'] == "alice" and set(alice) == {'id', 'username', 'email'}, alice)
+    c.check("duplicate username", await repo.create_user("alice", "other@example.com", b"x") is None)
+    c.check("duplicate email", await repo.create_user("carol", "alice@example.com", b"x") is None)
+    credentials = await repo.get_user_credentials("alice")
+    c.check("credentials", credentials and credentials['password_hash'] == b"hash-a", credentials)
+    c.check("unknown user", await repo.get_user_credentials("nobody") is None)
+    c.check("update_password_hash", await repo.update_password_hash(bob['id'], b"hash-b2")
+            and (await repo.get_user_credentials("bob"))['password_hash'] == b"hash-b2")
+    c.check("update_password_hash unknown user", await repo.update_password_hash(10 ** 6, b"x") is False)
+
+    token = await repo.create_session(alice['id'])
+    user = await repo.verify_session(token)
+    c.check("verify_session", user and user['id'] == alice['id'] and 'password_hash' not in user, user)
+    c.check("unknown session", await repo.verify_session("not-a-token") is None)
+    c.check("delete_session", await repo.delete_session(token) and await repo.verify_session(token) is None)
+    c.check("sweep with nothing expired", await repo.delete_expired_sessions(10) == 0)
+
+    expires = datetime.utcnow() + timedelta(hours=1)
+    await repo.revoke_token("jti-1", expires)
+    await repo.revoke_token("jti-1", expires)
+    await repo.revoke_token("jti-2", expires)
+    revoked = await repo.get_revoked_tokens(0)
+    c.check("revocations", [r['jti'] for r in revoked] == ["jti-1", "jti-2"], revoked)
+    c.check("revocations after id", [r['jti'] for r in await repo.get_revoked_tokens(revoked[0]['id'])] == ["jti-2"])
+
+    a, b = alice['id'], bob['id']
+    c.check("initial version", await repo.get_todo_version(a) == 0)
+    first = await repo.create_todo(a, "Buy groceries", "milk and café au lait")
+    c.check("create_todo", first['title'] == "Buy groceries" and not first['completed']
+            and first['created_by'] == "alice", first)
+    others = await repo.create_todo(b, "Bob's milk")
+    c.check("get_user_todo", (await repo.get_user_todo(a, first['id']))['id'] == first['id'])
+    c.check("other user's todo hidden", await repo.get_user_todo(a, others['id']) is None)
+    c.check("other user's todo not updated", await repo.update_todo(a, others['id'], "x") is None)
+    c.check("other user's todo not toggled", await repo.update_todo_status(a, others['id'], True) is None)
+    c.check("other user's todo not deleted", await repo.delete_todo(a, others['id']) is False)
+    c.check("version after create", await repo.get_todo_version(a) == 1)
+
+    created = [await repo.create_todo(a, f"todo {i}") for i in range(9)]
+    await repo.update_todo_status(a, created[2]['id'], True)
+    await repo.update_todo_status(a, created[5]['id'], True)
+    updated = await repo.update_todo(a, created[0]['id'], "renamed", "now with text")
+    c.check("update_todo", updated['title'] == "renamed" and updated['description'] == "now with text", updated)
+
+    everything = await repo.get_user_todos(a)
+    completed_flags = [bool(t['completed']) for t in everything]
+    c.check("active first", completed_flags == sorted(completed_flags), completed_flags)
+    c.check("most recently modified first", everything[0]['id'] == created[0]['id'], _ids(everything))
+    pages, cursor = [], None
+    while True:
+        page = await repo.get_user_todos(a, limit=3, cursor=cursor)
+        pages.extend(page)
+        if len(page) < 3:
+            break
+        cursor = decode_cursor(encode_cursor(page[-1]))
+    c.check("cursor pages cover the list in order", _ids(pages) == _ids(everything), (_ids(pages), _ids(everything)))
+    done = await repo.get_user_todos(a, completed=True)
+    c.check("completed filter", sorted(_ids(done)) == sorted([created[2]['id'], created[5]['id']]), _ids(done))
+    c.check("count_todos_to_update", await repo.count_todos_to_update(a, True) == 8)
+
+    version = await repo.get_todo_version(a)
+    c.check("version counts every write", version == 13, version)
+    changed = await repo.update_all_todos_status(a, True, limit=3)
+    c.check("bulk update limit", len(changed) == 3, changed)
+    rest = await repo.update_all_todos_status(a, True)
+    c.check("bulk update rest", len(rest) == 5 and not set(rest) & set(changed), rest)
+    c.check("bulk update is idempotent", await repo.update_all_todos_status(a, True) == [])
+
+    c.check("delete_todo", await repo.delete_todo(a, created[8]['id']) is True)
+    c.check("delete twice", await repo.delete_todo(a, created[8]['id']) is False)
+    changes = await repo.get_todo_changes(a, version)
+    c.check("changes since version", len(changes['todos']) == 7 and changes['deleted'] == [created[8]['id']]
+            and changes['version'] == version + 9 and not changes['reset'], changes)
+    partial = await repo.get_todo_changes(a, version, limit=4)
+    c.check("changes has_more", partial['has_more'] and len(partial['todos']) + len(partial['deleted']) == 4
+            and partial['version'] == partial['todos'][-1]['version'], partial)
+    c.check("changes in version order", [t['version'] for t in partial['todos']]
+            == sorted(t['version'] for t in partial['todos']))
+    reset = await repo.get_todo_changes(a, 10 ** 6, limit=4)
+    c.check("changes from the future reset", reset['reset'] and len(reset['todos']) == 4 and reset['has_more']
+            and reset['version'] == version + 9, reset)
+    page, listed, resets = reset, _ids(reset['todos']), 0
+    while page['has_more']:
+        page = await repo.get_todo_changes(a, page['version'], limit=4, cursor=page['cursor'])
+        listed += _ids(page['todos'])
+        resets += page['reset']
+    c.check("reset pages cover the list", not resets and page['version'] == version + 9
+            and listed == sorted(_ids(await repo.get_user_todos(a))), (listed, page))
+    versions = await repo.get_todo_versions([a, b, 10 ** 6])
+    c.check("get_todo_versions", versions == {a: version + 9, b: 1}, versions)
+
+    atomic = await repo.apply_todo_batch(a, [
+        {'op': 'create', 'title': 'batched'},
+        {'op': 'delete', 'id': created[1]['id']},
+        {'op': 'patch', 'id': created[1]['id'], 'completed': False},
+    ])
+    c.check("atomic batch fails whole", not atomic['committed']
+            and [r['status'] for r in atomic['results']] == ['ok', 'ok', 'not_found'], atomic)
+    c.check("rolled-back creates have no id", atomic['results'][0]['id'] is None, atomic['results'][0])
+    c.check("atomic batch applied nothing", await repo.get_user_todo(a, created[1]['id']) is not None
+            and await repo.get_todo_version(a) == version + 9)
+    best_effort = await repo.apply_todo_batch(a, [
+        {'op': 'create', 'title': 'batched', 'description': None},
+        {'op': 'update', 'id': others['id'], 'title': 'not mine', 'description': None},
+        {'op': 'patch', 'id': created[1]['id'], 'completed': False},
+        {'op': 'delete', 'id': created[3]['id']},
+    ], atomic=False)
+    statuses = [r['status'] for r in best_effort['results']]
+    c.check("best-effort batch", best_effort['committed'] and statuses == ['ok', 'not_found', 'ok', 'ok'], best_effort)
+    c.check("batch returns rows", best_effort['results'][0]['todo']['title'] == 'batched'
+            and best_effort['results'][2]['todo']['completed'] in (False, 0), best_effort['results'])
+    doomed = await repo.create_todo(a, "doomed")
+    gone = await repo.apply_todo_batch(a, [
+        {'op': 'update', 'id': doomed['id'], 'title': 'renamed', 'description': None},
+        {'op': 'delete', 'id': doomed['id']},
+    ])
+    c.check("batch update then delete", gone['committed'] and [r['status'] for r in gone['results']] == ['ok', 'ok']
+            and gone['results'][0]['todo'] is None and await repo.get_user_todo(a, doomed['id']) is None, gone)
+
+    since, target = await repo.get_todo_version(a), created[4]['id']
+    updated = await repo.update_todo(a, target, "first", unchanged_since=since)
+    c.check("conditional update", updated is not None and updated['title'] == "first", updated)
+    conflicts = 0
+    for stale in (repo.update_todo(a, target, "second", unchanged_since=since),
+                  repo.update_todo_status(a, target, False, unchanged_since=since),
+                  repo.delete_todo(a, target, unchanged_since=since)):
+        try:
+            await stale
+        except TodoConflict:
+            conflicts += 1
+    current = await repo.get_user_todo(a, target)
+    c.check("stale conditional writes conflict", conflicts == 3 and current['title'] == "first"
+            and current['completed'], (conflicts, current))
+    c.check("other todos' changes do not conflict",
+            await repo.update_todo_status(a, created[6]['id'], False, unchanged_since=since) is not None)
+    c.check("conditional delete of a missing todo", await repo.delete_todo(a, created[3]['id'], unchanged_since=since)
+            is False)
+
+    hits = await repo.search_todos(a, "gro mil")
+    c.check("search prefix terms", _ids(hits) == [first['id']], hits)
+    c.check("search highlights", hits and hits[0]['title_highlight'] == "Buy <mark>groceries</mark>", hits)
+    c.check("search folds accents", _ids(await repo.search_todos(a, "cafe")) == [first['id']])
+    c.check("search is per user", _ids(await repo.search_todos(b, "groceries")) == [])
+    c.check("search quotes operators", await repo.search_todos(a, '"AND OR') == [])
+    ranked = await repo.search_todos(a, "milk")
+    c.check("title matches rank first", _ids(ranked) == [first['id']], ranked)
+
+    exported, after_id = [], 0
+    while True:
+        batch = await repo.export_todos(a, after_id, 4)
+        exported.extend(batch)
+        if len(batch) < 4:
+            break
+        after_id = batch[-1]['id']
+    c.check("export covers every todo in id order", _ids(exported) == sorted(_ids(await repo.get_user_todos(a))),
+            _ids(exported))
+    c.check("export is per user", _ids(await repo.export_todos(b)) == [others['id']])
+    before = await repo.get_todo_version(a)
+    c.check("import_todos", await repo.import_todos(a, [
+        {'title': 'imported', 'description': None, 'completed': True},
+        {'title': 'imported 2', 'description': 'text', 'completed': False},
+    ]) == 2)
+    c.check("import bumps the version per row", await repo.get_todo_version(a) == before + 2)
+    imported = await repo.export_todos(a, exported[-1]['id'])
+    c.check("imported rows", [(t['title'], t['description'], bool(t['completed'])) for t in imported]
+            == [('imported', None, True), ('imported 2', 'text', False)], imported)
+
+    listed = _ids(await repo.get_user_todos(a))
+    active = _ids(await repo.get_user_todos(a, completed=False))
+    done = _ids(await repo.get_user_todos(a, completed=True))
+    c.check("completed todos to archive", len(done) >= 3, done)
+    c.check("nothing completed before the cutoff",
+            await repo.archive_todos(datetime.utcnow() - timedelta(days=1)) == {})
+    before = await repo.get_todo_version(a)
+    archived = {}
+    while True:
+        batch = await repo.archive_todos(datetime.utcnow() + timedelta(days=1), 2)
+        for user_id, count in batch.items():
+            archived[user_id] = archived.get(user_id, 0) + count
+        if sum(batch.values()) < 2:
+            break
+    c.check("archive_todos", archived == {a: len(done)}, archived)
+    c.check("archived todos leave the default list", _ids(await repo.get_user_todos(a)) == active)
+    c.check("archive bumps the version per todo", await repo.get_todo_version(a) == before + len(done))
+    changes = await repo.get_todo_changes(a, before)
+    c.check("changes report archived todos as deleted", sorted(changes['deleted']) == sorted(done)
+            and not changes['todos'], changes)
+    c.check("include_archived merges them in order", _ids(await repo.get_user_todos(a, include_archived=True))
+            == listed)
+    pages, cursor = [], None
+    while True:
+        page = await repo.get_user_todos(a, limit=3, cursor=cursor, include_archived=True)
+        pages.extend(page)
+        if len(page) < 3:
+            break
+        cursor = decode_cursor(encode_cursor(page[-1]))
+    c.check("include_archived pages", _ids(pages) == listed, _ids(pages))
+    c.check("get_user_todo finds archived", (await repo.get_user_todo(a, done[0]) or {}).get('id') == done[0])
+    c.check("archived todo hidden from others", await repo.get_user_todo(b, done[0]) is None
+            and await repo.update_todo(b, done[0], "x") is None)
+    c.check("export includes archived", _ids(await repo.export_todos(a)) == sorted(listed))
+    archived_version = await repo.get_todo_version(a)
+    restored = await repo.update_todo(a, done[0], "restored")
+    c.check("editing unarchives", restored and restored['title'] == "restored"
+            and done[0] in _ids(await repo.get_user_todos(a)), restored)
+    changes = await repo.get_todo_changes(a, before)
+    c.check("unarchived todo is changed, not deleted", done[0] in _ids(changes['todos'])
+            and done[0] not in changes['deleted'], changes)
+    c.check("version bumped by unarchive", await repo.get_todo_version(a) > archived_version)
+    c.check("delete archived", await repo.delete_todo(a, done[1]) is True
+            and await repo.get_user_todo(a, done[1]) is None
+            and done[1] not in _ids(await repo.get_user_todos(a, include_archived=True)))
+    try:
+        stale = await repo.update_todo(a, done[2], "stale", unchanged_since=before)
+    except TodoConflict:
+        stale = 'conflict'
+    c.check("stale write to an archived todo conflicts", stale == 'conflict'
+            and done[2] not in _ids(await repo.get_user_todos(a)), stale)
+    current = await repo.update_todo_status(a, done[2], True, unchanged_since=archived_version)
+    c.check("current write to an archived todo applies", current is not None
+            and done[2] in _ids(await repo.get_user_todos(a)), current)
+    await repo.archive_todos(datetime.utcnow() + timedelta(days=1))
+    batch = await repo.apply_todo_batch(a, [{'op': 'patch', 'id': done[2], 'completed': False}])
+    c.check("batch unarchives", batch['committed'] and batch['results'][0]['status'] == 'ok'
+            and done[2] in _ids(await repo.get_user_todos(a, completed=False)), batch)
+
+
+async def timings(repo, todos: int) -> dict:
+    user = await repo.create_user("bench", "bench@example.com", b"hash")
+    user_id = user['id']
+    results = {}
+
+    async def timed(name, calls):
+        samples = []
+        for call in calls:
+            start = time.perf_counter()
+            await call()
+            samples.append(time.perf_counter() - start)
+        results[name] = summarize(samples)
+
+    await timed("create_todo", (lambda i=i: repo.create_todo(user_id, f"bench todo {i}", "a description")
+                                for i in range(todos)))
+    ids = [t['id'] for t in await repo.get_user_todos(user_id)]
+    await timed("update_todo_status", (lambda i=i: repo.update_todo_status(user_id, ids[i], i % 2 == 0)
+                                       for i in range(min(todos, 1000))))
+    await timed("get_user_todo", (lambda i=i: repo.get_user_todo(user_id, ids[i]) for i in range(min(todos, 1000))))
+    await timed("get_user_todos_page", (lambda: repo.get_user_todos(user_id, limit=50) for _ in range(200)))
+    await timed("get_user_todos_all", (lambda: repo.get_user_todos(user_id) for _ in range(20)))
+    await timed("get_todo_version", (lambda: repo.get_todo_version(user_id) for _ in range(1000)))
+    await timed("get_todo_changes", (lambda: repo.get_todo_changes(user_id, todos, 500) for _ in range(100)))
+    await timed("search_todos", (lambda: repo.search_todos(user_id, "bench 12") for _ in range(100)))
+    await timed("export_todos_1000", (lambda: repo.export_todos(user_id, 0, 1000) for _ in range(20)))
+    rows = [{'title': f"imported {i}", 'description': None, 'completed': False} for i in range(1000)]
+    await timed("import_todos_1000", (lambda: repo.import_todos(user_id, rows) for _ in range(5)))
+    operations = [{'op': 'create', 'title': f"batched {i}"} for i in range(500)]
+    await timed("apply_todo_batch_500", (lambda: repo.apply_todo_batch(user_id, operations) for _ in range(5)))
+    token = await repo.create_session(user_id)
+    await timed("verify_session", (lambda: repo.verify_session(token) for _ in range(1000)))
+    return results
+
+
+async def _mongo_reachable() -> bool:
+    try:
+        import db_config
+        await asyncio.wait_for(db_config.get_client().admin.command("ping"), 3)
+        return True
+    except Exception as e:
+        print(f"mongo: skipped ({type(e).__name__}: {e})", file=sys.stderr)
+        return False
+
+
+async def run_backend(kind: str, todos: int):
+    if kind == "mongo":
+        os.environ.setdefault("MONGODB_DATABASE", "taskmaster_conformance")
+        if not await _mongo_reachable():
+            return None
+        import db_config
+        await db_config.get_client().drop_database(db_config.MONGODB_DATABASE)
+    if kind in ("sqlite", "sharded"):
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="taskmaster-conformance-"), "todos.db")
+
+    from repository import repository_from_env
+    repo = repository_from_env(kind)
+    await repo.start()
+    checker = Checker()
+    try:
+        await conformance(repo, checker)
+        timing = await timings(repo, todos)
+    finally:
+        if kind == "mongo":
+            import db_config
+            await db_config.get_client().drop_database(db_config.MONGODB_DATABASE)
+    return {"passed": checker.passed, "failures": checker.failures, "timings": timing}
+
+
+def main():
+    from repository import BACKENDS
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=BACKENDS, action="append", help="repeatable; default: all")
+    parser.add_argument("--todos", type=int, default=2000)
+    args = parser.parse_args()
+
+    report = {}
+    for kind in args.backend or BACKENDS:
+        if kind in ("sqlite", "sharded") and "database" in sys.modules:
+            # database.py picked its SQLITE_PATH when first imported
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.repository_conformance", "--backend", kind,
+                 "--todos", str(args.todos)],
+                stdout=subprocess.PIPE, check=False,
+            ).stdout
+            report.update(json.loads(output))
+            continue
+        result = asyncio.run(run_backend(kind, args.todos))
+        if result is not None:
+            report[kind] = result
+    print(json.dumps(report, indent=2))
+    if any(result["failures"] for result in report.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Full-text search latency over a large todos table.
+
+    python -m benchmarks.search [--rows 1000000] [--users 1000] [--queries 200]
+
+Rows are bulk-inserted straight into SQLite (the FTS triggers still index
+them), then random one- and two-word prefix searches are timed per user.
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.common import load_app, summarize
+
+WORDS = (
+    "buy milk call mom book flights renew passport pay rent fix bike water plants "
+    "email report review budget clean kitchen plan trip order groceries update resume "
+    "schedule dentist backup laptop write notes prepare slides return library books"
+).split()
+
+
+def seed(database, rows: int, users: int, batch: int = 20000):
+    rng = random.Random(42)
+    with database.get_connection() as conn:
+        conn.executemany(
+            'INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+            [(f"search{u}", f"search{u}@example.com", b"x") for u in range(users)]
+        )
+        first_user = conn.execute('SELECT MIN(id) FROM users WHERE username LIKE ?', ("search%",)).fetchone()[0]
+        for start in range(0, rows, batch):
+            conn.executemany(
+                'INSERT INTO todos (title, description, user_id) VALUES (?, ?, ?)',
+                [(
+                    " ".join(rng.sample(WORDS, 3)),
+                    " ".join(rng.choices(WORDS, k=12)),
+                    first_user + rng.randrange(users),
+                ) for _ in range(min(batch, rows - start))]
+            )
+            conn.commit()
+    return first_user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    load_app()
+    import database
+
+    start = time.perf_counter()
+    first_user = seed(database, args.rows, args.users)
+    seeded = time.perf_counter() - start
+
+    rng = random.Random(7)
+    samples, hits = [], 0
+    for _ in range(args.queries):
+        user_id = first_user + rng.randrange(args.users)
+        text = " ".join(word[:rng.randint(2, len(word))] for word in rng.sample(WORDS, rng.randint(1, 2)))
+        start = time.perf_counter()
+        hits += len(database.search_todos(user_id, text))
+        samples.append(time.perf_counter() - start)
+
+    print(json.dumps({
+        "rows": args.rows,
+        "users": args.users,
+        "seed_seconds": round(seeded, 1),
+        "avg_hits": round(hits / args.queries, 1),
+        "search": summarize(samples),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Seed a SQLite file with a realistic, reproducible dataset for load tests.
+
+    python -m benchmarks.seed PATH [--users 200] [--mean-todos 50] [--seed 1]
+
+Todo counts per user follow a heavy-tailed (Pareto) distribution, so most
+users have a handful of todos and a few have thousands, like a real install.
+Every user gets the same password (``PASSWORD``, hashed once at the normal
+bcrypt cost) and a ready-made session, so load runs can skip signup.
+"""
+import argparse
+import json
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import bcrypt
+
+from migrations import migrate
+
+PASSWORD = "bench-password"
+MAX_TODOS_PER_USER = 5000
+
+_WORDS = (
+    "buy milk call mom write report review pull request fix bug plan sprint book flight "
+    "pay rent clean kitchen water plants renew passport update resume schedule dentist "
+    "prepare slides send invoice read paper refactor parser deploy release backup photos"
+).split()
+
+
+def _text(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(low, high)))
+
+
+def seed(path: str, users: int = 200, mean_todos: int = 50, seed: int = 1) -> List[Dict]:
+    """Create ``users`` users with todos and sessions in ``path``.
+
+    Returns one dict per user: id, username, session_token and todo_ids.
+    """
+    rng = random.Random(seed)
+    password_hash = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt())
+    # Pareto with alpha 1.5 has mean 3 * x_m
+    scale = mean_todos / 3
+    expires_at = datetime.utcnow() + timedelta(days=7)
+    now = datetime.utcnow()
+
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    migrate(conn)
+
+    seeded = []
+    with conn:
+        for i in range(users):
+            username = f"bench{seed}_{i}"
+            cursor = conn.execute(
+                "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+                (username, f"{username}@example.com", password_hash),
+            )
+            user_id = cursor.lastrowid
+            token = f"bench-{seed}-{i}-{rng.getrandbits(64):016x}"
+            conn.execute(
+                "INSERT INTO sessions (user_id, session_token, expires_at) VALUES (?, ?, ?)",
+                (user_id, token, expires_at),
+            )
+            count = min(MAX_TODOS_PER_USER, int(rng.paretovariate(1.5) * scale))
+            rows = []
+            for _ in range(count):
+                modified = now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+                rows.append((
+                    _text(rng, 2, 6),
+                    _text(rng, 0, 20) or None,
+                    rng.random() < 0.3,
+                    user_id,
+                    modified,
+                    modified,
+                ))
+            conn.executemany(
+                "INSERT INTO todos (title, description, completed, user_id, created_at, last_modified_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            todo_ids = [row[0] for row in conn.execute("SELECT id FROM todos WHERE user_id = ?", (user_id,))]
+            seeded.append({"id": user_id, "username": username, "session_token": token, "todo_ids": todo_ids})
+    conn.close()
+    return seeded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--mean-todos", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    users = seed(args.path, args.users, args.mean_todos, args.seed)
+    todos = sum(len(user["todo_ids"]) for user in users)
+    print(json.dumps({"path": args.path, "users": len(users), "todos": todos,
+                      "max_todos_per_user": max(len(user["todo_ids"]) for user in users)}))
+
+
+if __name__ == "__main__":
+    main()
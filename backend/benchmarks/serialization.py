@@ -0,0 +1,122 @@
+"""Cost of turning todo rows into a JSON response, validated vs FAST_SERIALIZATION.
+
+    python -m benchmarks.serialization [--rows 1 10 100 1000 5000]
+
+For each row count it times three stages, old path against new:
+
+* ``fetch``: sqlite3 rows to dicts, ``dict(sqlite3.Row)`` vs ``database.dict_rows``
+* ``encode``: FastAPI's response_model validation plus JSONResponse vs
+  ``serialization.todo_payloads`` plus orjson, on the same rows; the two
+  bodies must decode to the same JSON or the script exits non-zero
+* ``request``: a whole GET /todos/ through the ASGI app with
+  FAST_SERIALIZATION off and on
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+import time
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from benchmarks.common import client, load_app, signup_and_login, summarize
+
+
+def _rows(count: int):
+    return [{
+        'id': i, 'title': f"todo number {i}", 'description': "a description of average length" if i % 3 else None,
+        'completed': i % 2, 'created_at': "2024-05-01 12:00:00.000000",
+        'last_modified_at': "2024-05-01 12:00:00.000000", 'created_by': "bench",
+    } for i in range(1, count + 1)]
+
+
+def _repeats(count: int, budget: int = 200_000) -> int:
+    return max(10, min(2000, budget // count))
+
+
+async def _time(call, repeats: int) -> dict:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = call()
+        if asyncio.iscoroutine(result):
+            await result
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def _compare(old: dict, new: dict) -> dict:
+    return {"old": old, "new": new, "speedup": round(old["p50_ms"] / new["p50_ms"], 1) if new["p50_ms"] else None}
+
+
+async def run(args) -> dict:
+    import database
+    import main
+    import serialization
+    app = load_app()
+    route = next(r for r in app.routes if getattr(r, "path", None) == "/todos/" and "GET" in r.methods)
+
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute('CREATE TABLE todos (id INTEGER PRIMARY KEY, title TEXT, description TEXT, completed BOOLEAN, '
+                 'created_at TIMESTAMP, last_modified_at TIMESTAMP, created_by TEXT)')
+
+    report, mismatches = {}, []
+    async with client(app) as http:
+        for count in args.rows:
+            rows = _rows(count)
+            repeats = _repeats(count)
+            conn.execute('DELETE FROM todos')
+            conn.executemany('INSERT INTO todos VALUES (?, ?, ?, ?, ?, ?, ?)', [tuple(r.values()) for r in rows])
+            sql = 'SELECT * FROM todos ORDER BY id'
+
+            async def validated():
+                content = await serialize_response(field=route.response_field, response_content=rows,
+                                                   is_coroutine=True)
+                return JSONResponse(content).body
+
+            def fast():
+                return serialization.json_response(serialization.todo_payloads(rows), Response()).body
+
+            if json.loads(await validated()) != json.loads(fast()):
+                mismatches.append(count)
+
+            token = await signup_and_login(http, f"serializer{count}")
+            for i in range(0, count, 5000):
+                await http.post("/todos/batch", cookies={"session_token": token}, json={"operations": [
+                    {"op": "create", "title": f"todo number {j}", "description": "a description"}
+                    for j in range(i, min(count, i + 5000))
+                ]})
+
+            async def request(fast_path):
+                main.FAST_SERIALIZATION = fast_path
+                return await _time(lambda: http.get("/todos/", cookies={"session_token": token}),
+                                   min(repeats, 300))
+
+            report[count] = {
+                "fetch": _compare(
+                    await _time(lambda: [dict(r) for r in conn.execute(sql)], repeats),
+                    await _time(lambda: database.dict_rows(conn, sql), repeats),
+                ),
+                "encode": _compare(await _time(validated, repeats), await _time(fast, repeats)),
+                "request": _compare(await request(False), await request(True)),
+            }
+    main.FAST_SERIALIZATION = serialization.FAST_SERIALIZATION
+    return {"rows": report, "mismatched_row_counts": mismatches}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 10, 100, 1000, 5000])
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    if result["mismatched_row_counts"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Concurrent write throughput against 1, 2, 4 and 8 SQLite shards.
+
+    python -m benchmarks.sharding [--shards 1 2 4 8] [--processes N] [--writers 32] [--seconds 10]
+
+Each configuration runs ``--processes`` app processes (default: one per
+CPU, like ``uvicorn --workers``) against the same fresh files, with
+STORAGE_BACKEND=sharded and one user per writer, so users are spread evenly
+over the shards. Writers create and toggle their own todos, as in
+benchmarks.group_commit, and ``baseline`` is the same load on the unsharded
+sqlite backend. With synchronous=FULL (the default here) every commit waits
+for its fsync while holding its file's write lock, which is what more shards
+spread out; how far throughput scales depends on the CPUs and disk, since
+each process is still bound to one core.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import random
+import tempfile
+import time
+
+from benchmarks.group_commit import _writer
+
+
+async def _process(db_dir, first_user, writers, seconds, barrier):
+    from benchmarks.common import client, load_app, signup_and_login
+
+    app = load_app(db_dir)
+    writes = []
+    async with client(app) as http:
+        users = [
+            {"session_token": await signup_and_login(http, f"writer{first_user + i}"), "todo_ids": []}
+            for i in range(writers)
+        ]
+        # Sign-ups (bcrypt) are done everywhere before anyone starts writing
+        await asyncio.to_thread(barrier.wait)
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(
+            _writer(http, users[i], random.Random(first_user + i), deadline, writes) for i in range(writers)
+        ))
+    return writes
+
+
+def _run_process(db_dir, first_user, writers, seconds, barrier, results):
+    results.put(asyncio.run(_process(db_dir, first_user, writers, seconds, barrier)))
+
+
+def _run_config(config, args):
+    from benchmarks.common import summarize
+
+    # Spawned processes read their settings from the environment at import
+    previous = {key: os.environ.get(key) for key in config}
+    os.environ.update(config)
+    try:
+        context = multiprocessing.get_context("spawn")
+        db_dir = tempfile.mkdtemp(prefix="taskmaster-shards-")
+        barrier, results = context.Barrier(args.processes), context.Queue()
+        per_process = max(1, args.writers // args.processes)
+        processes = [
+            context.Process(target=_run_process,
+                            args=(db_dir, i * per_process, per_process, args.seconds, barrier, results))
+            for i in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        writes = []
+        for _ in processes:
+            while True:
+                try:
+                    writes.extend(results.get(timeout=1))
+                    break
+                except queue.Empty:
+                    if any(process.exitcode not in (None, 0) for process in processes):
+                        raise RuntimeError("a benchmark process failed")
+        for process in processes:
+            process.join()
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    return {"writes_per_second": round(len(writes) / args.seconds, 1), "write_latency": summarize(writes)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--writers", type=int, default=32, help="in total, split over the processes")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--synchronous", default="FULL", help="SQLITE_SYNCHRONOUS for every file")
+    args = parser.parse_args()
+
+    common = {"SQLITE_SYNCHRONOUS": args.synchronous, "SQLITE_GROUP_COMMIT": "0", "LOG_LEVEL": "WARNING"}
+    configs = {"baseline": {**common, "STORAGE_BACKEND": "sqlite"}}
+    for count in args.shards:
+        configs[f"shards_{count}"] = {**common, "STORAGE_BACKEND": "sharded", "SQLITE_SHARDS": str(count)}
+
+    results = {name: _run_config(config, args) for name, config in configs.items()}
+    baseline = results["baseline"]["writes_per_second"]
+    for result in results.values():
+        result["vs_baseline"] = round(result["writes_per_second"] / baseline, 2) if baseline else None
+    print(json.dumps({"processes": args.processes, "writers": args.writers, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
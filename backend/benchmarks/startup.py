@@ -0,0 +1,143 @@
+"""Cold start: time to import ``main`` and time until the first request succeeds.
+
+    python -m benchmarks.startup [--runs 5] [--backend sqlite|memory]
+                                 [--max-import-ms N] [--max-first-request-ms N] [--output FILE]
+
+Every run is a fresh interpreter. ``import_ms`` is measured inside the child
+around ``import main``; ``first_request_ms`` is from spawning
+``uvicorn main:app`` against an empty database (so it includes the lifespan:
+migrations, index setup, background tasks) until GET /health returns 200.
+The slowest modules by cumulative ``-X importtime`` are listed to show where
+import time goes. Results are written as JSON to ``benchmarks/results/``; with
+the ``--max-*`` budgets the exit status is non-zero when a median exceeds
+them, so CI can track regressions.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.load import BACKEND_DIR, RESULTS_DIR, _free_port, _git_commit
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def _env(backend: str) -> dict:
+    db_dir = tempfile.mkdtemp(prefix="taskmaster-startup-")
+    return {
+        **os.environ,
+        "STORAGE_BACKEND": backend,
+        "SQLITE_PATH": os.path.join(db_dir, "todos.db"),
+        "LOG_LEVEL": "WARNING",
+    }
+
+
+def measure_import(backend: str) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=_env(backend),
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1]) * 1000
+
+
+def slowest_imports(backend: str, top: int = 10) -> list:
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR, env=_env(backend),
+        capture_output=True, text=True, check=True,
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            # Children are listed before their parent: keep main's direct imports
+            if name.strip() == "main":
+                break
+            modules = []
+        elif depth == 1:
+            modules.append((name.strip(), int(cumulative) / 1000))
+    modules.sort(key=lambda item: -item[1])
+    return [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in modules[:top]]
+
+
+def measure_first_request(backend: str, timeout: float = 60.0) -> float:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR, env=_env(backend),
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with {server.returncode}")
+                time.sleep(0.005)
+        raise TimeoutError(f"no successful request within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", choices=("sqlite", "memory"), default="sqlite")
+    parser.add_argument("--max-import-ms", type=float, help="fail if the median import time is above this")
+    parser.add_argument("--max-first-request-ms", type=float,
+                        help="fail if the median time to first request is above this")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<time>-startup.json)")
+    args = parser.parse_args()
+
+    imports = [measure_import(args.backend) for _ in range(args.runs)]
+    first_requests = [measure_first_request(args.backend) for _ in range(args.runs)]
+    result = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "args": vars(args),
+        },
+        "import_ms": {"median": round(statistics.median(imports), 1), "runs": [round(t, 1) for t in imports]},
+        "first_request_ms": {
+            "median": round(statistics.median(first_requests), 1), "runs": [round(t, 1) for t in first_requests],
+        },
+        "slowest_imports": slowest_imports(args.backend),
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-startup.json")
+    with open(output, "w") as out:
+        json.dump(result, out, indent=2)
+    print(json.dumps(result, indent=2))
+
+    over = []
+    if args.max_import_ms is not None and result["import_ms"]["median"] > args.max_import_ms:
+        over.append(f"import {result['import_ms']['median']}ms > {args.max_import_ms}ms")
+    if args.max_first_request_ms is not None and result["first_request_ms"]["median"] > args.max_first_request_ms:
+        over.append(f"first request {result['first_request_ms']['median']}ms > {args.max_first_request_ms}ms")
+    if over:
+        print("over budget: " + "; ".join(over))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
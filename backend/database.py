@@ -1,129 +1,179 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
 import os
 from dotenv import load_dotenv
 import sqlite3
 from sqlite3 import Error
-from typing import List, Dict, Optional
-import bcrypt
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import contextvars
+import functools
+import heapq
+import logging
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime, timedelta
+from cache import TTLCache
+from db_pool import ConnectionPool
+from group_commit import GroupCommitWriter
+import metrics
+from migrations import LATEST_VERSION, RATE_LIMITS_SCHEMA, current_version, migrate
+from repository import (
+    SESSION_TTL, SESSION_RENEW_INTERVAL, SESSION_MAX_PER_USER, TodoConflict, batch_results, reset_page,
+    rolled_back
+)
 
 load_dotenv()
 
-# Get database URL from environment variable or use SQLite as fallback
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./todos.db")
+logger = logging.getLogger(__name__)
+
+# SQLite connection pool shared by every request in this process
+SQLITE_PATH = os.getenv("SQLITE_PATH", "todos.db")
 
-# Create async engine
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=True,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+SQLITE_PRAGMAS = {
+    "foreign_keys": "ON",
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Negative cache_size is in KiB rather than pages
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+    # Pages of WAL after which a committing connection checkpoints; 0 leaves
+    # checkpointing to SQLITE_CHECKPOINT_INTERVAL (group commit) or to you
+    "wal_autocheckpoint": int(os.getenv("SQLITE_WAL_AUTOCHECKPOINT", "1000")),
+}
+
+pool = ConnectionPool(
+    SQLITE_PATH,
+    size=int(os.getenv("SQLITE_POOL_SIZE", "8")),
+    timeout=float(os.getenv("SQLITE_POOL_TIMEOUT", "30")),
+    busy_timeout=float(os.getenv("SQLITE_BUSY_TIMEOUT", "5")),
+    pragmas=SQLITE_PRAGMAS,
+    factory=metrics.connection_factory(),
 )
 
-# Create async session factory
-AsyncSessionLocal = sessionmaker(
-    engine, class_=AsyncSession, expire_on_commit=False
+# Opt-in group commit (see group_commit.py). Write helpers called through
+# run_write are then committed in groups by a single writer thread, whose
+# connection defaults to synchronous=FULL since its fsyncs are shared.
+SQLITE_GROUP_COMMIT = os.getenv("SQLITE_GROUP_COMMIT", "0") == "1"
+
+writer = GroupCommitWriter(
+    SQLITE_PATH,
+    window=float(os.getenv("SQLITE_GROUP_COMMIT_WINDOW_MS", "2")) / 1000,
+    max_batch=int(os.getenv("SQLITE_GROUP_COMMIT_MAX_BATCH", "256")),
+    busy_timeout=float(os.getenv("SQLITE_BUSY_TIMEOUT", "5")),
+    pragmas={**SQLITE_PRAGMAS, "synchronous": os.getenv("SQLITE_WRITER_SYNCHRONOUS", "FULL")},
+    checkpoint_interval=float(os.getenv("SQLITE_CHECKPOINT_INTERVAL", "0")),
+    checkpoint_mode=os.getenv("SQLITE_CHECKPOINT_MODE", "PASSIVE").upper(),
+) if SQLITE_GROUP_COMMIT else None
+
+# Set (see shards.py) to run the helpers below against another database
+# file's pool, e.g. the shard holding a user's todos
+current_pool: contextvars.ContextVar[Optional[ConnectionPool]] = contextvars.ContextVar(
+    "current_pool", default=None
 )
 
-Base = declarative_base()
+def get_connection():
+    """Check a pooled connection out for the duration of a ``with`` block.
+
+    Inside a group-commit write this is the writer's connection instead, and
+    with ``current_pool`` set it comes from that pool.
+    """
+    shard_pool = current_pool.get()
+    if shard_pool is not None:
+        return shard_pool.connection()
+    if writer is not None:
+        conn = writer.current_connection()
+        if conn is not None:
+            return nullcontext(conn)
+    return pool.connection()
+
+def pool_stats() -> Dict:
+    return pool.stats()
+
+metrics.register_collector(lambda: metrics.gauge_lines(
+    "db_pool", "SQLite connection pool", pool.stats()
+))
+
+# session_token -> user, so polling requests skip the sessions/users JOIN.
+# Entries never outlive the session itself and are dropped on logout.
+session_cache = TTLCache(
+    maxsize=int(os.getenv("SESSION_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SESSION_CACHE_TTL", "300")),
+)
+
+metrics.register_collector(lambda: metrics.gauge_lines(
+    "session_cache", "Session cache", session_cache.stats()
+))
+
+# Blocking sqlite3 calls run here instead of on the event loop. One thread per
+# pooled connection means a worker never has to wait for a connection.
+_db_executor = ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix="sqlite")
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database helper on the database worker threads.
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
+    The caller's context (e.g. the request id used in logs) is carried over.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    if not metrics.METRICS_ENABLED:
+        return await loop.run_in_executor(_db_executor, call)
+
+    submitted = time.perf_counter()
+
+    def timed_call():
+        started = time.perf_counter()
+        metrics.DB_QUEUE_WAIT.observe(started - submitted)
         try:
-            yield session
+            return call()
         finally:
-            await session.close()
-
-def create_connection():
-    try:
-        print("Attempting to connect to SQLite database: todos.db")
-        conn = sqlite3.connect('todos.db')
-        conn.row_factory = sqlite3.Row  # This enables column access by name
-        print("Successfully connected to database")
-        return conn
-    except Error as e:
-        print(f"Error connecting to database: {e}")
-        return None
+            metrics.DB_CALL_LATENCY.observe(time.perf_counter() - started, func.__name__)
+
+    return await loop.run_in_executor(_db_executor, timed_call)
 
-def init_db():
-    print("Initializing database...")
-    conn = create_connection()
-    if conn is not None:
+async def run_write(func, *args, **kwargs):
+    """Run a database helper that writes.
+
+    With group commit enabled it is queued to the writer thread and this
+    returns once the group containing it has committed; otherwise it is the
+    same as ``run_db``.
+    """
+    if writer is None:
+        return await run_db(func, *args, **kwargs)
+    context = contextvars.copy_context()
+    future = writer.submit(functools.partial(context.run, func, *args, **kwargs))
+    return await asyncio.wrap_future(future)
+
+def init_db() -> Optional[int]:
+    """Bring the schema up to date and return its version. Existing data is never dropped."""
+    logger.info("Initializing database", extra={"path": SQLITE_PATH})
+    with get_connection() as conn:
         try:
-            cursor = conn.cursor()
-            
-            # Enable foreign keys
-            cursor.execute('PRAGMA foreign_keys = ON;')
-            
-            print("Creating users table...")
-            # Create users table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    email TEXT UNIQUE NOT NULL,
-                    password_hash BLOB NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            print("Recreating todos table...")
-            # Drop and recreate todos table with user_id foreign key
-            cursor.execute('DROP TABLE IF EXISTS todos')
-            cursor.execute('''
-                CREATE TABLE todos (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    completed BOOLEAN DEFAULT FALSE,
-                    user_id INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
+            version = migrate(conn)
+            logger.info("Database initialized", extra={"schema_version": version})
+            return version
+        except Error:
+            logger.exception("Error migrating database")
+    return None
 
-            print("Creating sessions table...")
-            # Create sessions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    session_token TEXT UNIQUE NOT NULL,
-                    expires_at TIMESTAMP NOT NULL,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Drop task_history table if it exists
-            cursor.execute('DROP TABLE IF EXISTS task_history')
-            
-            # Verify tables were created
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            print(f"Created tables: {[table[0] for table in tables]}")
-            
-            conn.commit()
-            print("Database initialized successfully")
-        except Error as e:
-            print(f"Error creating tables: {e}")
-        finally:
-            conn.close()
-            print("Database connection closed")
-    else:
-        print("Error: Could not establish database connection")
+def check_schema() -> int:
+    """Fail fast if migrations are pending (when they run at deploy time, not startup)."""
+    with get_connection() as conn:
+        version = current_version(conn)
+    if version < LATEST_VERSION:
+        raise RuntimeError(
+            f"Schema is at version {version}, expected {LATEST_VERSION}; run `python maintenance.py migrate`"
+        )
+    return version
 
 # User Management Functions
-def create_user(username: str, email: str, password: str) -> Optional[Dict]:
-    conn = create_connection()
-    if conn is not None:
+def create_user(username: str, email: str, password_hash: bytes) -> Optional[Dict]:
+    """Create a user from an already computed bcrypt ``password_hash``."""
+    with get_connection() as conn:
         try:
-            # Hash the password
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-            
             cursor = conn.cursor()
-            print(f"Attempting to create user: {username}")
             
             cursor.execute(
                 'INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
@@ -139,138 +189,323 @@ def create_user(username: str, email: str, password: str) -> Optional[Dict]:
             user = cursor.fetchone()
             
             if user:
-                print(f"User created successfully: {username}")
+                logger.info("User created", extra={"username": username})
                 return dict(user)
             else:
-                print("User creation succeeded but fetch failed")
+                logger.error("User creation succeeded but fetch failed", extra={"username": username})
                 return None
                 
         except sqlite3.IntegrityError as e:
-            print(f"IntegrityError creating user: {e}")
+            logger.info("User already exists", extra={"username": username, "error": str(e)})
             return None
-        except Exception as e:
-            print(f"Unexpected error creating user: {e}")
+        except Exception:
+            logger.exception("Unexpected error creating user")
             return None
-        finally:
-            conn.close()
     return None
 
-def verify_user(username: str, password: str) -> Optional[Dict]:
-    conn = create_connection()
-    if conn is not None:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                'SELECT id, username, email, password_hash FROM users WHERE username = ?',
-                (username,)
-            )
-            user = cursor.fetchone()
-            
-            if user and bcrypt.checkpw(password.encode('utf-8'), user['password_hash']):
-                return {
-                    'id': user['id'],
-                    'username': user['username'],
-                    'email': user['email']
-                }
-        finally:
-            conn.close()
+def get_user_credentials(username: str) -> Optional[Dict]:
+    """Get a user together with their password hash, for login checks."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT id, username, email, password_hash FROM users WHERE username = ?',
+            (username,)
+        )
+        user = cursor.fetchone()
+        if user:
+            return dict(user)
     return None
 
+def update_password_hash(user_id: int, password_hash: bytes) -> bool:
+    with get_connection() as conn:
+        cursor = conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
+        conn.commit()
+        return cursor.rowcount > 0
+
 # Session Management Functions
 def create_session(user_id: int) -> Optional[str]:
-    conn = create_connection()
-    if conn is not None:
-        try:
-            # Generate session token
-            session_token = bcrypt.gensalt().hex()
-            expires_at = datetime.utcnow() + timedelta(days=7)
-            
-            cursor = conn.cursor()
-            cursor.execute(
-                'INSERT INTO sessions (user_id, session_token, expires_at) VALUES (?, ?, ?)',
-                (user_id, session_token, expires_at)
-            )
-            conn.commit()
-            return session_token
-        finally:
-            conn.close()
-    return None
+    with get_connection() as conn:
+        # 192 random bits in 32 URL-safe characters
+        session_token = secrets.token_urlsafe(24)
+        expires_at = datetime.utcnow() + SESSION_TTL
 
-def verify_session(session_token: str) -> Optional[Dict]:
-    conn = create_connection()
-    if conn is not None:
-        try:
-            cursor = conn.cursor()
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO sessions (user_id, session_token, expires_at) VALUES (?, ?, ?)',
+            (user_id, session_token, expires_at)
+        )
+        dropped = []
+        if SESSION_MAX_PER_USER > 0:
             cursor.execute('''
-                SELECT u.id, u.username, u.email 
-                FROM sessions s
-                JOIN users u ON s.user_id = u.id
-                WHERE s.session_token = ? AND s.expires_at > ?
-            ''', (session_token, datetime.utcnow()))
-            
-            result = cursor.fetchone()
-            if result:
-                return dict(result)
-        finally:
-            conn.close()
+                DELETE FROM sessions WHERE id IN (
+                    SELECT id FROM sessions WHERE user_id = ? ORDER BY id DESC LIMIT -1 OFFSET ?
+                )
+                RETURNING session_token
+            ''', (user_id, SESSION_MAX_PER_USER))
+            dropped = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        for token in dropped:
+            session_cache.delete(token)
+        if dropped:
+            metrics.SESSIONS_EVICTED.inc(amount=len(dropped))
+        return session_token
+
+def get_cached_session(session_token: str) -> Optional[Dict]:
+    """Return the cached user for a session token without touching the database."""
+    return session_cache.get(session_token)
+
+def verify_session(session_token: str) -> Optional[Dict]:
+    """Look up the user for a live session without writing.
+
+    When the sliding renewal is due the user comes back uncached with
+    ``session_renewal_due`` set; the caller then runs ``renew_session``, which
+    writes and so belongs on the write path.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        now = datetime.utcnow()
+        cursor.execute('''
+            SELECT u.id, u.username, u.email, s.expires_at
+            FROM sessions s
+            JOIN users u ON s.user_id = u.id
+            WHERE s.session_token = ? AND s.expires_at > ?
+        ''', (session_token, now))
+        
+        result = cursor.fetchone()
+        if result:
+            user = dict(result)
+            expires_at = user.pop('expires_at')
+            if isinstance(expires_at, str):
+                expires_at = datetime.fromisoformat(expires_at)
+            if SESSION_RENEW_INTERVAL and expires_at - now < SESSION_TTL - SESSION_RENEW_INTERVAL:
+                return {**user, 'session_renewal_due': True}
+            session_cache.set(session_token, user, (expires_at - now).total_seconds())
+            return user
     return None
 
+def renew_session(session_token: str, user: Dict) -> Optional[Dict]:
+    """Push a session's expiry out to a full SESSION_TTL from now.
+
+    Returns ``user`` with ``session_expires_at`` so the caller can refresh the
+    cookie, or None if the session ended since ``verify_session`` found it.
+    """
+    with get_connection() as conn:
+        now = datetime.utcnow()
+        expires_at = now + SESSION_TTL
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE sessions SET expires_at = ? WHERE session_token = ? AND expires_at > ?',
+            (expires_at, session_token, now)
+        )
+        conn.commit()
+        if not cursor.rowcount:
+            return None
+        metrics.SESSIONS_RENEWED.inc()
+        session_cache.set(session_token, user, SESSION_TTL.total_seconds())
+        # Lets the caller refresh the cookie; never cached
+        return {**user, 'session_expires_at': expires_at}
+
+def delete_expired_sessions(batch_size: int = 500) -> int:
+    """Delete up to ``batch_size`` expired sessions in one short transaction.
+
+    Callers repeat until fewer than ``batch_size`` rows are deleted, so the
+    write lock is only ever held for one small batch at a time.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM sessions WHERE id IN (
+                SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?
+            )
+        ''', (datetime.utcnow(), batch_size))
+        conn.commit()
+        return cursor.rowcount
+
+# Signed-token revocations (see tokens.py)
+def revoke_token(jti: str, expires_at: datetime) -> None:
+    with get_connection() as conn:
+        conn.execute(
+            'INSERT OR IGNORE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)',
+            (jti, expires_at)
+        )
+        conn.commit()
+
+def get_revoked_tokens(after_id: int = 0) -> List[Dict]:
+    """Revocations newer than ``after_id`` whose tokens have not expired yet."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT id, jti, expires_at FROM revoked_tokens WHERE id > ? AND expires_at > ? ORDER BY id',
+            (after_id, datetime.utcnow())
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+def delete_expired_revocations(batch_size: int = 500) -> int:
+    """Drop revocations for tokens that have expired anyway, one batch at a time."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM revoked_tokens WHERE id IN (
+                SELECT id FROM revoked_tokens WHERE expires_at <= ? LIMIT ?
+            )
+        ''', (datetime.utcnow(), batch_size))
+        conn.commit()
+        return cursor.rowcount
+
+# Login/signup rate limits (see throttle.py)
+def create_rate_limits_table() -> None:
+    """Create ``rate_limits`` if missing, for files the migrations never ran on."""
+    with get_connection() as conn:
+        for statement in RATE_LIMITS_SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+
+def take_rate_token(key: str, burst: float, per_second: float, now: float) -> float:
+    """Take a token from the bucket ``key``; 0 if one was taken, else seconds until one is available.
+
+    Refill and take happen in one statement, so workers sharing the file
+    never both spend the last token.
+    """
+    with get_connection() as conn:
+        tokens, allowed = conn.execute('''
+            INSERT INTO rate_limits (key, tokens, updated_at, allowed) VALUES (:key, :burst - 1, :now, 1)
+            ON CONFLICT (key) DO UPDATE SET
+                allowed = MIN(:burst, tokens + (:now - updated_at) * :rate) >= 1,
+                tokens = MIN(:burst, tokens + (:now - updated_at) * :rate)
+                         - (MIN(:burst, tokens + (:now - updated_at) * :rate) >= 1),
+                updated_at = :now
+            RETURNING tokens, allowed
+        ''', {'key': key, 'burst': burst, 'now': now, 'rate': per_second}).fetchone()
+        conn.commit()
+    return 0.0 if allowed else (1 - tokens) / per_second
+
+def delete_idle_rate_limits(idle_before: float, batch_size: int = 500) -> int:
+    """Drop buckets untouched since ``idle_before``; they have refilled completely anyway."""
+    with get_connection() as conn:
+        cursor = conn.execute('''
+            DELETE FROM rate_limits WHERE key IN (
+                SELECT key FROM rate_limits WHERE updated_at < ? LIMIT ?
+            )
+        ''', (idle_before, batch_size))
+        conn.commit()
+        return cursor.rowcount
+
 def delete_session(session_token: str) -> bool:
-    conn = create_connection()
-    if conn is not None:
-        try:
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM sessions WHERE session_token = ?', (session_token,))
-            conn.commit()
-            return cursor.rowcount > 0
-        finally:
-            conn.close()
-    return False
+    session_cache.delete(session_token)
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM sessions WHERE session_token = ?', (session_token,))
+        conn.commit()
+        return cursor.rowcount > 0
+
+def dict_rows(conn: sqlite3.Connection, sql: str, params=()) -> List[Dict]:
+    """Run a query and return its rows as dicts.
+
+    The dicts are built from plain tuples, which costs about a third less
+    per row than ``dict(sqlite3.Row)``; used by the queries that can return
+    thousands of rows.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+    names = [column[0] for column in cursor.description]
+    return [dict(zip(names, row)) for row in cursor]
 
 # Updated Todo Functions to include user_id
-def get_user_todos(user_id: int) -> List[Dict]:
-    """Get all todos for a user with their latest status."""
-    conn = create_connection()
+TODO_COLUMNS = '''
+    t.id,
+    t.title,
+    t.description,
+    t.completed,
+    t.created_at,
+    t.last_modified_at,
+    u.username as created_by
+'''
+
+def get_user_todos(
+    user_id: int,
+    limit: Optional[int] = None,
+    cursor: Optional[Tuple[int, str, int]] = None,
+    completed: Optional[bool] = None,
+    modified_since: Optional[datetime] = None,
+    include_archived: bool = False,
+) -> List[Dict]:
+    """Get a user's todos, active first and most recently modified first.
+
+    With ``limit`` this returns one keyset page starting after ``cursor``
+    (see ``repository.decode_cursor``). Each completed/active group is read with its own
+    index seek on (user_id, completed, last_modified_at, id), so the cost of
+    a page does not depend on how deep into the list it is.
+
+    Archived todos are left out unless ``include_archived``; they are then
+    merged into the completed group, read with the same seek on the archive
+    and only once a page reaches that group.
+    """
     todos = []
-    if conn is not None:
+    groups = [int(completed)] if completed is not None else [0, 1]
+    with get_connection() as conn:
         try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT 
-                    t.id,
-                    t.title,
-                    t.description,
-                    t.completed,
-                    t.created_at,
-                    t.last_modified_at,
-                    u.username as created_by
-                FROM todos t
-                JOIN users u ON t.user_id = u.id
-                WHERE t.user_id = ?
-                ORDER BY t.completed ASC, t.last_modified_at DESC
-            ''', (user_id,))
-            
-            rows = cursor.fetchall()
-            for row in rows:
-                todos.append(dict(row))
-        except Exception as e:
-            print(f"Error fetching todos: {e}")
-        finally:
-            conn.close()
+            for group in groups:
+                if cursor is not None and group < cursor[0]:
+                    continue
+                tables = ['todos', 'todos_archive'] if include_archived and group == 1 else ['todos']
+                rows = []
+                for table in tables:
+                    sql = f'''
+                        SELECT {TODO_COLUMNS}
+                        FROM {table} t
+                        JOIN users u ON t.user_id = u.id
+                        WHERE t.user_id = ?
+                    '''
+                    params: list = [user_id]
+                    if table == 'todos':
+                        sql += ' AND t.completed = ?'
+                        params.append(group)
+                    if cursor is not None and group == cursor[0]:
+                        sql += ' AND (t.last_modified_at, t.id) < (?, ?)'
+                        params += [cursor[1], cursor[2]]
+                    if modified_since is not None:
+                        sql += ' AND t.last_modified_at >= ?'
+                        params.append(modified_since)
+                    sql += ' ORDER BY t.last_modified_at DESC, t.id DESC'
+                    if limit is not None:
+                        sql += ' LIMIT ?'
+                        params.append(limit - len(todos))
+                    rows.extend(dict_rows(conn, sql, params))
+                if len(tables) > 1:
+                    rows.sort(key=lambda todo: (todo['last_modified_at'], todo['id']), reverse=True)
+                    if limit is not None:
+                        rows = rows[:limit - len(todos)]
+
+                todos.extend(rows)
+                if limit is not None and len(todos) >= limit:
+                    break
+        except Exception:
+            logger.exception("Error fetching todos")
     return todos
 
+def get_user_todo(user_id: int, todo_id: int) -> Optional[Dict]:
+    """Get a single todo if it belongs to the user, looking in the archive if it is not active."""
+    with get_connection() as conn:
+        for table in ('todos', 'todos_archive'):
+            row = conn.execute(f'''
+                SELECT {TODO_COLUMNS}
+                FROM {table} t
+                JOIN users u ON t.user_id = u.id
+                WHERE t.id = ? AND t.user_id = ?
+            ''', (todo_id, user_id)).fetchone()
+            if row:
+                return dict(row)
+        return None
+
 def create_todo(user_id: int, title: str, description: Optional[str] = None) -> Optional[Dict]:
     """Create a new todo."""
-    conn = create_connection()
-    if conn is not None:
+    with get_connection() as conn:
         try:
             cursor = conn.cursor()
             now = datetime.utcnow()
             
-            cursor.execute(
-                'INSERT INTO todos (title, description, user_id, created_at, last_modified_at) VALUES (?, ?, ?, ?, ?)',
-                (title, description, user_id, now, now)
-            )
+            cursor.execute(BATCH_STATEMENTS['create'], (title, description, user_id, now, now))
             conn.commit()
             todo_id = cursor.lastrowid
             
@@ -289,24 +524,62 @@ def create_todo(user_id: int, title: str, description: Optional[str] = None) ->
                 WHERE t.id = ?
             ''', (todo_id,))
             return dict(cursor.fetchone())
-        except Exception as e:
-            print(f"Error creating todo: {e}")
+        except Exception:
+            logger.exception("Error creating todo")
             return None
-        finally:
-            conn.close()
     return None
 
-def update_todo_status(user_id: int, todo_id: int, completed: bool) -> Optional[Dict]:
+def write_todo(conn: sqlite3.Connection, cursor: sqlite3.Cursor, user_id: int, todo_id: int,
+               sql: str, params: Tuple, unchanged_since: Optional[int] = None) -> int:
+    """Run ``sql`` (ending in its ``id``/``user_id`` condition) on one todo; returns the rows changed.
+
+    An archived todo is moved back first. With ``unchanged_since`` the write
+    only applies if the todo's version (for an archived one, the version it
+    was archived at) is not newer; if it is, the transaction is rolled back
+    and TodoConflict raised.
+    """
+    if unchanged_since is None:
+        cursor.execute(sql, params)
+    else:
+        cursor.execute(sql + ' AND version <= ?', (*params, unchanged_since))
+        if cursor.rowcount == 0:
+            stale = conn.execute(
+                'SELECT 1 FROM todos WHERE id = ? AND user_id = ?', (todo_id, user_id)
+            ).fetchone() or (archived_version(conn, user_id, todo_id) or 0) > unchanged_since
+            if stale:
+                conn.rollback()
+                raise TodoConflict(todo_id)
+    if cursor.rowcount == 0 and unarchive_todos(conn, user_id, [todo_id]):
+        cursor.execute(sql, params)
+    return cursor.rowcount
+
+def archived_version(conn: sqlite3.Connection, user_id: int, todo_id: int) -> Optional[int]:
+    """The version at which an archived todo left the active list; None if it is not archived.
+
+    That is its tombstone's version, or the tombstone floor once the
+    tombstone has been compacted away.
+    """
+    if not conn.execute('SELECT 1 FROM todos_archive WHERE id = ? AND user_id = ?', (todo_id, user_id)).fetchone():
+        return None
+    row = conn.execute(
+        'SELECT version FROM todo_tombstones WHERE user_id = ? AND todo_id = ?', (user_id, todo_id)
+    ).fetchone() or conn.execute(
+        'SELECT tombstone_floor FROM todo_versions WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    return row[0] if row else 0
+
+def update_todo_status(user_id: int, todo_id: int, completed: bool,
+                       unchanged_since: Optional[int] = None) -> Optional[Dict]:
     """Update a todo's status."""
-    conn = create_connection()
-    if conn is not None:
+    with get_connection() as conn:
         try:
             cursor = conn.cursor()
             now = datetime.utcnow()
             
-            cursor.execute(
+            write_todo(
+                conn, cursor, user_id, todo_id,
                 'UPDATE todos SET completed = ?, last_modified_at = ? WHERE id = ? AND user_id = ?',
-                (completed, now, todo_id, user_id)
+                (completed, now, todo_id, user_id), unchanged_since
             )
             conn.commit()
             
@@ -326,31 +599,493 @@ def update_todo_status(user_id: int, todo_id: int, completed: bool) -> Optional[
                 ''', (todo_id,))
                 return dict(cursor.fetchone())
             return None
-        except Exception as e:
-            print(f"Error updating todo: {e}")
+        except TodoConflict:
+            raise
+        except Exception:
+            logger.exception("Error updating todo")
+            return None
+    return None
+
+def update_todo(user_id: int, todo_id: int, title: str, description: Optional[str] = None,
+                unchanged_since: Optional[int] = None) -> Optional[Dict]:
+    """Update a todo's title and description."""
+    with get_connection() as conn:
+        try:
+            cursor = conn.cursor()
+            now = datetime.utcnow()
+
+            write_todo(
+                conn, cursor, user_id, todo_id,
+                'UPDATE todos SET title = ?, description = ?, last_modified_at = ? WHERE id = ? AND user_id = ?',
+                (title, description, now, todo_id, user_id), unchanged_since
+            )
+            conn.commit()
+
+            if cursor.rowcount > 0:
+                cursor.execute('''
+                    SELECT
+                        t.id,
+                        t.title,
+                        t.description,
+                        t.completed,
+                        t.created_at,
+                        t.last_modified_at,
+                        u.username as created_by
+                    FROM todos t
+                    JOIN users u ON t.user_id = u.id
+                    WHERE t.id = ?
+                ''', (todo_id,))
+                return dict(cursor.fetchone())
+            return None
+        except TodoConflict:
+            raise
+        except Exception:
+            logger.exception("Error updating todo")
             return None
-        finally:
-            conn.close()
     return None
 
-def delete_todo(user_id: int, todo_id: int) -> bool:
+def count_todos_to_update(user_id: int, completed: bool) -> int:
+    """How many of a user's todos do not have the given status yet."""
+    with get_connection() as conn:
+        return conn.execute(
+            'SELECT COUNT(*) FROM todos WHERE user_id = ? AND completed != ?', (user_id, completed)
+        ).fetchone()[0]
+
+def update_all_todos_status(user_id: int, completed: bool, limit: Optional[int] = None) -> List[int]:
+    """Set the status of a user's active todos and return the ids that changed.
+
+    Archived todos are left alone. Rows that already have the target status
+    are not written. With
+    ``limit`` at most that many rows change, so a large update can run as
+    several short transactions instead of holding the write lock for long.
+    """
+    now = datetime.utcnow()
+    with get_connection() as conn:
+        try:
+            if limit is None:
+                rows = conn.execute('''
+                    UPDATE todos SET completed = ?, last_modified_at = ?
+                    WHERE user_id = ? AND completed != ?
+                    RETURNING id
+                ''', (completed, now, user_id, completed)).fetchall()
+            else:
+                rows = conn.execute('''
+                    UPDATE todos SET completed = ?, last_modified_at = ?
+                    WHERE id IN (
+                        SELECT id FROM todos WHERE user_id = ? AND completed != ? LIMIT ?
+                    )
+                    RETURNING id
+                ''', (completed, now, user_id, completed, limit)).fetchall()
+            conn.commit()
+            return [row[0] for row in rows]
+        except Exception:
+            logger.exception("Error updating todos")
+            return []
+
+def delete_todo(user_id: int, todo_id: int, unchanged_since: Optional[int] = None) -> bool:
     """Delete a todo permanently."""
-    conn = create_connection()
-    if conn is not None:
+    with get_connection() as conn:
         try:
             cursor = conn.cursor()
-            cursor.execute(
-                'DELETE FROM todos WHERE id = ? AND user_id = ?',
-                (todo_id, user_id)
+            deleted = write_todo(
+                conn, cursor, user_id, todo_id,
+                'DELETE FROM todos WHERE id = ? AND user_id = ?', (todo_id, user_id), unchanged_since
             )
             conn.commit()
-            return cursor.rowcount > 0
-        except Exception as e:
-            print(f"Error deleting todo: {e}")
+            return deleted > 0
+        except TodoConflict:
+            raise
+        except Exception:
+            logger.exception("Error deleting todo")
             return False
-        finally:
-            conn.close()
     return False
 
-# Initialize the database
-init_db() 
\ No newline at end of file
+# Bulk export / import
+def export_todos(user_id: int, after_id: int = 0, limit: int = 1000) -> List[Dict]:
+    """One batch of a user's todos, archived ones included, in id order, starting after ``after_id``.
+
+    Each batch is a short index seek on (user_id, id) in each table, so an
+    export of any size never holds a connection or a read snapshot between
+    batches.
+    """
+    with get_connection() as conn:
+        active, archived = (dict_rows(conn, f'''
+            SELECT id, title, description, completed, created_at, last_modified_at
+            FROM {table}
+            WHERE user_id = ? AND id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (user_id, after_id, limit)) for table in ('todos', 'todos_archive'))
+    if not archived:
+        return active
+    return list(heapq.merge(active, archived, key=lambda todo: todo['id']))[:limit]
+
+def import_todos(user_id: int, rows: List[Dict]) -> Optional[int]:
+    """Insert ``rows`` (title, description, completed) in one transaction."""
+    now = datetime.utcnow()
+    with get_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'INSERT INTO todos (id, title, description, completed, user_id, created_at, last_modified_at) '
+                'VALUES ((SELECT next_id FROM todo_ids), ?, ?, ?, ?, ?, ?)',
+                [(row['title'], row.get('description'), row.get('completed', False), user_id, now, now)
+                 for row in rows]
+            )
+            conn.commit()
+            return len(rows)
+        except sqlite3.Error:
+            conn.rollback()
+            logger.exception("Error importing todos")
+            return None
+
+# Batch mutations. New ids come from todo_ids (see migration 9).
+BATCH_STATEMENTS = {
+    'create': 'INSERT INTO todos (id, title, description, user_id, created_at, last_modified_at) '
+              'VALUES ((SELECT next_id FROM todo_ids), ?, ?, ?, ?, ?)',
+    'update': 'UPDATE todos SET title = ?, description = ?, last_modified_at = ? WHERE id = ? AND user_id = ?',
+    'patch': 'UPDATE todos SET completed = ?, last_modified_at = ? WHERE id = ? AND user_id = ?',
+    'delete': 'DELETE FROM todos WHERE id = ? AND user_id = ?',
+}
+
+# Keeps IN (...) lists under SQLite's host parameter limit on old builds
+SQL_CHUNK_SIZE = 500
+
+def _batch_params(user_id: int, operation: Dict, now: datetime) -> tuple:
+    kind = operation['op']
+    if kind == 'create':
+        return (operation['title'], operation.get('description'), user_id, now, now)
+    if kind == 'update':
+        return (operation['title'], operation.get('description'), now, operation['id'], user_id)
+    if kind == 'patch':
+        return (operation['completed'], now, operation['id'], user_id)
+    return (operation['id'], user_id)
+
+def _existing_todo_ids(conn: sqlite3.Connection, user_id: int, todo_ids: List[int]) -> set:
+    existing = set()
+    for i in range(0, len(todo_ids), SQL_CHUNK_SIZE):
+        chunk = todo_ids[i:i + SQL_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        existing.update(row[0] for row in conn.execute(
+            f'SELECT id FROM todos WHERE user_id = ? AND id IN ({placeholders})', [user_id, *chunk]
+        ))
+    return existing
+
+def _apply_run(conn: sqlite3.Connection, user_id: int, operations: List[Dict], indexes: List[int],
+               results: List[Dict], now: datetime) -> None:
+    """Apply a run of same-kind operations with a single executemany."""
+    kind = operations[indexes[0]]['op']
+    if kind == 'create':
+        # Inside this write transaction nobody else can insert, and ids are
+        # handed out in order from todo_ids, so the new rows are exactly
+        # those between the old and the new next_id, in insertion order.
+        before = conn.execute('SELECT next_id FROM todo_ids').fetchone()[0]
+        conn.executemany(BATCH_STATEMENTS[kind], [_batch_params(user_id, operations[i], now) for i in indexes])
+        new_ids = [row[0] for row in conn.execute(
+            'SELECT id FROM todos WHERE id >= ? AND id < (SELECT next_id FROM todo_ids) ORDER BY id', (before,)
+        )]
+        for i, todo_id in zip(indexes, new_ids):
+            results[i]['id'] = todo_id
+        return
+
+    unarchive_todos(conn, user_id, [operations[i]['id'] for i in indexes])
+    existing = _existing_todo_ids(conn, user_id, [operations[i]['id'] for i in indexes])
+    apply = []
+    for i in indexes:
+        todo_id = operations[i]['id']
+        if todo_id in existing:
+            apply.append(i)
+            if kind == 'delete':
+                existing.discard(todo_id)
+        else:
+            results[i]['status'] = 'not_found'
+            results[i]['error'] = 'Todo not found'
+    conn.executemany(BATCH_STATEMENTS[kind], [_batch_params(user_id, operations[i], now) for i in apply])
+
+def apply_todo_batch(user_id: int, operations: List[Dict], atomic: bool = True) -> Dict:
+    """Apply create/update/patch/delete operations in one transaction.
+
+    Consecutive operations of the same kind are sent as one ``executemany``,
+    and the whole batch costs a single commit. In ``atomic`` mode any failed
+    operation rolls the batch back; otherwise failed operations are reported
+    and the rest are committed.
+    """
+    results = batch_results(operations)
+    now = datetime.utcnow()
+
+    # Split into runs of consecutive same-kind operations, preserving order
+    runs: List[List[int]] = []
+    for i, op in enumerate(operations):
+        if runs and operations[runs[-1][0]]['op'] == op['op']:
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+
+    with get_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for indexes in runs:
+                conn.execute('SAVEPOINT batch_run')
+                try:
+                    _apply_run(conn, user_id, operations, indexes, results, now)
+                except sqlite3.Error:
+                    conn.execute('ROLLBACK TO batch_run')
+                    if atomic:
+                        raise
+                    # Retry one at a time so only the offending operations fail
+                    for i in indexes:
+                        conn.execute('SAVEPOINT batch_op')
+                        try:
+                            _apply_run(conn, user_id, operations, [i], results, now)
+                        except sqlite3.Error as op_error:
+                            conn.execute('ROLLBACK TO batch_op')
+                            results[i]['status'] = 'error'
+                            results[i]['error'] = str(op_error)
+                        conn.execute('RELEASE batch_op')
+                conn.execute('RELEASE batch_run')
+
+            if atomic and any(result['status'] != 'ok' for result in results):
+                conn.rollback()
+                return rolled_back(results)
+
+            # Return the resulting rows for everything that still exists
+            touched = [r['id'] for r in results if r['status'] == 'ok' and r['op'] != 'delete']
+            rows = {}
+            for i in range(0, len(touched), SQL_CHUNK_SIZE):
+                chunk = touched[i:i + SQL_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                for row in conn.execute(f'''
+                    SELECT {TODO_COLUMNS}
+                    FROM todos t
+                    JOIN users u ON t.user_id = u.id
+                    WHERE t.id IN ({placeholders})
+                ''', chunk):
+                    rows[row['id']] = dict(row)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.exception("Error applying todo batch")
+            for result in results:
+                if result['status'] == 'ok':
+                    result['status'] = 'error'
+                    result['error'] = str(e)
+            return rolled_back(results)
+
+    for result in results:
+        if result['status'] == 'ok' and result['op'] != 'delete':
+            result['todo'] = rows.get(result['id'])
+    return {'committed': True, 'results': results}
+
+# Delta sync
+def get_todo_version(user_id: int) -> int:
+    """Current change version of a user's todo list (0 if never changed)."""
+    with get_connection() as conn:
+        row = conn.execute('SELECT version FROM todo_versions WHERE user_id = ?', (user_id,)).fetchone()
+        return row['version'] if row else 0
+
+def get_todo_versions(user_ids: List[int]) -> Dict[int, int]:
+    """Current change versions for several users; users never changed are left out."""
+    versions = {}
+    with get_connection() as conn:
+        for i in range(0, len(user_ids), SQL_CHUNK_SIZE):
+            chunk = user_ids[i:i + SQL_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            for row in conn.execute(
+                f'SELECT user_id, version FROM todo_versions WHERE user_id IN ({placeholders})', chunk
+            ):
+                versions[row['user_id']] = row['version']
+    return versions
+
+def get_todo_changes(user_id: int, since: int, limit: int = 500, cursor: Optional[int] = None) -> Dict:
+    """Todos changed and ids deleted after version ``since``, oldest first.
+
+    Everything is read from one snapshot, so ``version`` is consistent with
+    the rows returned. If ``since`` predates compacted tombstones the client
+    cannot be brought up to date incrementally; it then gets ``reset`` and the
+    full list instead, paged by id with ``cursor`` (see ``Repository``).
+    """
+    with get_connection() as conn:
+        conn.execute('BEGIN')
+        try:
+            row = conn.execute(
+                'SELECT version, tombstone_floor FROM todo_versions WHERE user_id = ?', (user_id,)
+            ).fetchone()
+            current, floor = (row['version'], row['tombstone_floor']) if row else (0, 0)
+
+            if cursor is not None or since < floor or since > current:
+                # Later pages come from later snapshots; changes since the
+                # first page's version catch the client up afterwards
+                todos = dict_rows(conn, f'''
+                    SELECT {TODO_COLUMNS}, t.version
+                    FROM todos t
+                    JOIN users u ON t.user_id = u.id
+                    WHERE t.user_id = ? AND t.id > ?
+                    ORDER BY t.id
+                    LIMIT ?
+                ''', (user_id, cursor or 0, limit + 1))
+                return reset_page(todos, limit, current if cursor is None else since, cursor)
+
+            changed = dict_rows(conn, f'''
+                SELECT {TODO_COLUMNS}, t.version
+                FROM todos t
+                JOIN users u ON t.user_id = u.id
+                WHERE t.user_id = ? AND t.version > ?
+                ORDER BY t.version
+                LIMIT ?
+            ''', (user_id, since, limit + 1))
+            deleted = [dict(r) for r in conn.execute('''
+                SELECT todo_id, version FROM todo_tombstones
+                WHERE user_id = ? AND version > ?
+                ORDER BY version
+                LIMIT ?
+            ''', (user_id, since, limit + 1))]
+        finally:
+            conn.rollback()
+
+    # Merge both streams in version order and cut at ``limit``
+    events = sorted(
+        [(todo['version'], todo) for todo in changed] + [(d['version'], d) for d in deleted],
+        key=lambda event: event[0]
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+    version = events[-1][0] if has_more else current
+    return {
+        'version': version,
+        'reset': False,
+        'todos': [event for _, event in events if 'todo_id' not in event],
+        'deleted': [event['todo_id'] for _, event in events if 'todo_id' in event],
+        'has_more': has_more,
+        'cursor': None,
+    }
+
+def compact_tombstones(retention_days: int = 30) -> int:
+    """Forget deletions older than ``retention_days``.
+
+    Each affected user's ``tombstone_floor`` is raised past the dropped
+    tombstones, so clients that last synced before then get a full reset.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    with get_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                UPDATE todo_versions
+                SET tombstone_floor = MAX(tombstone_floor, (
+                    SELECT MAX(version) FROM todo_tombstones tt
+                    WHERE tt.user_id = todo_versions.user_id AND tt.deleted_at < ?
+                ))
+                WHERE user_id IN (SELECT user_id FROM todo_tombstones WHERE deleted_at < ?)
+            ''', (cutoff, cutoff))
+            cursor = conn.execute('DELETE FROM todo_tombstones WHERE deleted_at < ?', (cutoff,))
+            conn.commit()
+            return cursor.rowcount
+        except Exception:
+            conn.rollback()
+            logger.exception("Error compacting tombstones")
+            return 0
+
+# Archive of long-completed todos (see migration 11)
+ARCHIVE_COLUMNS = 'id, title, description, completed, user_id, created_at, last_modified_at'
+
+def archive_todos(completed_before: datetime, limit: int = SQL_CHUNK_SIZE) -> Dict[int, int]:
+    """Move up to ``limit`` todos completed before ``completed_before`` to the archive.
+
+    One short write transaction per call; returns how many were archived per
+    user. The delete trigger bumps each owner's version and writes a
+    tombstone, so delta sync drops archived todos from a client's list like
+    any other removal, and the full-text index forgets them.
+    """
+    archived: Dict[int, int] = {}
+    with get_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            todo_ids = [row[0] for row in conn.execute(
+                'SELECT id FROM todos WHERE completed = 1 AND last_modified_at < ? LIMIT ?',
+                (completed_before, limit)
+            )]
+            now = datetime.utcnow()
+            for i in range(0, len(todo_ids), SQL_CHUNK_SIZE):
+                chunk = todo_ids[i:i + SQL_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                conn.execute(f'''
+                    INSERT INTO todos_archive ({ARCHIVE_COLUMNS}, archived_at)
+                    SELECT {ARCHIVE_COLUMNS}, ? FROM todos WHERE id IN ({placeholders})
+                ''', [now, *chunk])
+                for row in conn.execute(f'DELETE FROM todos WHERE id IN ({placeholders}) RETURNING user_id', chunk):
+                    archived[row[0]] = archived.get(row[0], 0) + 1
+            conn.commit()
+            return archived
+        except sqlite3.Error:
+            conn.rollback()
+            logger.exception("Error archiving todos")
+            return {}
+
+def unarchive_todos(conn: sqlite3.Connection, user_id: int, todo_ids: List[int]) -> int:
+    """Move the user's archived todos among ``todo_ids`` back, in the caller's transaction.
+
+    Edits go through this first, so an archived todo becomes active again
+    when changed. The insert trigger gives each a new version; their
+    archival tombstones are dropped so /todos/changes never reports a todo
+    as both deleted and changed.
+    """
+    restored = 0
+    for i in range(0, len(todo_ids), SQL_CHUNK_SIZE):
+        chunk = todo_ids[i:i + SQL_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        moved = conn.execute(f'''
+            INSERT INTO todos ({ARCHIVE_COLUMNS})
+            SELECT {ARCHIVE_COLUMNS} FROM todos_archive WHERE user_id = ? AND id IN ({placeholders})
+        ''', [user_id, *chunk]).rowcount
+        if moved:
+            conn.execute(f'DELETE FROM todos_archive WHERE user_id = ? AND id IN ({placeholders})', [user_id, *chunk])
+            conn.execute(
+                f'DELETE FROM todo_tombstones WHERE user_id = ? AND todo_id IN ({placeholders})', [user_id, *chunk]
+            )
+            restored += moved
+    return restored
+
+# Full-text search
+def build_search_query(user_id: int, text: str) -> Optional[str]:
+    """Turn free text into an FTS5 query scoped to one user.
+
+    Every word becomes a quoted prefix term, so FTS5 operators typed by the
+    user are matched literally and "gro mil" finds "groceries: milk".
+    """
+    words = [word.replace('"', '""') for word in text.split()]
+    if not words:
+        return None
+    terms = ' '.join(f'"{word}"*' for word in words)
+    return f'user_id:"{user_id}" AND ({terms})'
+
+def search_todos(user_id: int, text: str, limit: int = 20) -> List[Dict]:
+    """Best-ranked todos matching ``text``, with highlighted title and snippet."""
+    query = build_search_query(user_id, text)
+    if query is None:
+        return []
+    with get_connection() as conn:
+        try:
+            rows = conn.execute(f'''
+                SELECT
+                    {TODO_COLUMNS},
+                    highlight(todos_fts, 1, '<mark>', '</mark>') AS title_highlight,
+                    snippet(todos_fts, 2, '<mark>', '</mark>', '…', 12) AS snippet,
+                    bm25(todos_fts, 0.0, 10.0, 4.0) AS rank
+                FROM todos_fts
+                JOIN todos t ON t.id = todos_fts.rowid
+                JOIN users u ON t.user_id = u.id
+                WHERE todos_fts MATCH ? AND t.user_id = ?
+                ORDER BY rank
+                LIMIT ?
+            ''', (query, user_id, limit)).fetchall()
+            return [dict(row) for row in rows]
+        except sqlite3.OperationalError as e:
+            logger.warning("Error searching todos", extra={"error": str(e)})
+            return []
+
+def rebuild_search_index() -> None:
+    """Rebuild the full-text index from the todos table and merge its segments."""
+    with get_connection() as conn:
+        conn.execute("INSERT INTO todos_fts (todos_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO todos_fts (todos_fts) VALUES ('optimize')")
+        conn.commit()
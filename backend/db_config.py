@@ -1,5 +1,4 @@
-import motor.motor_asyncio
-from bson import ObjectId
+import functools
 import os
 from dotenv import load_dotenv
 from pathlib import Path
@@ -28,8 +27,20 @@ if ENV == "production":
 DATABASE_URL = f"sqlite:///{DB_PATH}"
 
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb+srv://your-mongodb-url")
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URL)
-db = client.taskmaster
+MONGODB_DATABASE = os.getenv("MONGODB_DATABASE", "taskmaster")
+
+@functools.lru_cache(maxsize=None)
+def get_client():
+    """The shared motor client, created (and motor/pymongo imported) on first use.
+
+    Call from inside the event loop, e.g. the app's lifespan; an ``srv`` URL
+    is resolved here rather than at import.
+    """
+    import motor.motor_asyncio
+    return motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URL)
+
+def get_db():
+    return get_client()[MONGODB_DATABASE]
 
 # Helper function to convert MongoDB _id to string
 def serialize_id(item):
@@ -38,7 +49,6 @@ def serialize_id(item):
         del item['_id']
     return item
 
-# Collections
-users_collection = db.users
-todos_collection = db.todos
-sessions_collection = db.sessions 
\ No newline at end of file
+# Collections: users, todos, sessions, revoked_tokens, todo_versions and
+# todo_tombstones, plus counters holding integer id sequences, since the
+# API's ids are ints rather than ObjectIds. Use get_db().<name>.
@@ -0,0 +1,164 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the pool timeout."""
+
+
+class ConnectionPool:
+    """A fixed-size pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to ``size`` and then reused for the life
+    of the process, so PRAGMAs and the per-connection page cache are paid for
+    once instead of on every request. Idle connections are handed out LIFO so
+    the most recently used (and warmest) connection is reused first.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 8,
+        timeout: float = 30.0,
+        busy_timeout: float = 5.0,
+        pragmas: Optional[Dict[str, object]] = None,
+        factory: Optional[type] = None,
+    ):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout = busy_timeout
+        self.pragmas = dict(pragmas or {})
+        # sqlite3.Connection subclass to open, e.g. one that times statements
+        self.factory = factory or sqlite3.Connection
+
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._closed = False
+
+        # Stats
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._high_water = 0
+        self._timeouts = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, timeout=self.busy_timeout, check_same_thread=False, factory=self.factory
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Check a connection out of the pool, opening one if below ``size``."""
+        start = time.perf_counter()
+        blocked = False
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                blocked = True
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(
+                        f"No SQLite connection available after {self.timeout}s (pool size {self.size})"
+                    )
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._high_water = max(self._high_water, self._in_use)
+            if blocked:
+                self._waits += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Return a connection, rolling back anything its user left open."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # The connection is unusable; drop it so a fresh one is opened.
+            with self._lock:
+                self._in_use -= 1
+                self._created -= 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return
+        with self._lock:
+            self._in_use -= 1
+            closed = self._closed
+            if closed:
+                self._created -= 1
+            else:
+                # Under the lock so close() cannot drain the queue in between
+                self._idle.put(conn)
+        if closed:
+            conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'in_use': self._in_use,
+                'idle': self._created - self._in_use,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_seconds_total': round(self._wait_total, 6),
+                'wait_seconds_max': round(self._wait_max, 6),
+                'high_water': self._high_water,
+                'timeouts': self._timeouts,
+            }
+
+    def close(self) -> None:
+        """Close every idle connection now and the checked-out ones as they are released."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
@@ -0,0 +1,145 @@
+"""Per-user change notifications for the /todos/stream endpoint.
+
+A notification only says "this user's todos changed"; the stream then reads
+what changed since the version it last sent via ``get_todo_changes``. That
+makes backpressure free: however many writes happen while a client is slow,
+its subscription holds a single pending flag, and the next read picks all of
+them up in one batch.
+
+Brokers:
+    memory  (default) in-process only; enough for a single worker
+    sqlite  also polls ``todo_versions`` for the users with open streams, so
+            writes made by other workers (or hosts sharing the file) reach
+            this worker's streams within CHANGE_POLL_INTERVAL seconds
+
+Anything else (Redis pub/sub, Postgres LISTEN/NOTIFY) can be added by
+implementing ``ChangeBroker``.
+"""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Set
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self._event = asyncio.Event()
+
+    def notify(self) -> None:
+        self._event.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for a change notification; False if ``timeout`` passed first."""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._event.clear()
+        return True
+
+
+class ChangeBroker:
+    """Fan-out of change notifications to subscribed streams."""
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def subscribe(self, user_id: int) -> Subscription:
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        raise NotImplementedError
+
+    def publish(self, user_id: int) -> None:
+        raise NotImplementedError
+
+    def subscriber_count(self, user_id: int) -> int:
+        raise NotImplementedError
+
+
+class InProcessBroker(ChangeBroker):
+    def __init__(self):
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        metrics.CHANGE_STREAMS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions and subscription in subscriptions:
+            subscriptions.discard(subscription)
+            metrics.CHANGE_STREAMS.dec()
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_id: int) -> None:
+        for subscription in self._subscriptions.get(user_id, ()):
+            subscription.notify()
+
+    def subscriber_count(self, user_id: int) -> int:
+        return len(self._subscriptions.get(user_id, ()))
+
+    def subscribed_users(self) -> List[int]:
+        return list(self._subscriptions)
+
+
+class SQLitePollingBroker(InProcessBroker):
+    """In-process fan-out plus polling for writes made by other workers.
+
+    One query per interval covers every user with an open stream in this
+    worker, and nothing is polled while there are none.
+    """
+
+    def __init__(self, fetch_versions: Callable[[List[int]], Awaitable[Dict[int, int]]], interval: float = 0.5):
+        super().__init__()
+        self.fetch_versions = fetch_versions
+        self.interval = interval
+        self._versions: Dict[int, int] = {}
+        self._task = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            users = self.subscribed_users()
+            if not users:
+                self._versions.clear()
+                continue
+            try:
+                versions = await self.fetch_versions(users)
+            except Exception:
+                logger.exception("Polling todo versions failed")
+                continue
+            for user_id, version in versions.items():
+                if self._versions.get(user_id) != version:
+                    self._versions[user_id] = version
+                    self.publish(user_id)
+            # Forget users whose streams have closed
+            for user_id in set(self._versions) - set(users):
+                del self._versions[user_id]
+
+
+def broker_from_env(fetch_versions: Callable[[List[int]], Awaitable[Dict[int, int]]]) -> ChangeBroker:
+    kind = os.getenv("CHANGE_BROKER", "memory")
+    if kind == "sqlite":
+        return SQLitePollingBroker(fetch_versions, float(os.getenv("CHANGE_POLL_INTERVAL", "0.5")))
+    if kind != "memory":
+        raise ValueError(f"Unknown CHANGE_BROKER {kind!r} (expected 'memory' or 'sqlite')")
+    return InProcessBroker()
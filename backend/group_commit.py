@@ -0,0 +1,202 @@
+"""Group commit: one writer thread that commits many small writes at once.
+
+In WAL mode readers never block on the writer, so what limits write
+throughput is the commit itself: one fsync (and one write-lock handoff) per
+toggled checkbox. With SQLITE_GROUP_COMMIT=1 write helpers are instead queued
+to a single writer thread, which runs every write that arrives within
+SQLITE_GROUP_COMMIT_WINDOW_MS in one transaction and commits once. Each
+write runs in its own savepoint, so a failing write is rolled back on its own
+without affecting the rest of the group, and every caller is only answered
+after the shared COMMIT has returned, i.e. once its write is durable.
+
+The write helpers in database.py do not need to know about any of this:
+inside the writer thread ``get_connection()`` hands them the writer's
+connection, on which ``commit()`` is deferred to the end of the group,
+``rollback()`` only undoes the helper's own savepoint, and ``BEGIN`` is a
+no-op.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+GROUP_SAVEPOINT = "group_job"
+
+
+class GroupCommitConnection(metrics.connection_factory() or sqlite3.Connection):
+    in_group = False
+
+    def commit(self):
+        if not self.in_group:
+            super().commit()
+
+    def rollback(self):
+        if self.in_group:
+            sqlite3.Connection.execute(self, f"ROLLBACK TO {GROUP_SAVEPOINT}")
+        else:
+            super().rollback()
+
+    def execute(self, sql, parameters=()):
+        if self.in_group and sql.lstrip()[:5].upper() == "BEGIN":
+            return self.cursor()
+        return super().execute(sql, parameters)
+
+
+class GroupCommitWriter:
+    def __init__(
+        self,
+        path: str,
+        window: float = 0.002,
+        max_batch: int = 256,
+        busy_timeout: float = 5.0,
+        pragmas: Optional[Dict[str, object]] = None,
+        checkpoint_interval: float = 0.0,
+        checkpoint_mode: str = "PASSIVE",
+    ):
+        self.path = path
+        self.window = window
+        self.max_batch = max_batch
+        self.busy_timeout = busy_timeout
+        self.pragmas = dict(pragmas or {})
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_mode = checkpoint_mode
+
+        self._queue: "queue.SimpleQueue[Tuple[Callable, Future]]" = queue.SimpleQueue()
+        self._local = threading.local()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._conn: Optional[GroupCommitConnection] = None
+        self._last_checkpoint = time.monotonic()
+
+    def current_connection(self) -> Optional[sqlite3.Connection]:
+        """The group's connection when called from inside a queued write."""
+        return getattr(self._local, "conn", None)
+
+    def submit(self, func: Callable) -> Future:
+        """Queue ``func()`` to run in the next group; the future resolves after COMMIT."""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                    self._thread.start()
+        future: Future = Future()
+        self._queue.put((func, future))
+        return future
+
+    def _connect(self) -> GroupCommitConnection:
+        conn = sqlite3.connect(
+            self.path, timeout=self.busy_timeout, check_same_thread=False, factory=GroupCommitConnection
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _collect(self) -> List[Tuple[Callable, Future]]:
+        timeout = self.checkpoint_interval or None
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch:
+                try:
+                    self._commit_group(batch)
+                except Exception as e:
+                    logger.exception("Group commit failed", extra={"batch_size": len(batch)})
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    self._reset_connection()
+            if self.checkpoint_interval and time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+                self._checkpoint()
+
+    def _reset_connection(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+    def _commit_group(self, batch: List[Tuple[Callable, Future]]) -> None:
+        if self._conn is None:
+            self._conn = self._connect()
+        conn = self._conn
+        start = time.perf_counter()
+        sqlite3.Connection.execute(conn, "BEGIN IMMEDIATE")
+        metrics.DB_WRITE_LOCK_WAIT.observe(time.perf_counter() - start)
+
+        outcomes = []
+        conn.in_group = True
+        self._local.conn = conn
+        try:
+            for func, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                sqlite3.Connection.execute(conn, f"SAVEPOINT {GROUP_SAVEPOINT}")
+                try:
+                    outcomes.append((future, func(), None))
+                except BaseException as e:
+                    outcomes.append((future, None, e))
+                    if conn.in_transaction:
+                        sqlite3.Connection.execute(conn, f"ROLLBACK TO {GROUP_SAVEPOINT}")
+                if not conn.in_transaction:
+                    # A hard error aborted the whole transaction; everything
+                    # before it is gone, so fail those writes and carry on
+                    # with a new transaction for the rest.
+                    lost = sqlite3.OperationalError("group transaction aborted by another write")
+                    outcomes = [(f, None, err or lost) for f, _, err in outcomes]
+                    for f, _, err in outcomes:
+                        f.set_exception(err)
+                    outcomes = []
+                    sqlite3.Connection.execute(conn, "BEGIN IMMEDIATE")
+                    continue
+                sqlite3.Connection.execute(conn, f"RELEASE {GROUP_SAVEPOINT}")
+        finally:
+            conn.in_group = False
+            self._local.conn = None
+
+        commit_start = time.perf_counter()
+        conn.commit()
+        metrics.GROUP_COMMIT_LATENCY.observe(time.perf_counter() - commit_start)
+        metrics.GROUP_COMMIT_BATCH_SIZE.observe(len(batch))
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _checkpoint(self) -> None:
+        self._last_checkpoint = time.monotonic()
+        if self._conn is None:
+            return
+        try:
+            busy, log_pages, checkpointed = self._conn.execute(
+                f"PRAGMA wal_checkpoint({self.checkpoint_mode})"
+            ).fetchone()
+            metrics.WAL_CHECKPOINTS.inc(self.checkpoint_mode)
+            logger.debug("WAL checkpoint", extra={
+                "mode": self.checkpoint_mode, "busy": busy, "log_pages": log_pages,
+                "checkpointed": checkpointed, "event": "db.checkpoint",
+            })
+        except sqlite3.Error:
+            logger.exception("WAL checkpoint failed")
@@ -0,0 +1,192 @@
+"""Structured, non-blocking logging.
+
+Call ``configure_logging()`` once at startup. Records are put on an in-memory
+queue by the calling thread and formatted and written by a background
+listener thread, so request handlers never block on stdout.
+
+Environment:
+    LOG_LEVEL         root level (default INFO)
+    LOG_LEVELS        per-logger levels, e.g. "database=DEBUG,uvicorn.access=WARNING"
+    LOG_FORMAT        "json" (default) or "text"
+    LOG_SAMPLE_RATES  keep only a fraction of high-frequency events, e.g.
+                      "auth.session=0.01,uvicorn.access=0.1". Keys match a
+                      record's ``event`` extra, falling back to the logger name.
+    LOG_QUEUE         set to 0 to write synchronously (for comparison/debugging)
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from typing import Dict, Optional
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed via ``extra``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Drop all but a fraction of records for configured events.
+
+    Warnings and errors are never sampled out.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.rates or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "event", None) or record.name)
+        return rate is None or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Formatted before queueing; see QueueHandler.prepare
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Queue records with the traceback kept apart from the message.
+
+    The stdlib ``prepare`` formats the whole record, traceback included, into
+    ``msg`` and clears ``exc_info``, so formatters on the listener side could
+    not tell the two apart. Here the traceback is formatted in the calling
+    thread (the frames are gone once it returns) into ``exc_text``, which
+    JsonFormatter emits as ``exc_info`` and text formatting appends as usual.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_pairs(value: str) -> Dict[str, str]:
+    pairs = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, _, val = item.partition("=")
+            pairs[key.strip()] = val.strip()
+    return pairs
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    use_queue: Optional[bool] = None,
+    stream=None,
+) -> None:
+    """Install the queue-backed handler on the root logger (idempotent)."""
+    global _listener
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+    if use_queue is None:
+        use_queue = os.getenv("LOG_QUEUE", "1") != "0"
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    if fmt == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    if use_queue:
+        handler: logging.Handler = QueueHandler(queue.SimpleQueue())
+        _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+    else:
+        handler = output
+
+    # Filters run in the calling thread, before anything is queued
+    handler.addFilter(RequestIdFilter())
+    rates = {key: float(rate) for key, rate in _parse_pairs(os.getenv("LOG_SAMPLE_RATES", "")).items()}
+    handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+
+    # Route uvicorn's loggers through the same handler
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    for name, logger_level in _parse_pairs(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(logger_level.upper())
+
+
+class RequestIdMiddleware:
+    """Tag each request with an id (from X-Request-ID or freshly generated).
+
+    The id is attached to every log record emitted while handling the
+    request and echoed back in the X-Request-ID response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
@@ -1,15 +1,157 @@
-from fastapi import FastAPI, HTTPException, Response, Cookie, Depends
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Response, Cookie, Depends, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
-import sqlite3
-from datetime import datetime
-from database import (
-    create_user, verify_user, init_db as init_database,
-    create_session, delete_session, verify_session
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, EmailStr, Field, model_validator
+from starlette.datastructures import UploadFile
+from typing import List, Literal, Optional
+from datetime import datetime, timedelta, timezone
+from logging_config import configure_logging, RequestIdMiddleware
+import metrics
+from profiling import profiler_from_env
+from repository import (
+    SESSION_TTL, SESSION_RENEW_INTERVAL, TodoConflict, decode_cursor, next_cursor, repository_from_env
 )
+import passwords
+from passwords import PasswordHashBusy, hash_password, check_password, needs_rehash
+from throttle import limiter_from_env
+from events import broker_from_env
+import tokens
+import transfer
+from serialization import FAST_SERIALIZATION, body_response, dumps, json_response, todo_payloads
+from read_cache import TodoReads
+from cache import TTLCache
+import asyncio
+import csv
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+# Configure logging before anything below logs at import time
+configure_logging()
+
+logger = logging.getLogger(__name__)
+
+# Storage backend chosen by STORAGE_BACKEND; see repository.py
+repo = repository_from_env()
+
+# Login/signup rate limits; see throttle.py
+auth_limiter = limiter_from_env()
+
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+SESSION_SWEEP_BATCH_SIZE = int(os.getenv("SESSION_SWEEP_BATCH_SIZE", "500"))
+# Pause between batches so waiting writers can take the lock
+SESSION_SWEEP_PAUSE = float(os.getenv("SESSION_SWEEP_PAUSE", "0.05"))
+
+async def sweep_expired_sessions() -> int:
+    start = time.perf_counter()
+    swept = 0
+    while True:
+        deleted = await repo.delete_expired_sessions(SESSION_SWEEP_BATCH_SIZE)
+        swept += deleted
+        if deleted < SESSION_SWEEP_BATCH_SIZE:
+            break
+        await asyncio.sleep(SESSION_SWEEP_PAUSE)
+    metrics.SESSIONS_SWEPT.inc(amount=swept)
+    metrics.SESSION_SWEEP_LATENCY.observe(time.perf_counter() - start)
+    if swept:
+        logger.info("Swept expired sessions", extra={"count": swept, "event": "sessions.sweep"})
+    if tokens.SIGNING_KEYS:
+        while await repo.delete_expired_revocations(SESSION_SWEEP_BATCH_SIZE) >= SESSION_SWEEP_BATCH_SIZE:
+            await asyncio.sleep(SESSION_SWEEP_PAUSE)
+    await auth_limiter.prune()
+    return swept
+
+async def session_sweeper():
+    while True:
+        try:
+            await sweep_expired_sessions()
+        except Exception:
+            logger.exception("Session sweep failed")
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+
+# Todos completed more than TODO_ARCHIVE_AFTER_DAYS ago are moved to the
+# archive every TODO_ARCHIVE_INTERVAL seconds, TODO_ARCHIVE_BATCH_SIZE per
+# transaction, so the active todos and their indexes stay small enough to
+# remain in SQLite's page cache. 0 for either turns archiving off.
+TODO_ARCHIVE_AFTER_DAYS = float(os.getenv("TODO_ARCHIVE_AFTER_DAYS", "30"))
+TODO_ARCHIVE_INTERVAL = float(os.getenv("TODO_ARCHIVE_INTERVAL", "3600"))
+TODO_ARCHIVE_BATCH_SIZE = int(os.getenv("TODO_ARCHIVE_BATCH_SIZE", "500"))
+TODO_ARCHIVE_PAUSE = float(os.getenv("TODO_ARCHIVE_PAUSE", "0.05"))
+
+async def archive_completed_todos() -> int:
+    completed_before = datetime.utcnow() - timedelta(days=TODO_ARCHIVE_AFTER_DAYS)
+    total = 0
+    while True:
+        archived = await repo.archive_todos(completed_before, TODO_ARCHIVE_BATCH_SIZE)
+        for user_id in archived:
+            todos_changed(user_id)
+        count = sum(archived.values())
+        total += count
+        if count < TODO_ARCHIVE_BATCH_SIZE:
+            break
+        await asyncio.sleep(TODO_ARCHIVE_PAUSE)
+    metrics.TODOS_ARCHIVED.inc(amount=total)
+    if total:
+        logger.info("Archived completed todos", extra={"count": total, "event": "todos.archive"})
+    return total
+
+async def todo_archiver():
+    while True:
+        try:
+            await archive_completed_todos()
+        except Exception:
+            logger.exception("Todo archiving failed")
+        await asyncio.sleep(TODO_ARCHIVE_INTERVAL)
+
+# How often each worker picks up token revocations made by other workers
+DENY_LIST_REFRESH_INTERVAL = float(os.getenv("DENY_LIST_REFRESH_INTERVAL", "5"))
+
+async def refresh_deny_list():
+    tokens.deny_list.load(await repo.get_revoked_tokens(tokens.deny_list.last_id))
+
+async def deny_list_refresher():
+    while True:
+        await asyncio.sleep(DENY_LIST_REFRESH_INTERVAL)
+        try:
+            await refresh_deny_list()
+        except Exception:
+            logger.exception("Deny-list refresh failed")
+
+# Notifies open /todos/stream connections; see events.py
+changes_broker = broker_from_env(repo.get_todo_versions)
+# Coalesces identical GET /todos/ reads; see read_cache.py
+todo_reads = TodoReads()
+
+def todos_changed(user_id: int) -> None:
+    """Call after every committed write to a user's todos."""
+    todo_reads.invalidate(user_id)
+    changes_broker.publish(user_id)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await repo.start()
+    await changes_broker.start()
+    tasks = []
+    if SESSION_SWEEP_INTERVAL > 0:
+        tasks.append(asyncio.create_task(session_sweeper()))
+    if TODO_ARCHIVE_INTERVAL > 0 and TODO_ARCHIVE_AFTER_DAYS > 0:
+        tasks.append(asyncio.create_task(todo_archiver()))
+    if tokens.SIGNING_KEYS:
+        await refresh_deny_list()
+        tasks.append(asyncio.create_task(deny_list_refresher()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await changes_broker.stop()
+    await repo.close()
+    passwords.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # Update CORS configuration
 app.add_middleware(
@@ -23,7 +165,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Request-ID"],
 )
+if metrics.METRICS_ENABLED:
+    app.add_middleware(
+        metrics.MetricsMiddleware, profiler=profiler_from_env(), unprofiled_paths={"/todos/stream"},
+    )
+app.add_middleware(RequestIdMiddleware)
+
+def too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(math.ceil(retry_after))})
+
+@app.exception_handler(PasswordHashBusy)
+async def password_hash_busy(request: Request, exc: PasswordHashBusy):
+    # Shed rather than queue: the client retries once the bcrypt backlog has cleared
+    error = too_many_requests("Too many sign-ins in progress, try again shortly", exc.retry_after)
+    return JSONResponse(status_code=error.status_code, content={"detail": error.detail}, headers=error.headers)
+
+@app.exception_handler(TodoConflict)
+async def todo_conflict(request: Request, exc: TodoConflict):
+    return JSONResponse(status_code=409, content={"detail": "Todo was changed since your version"})
 
 # Models
 class UserCreate(BaseModel):
@@ -53,46 +214,206 @@ class Todo(BaseModel):
 class UpdateAllTodosRequest(BaseModel):
     completed: bool
 
-# Initialize database
-init_database()
+class BatchOperation(BaseModel):
+    op: Literal["create", "update", "patch", "delete"]
+    id: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    completed: Optional[bool] = None
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if self.op != "create" and self.id is None:
+            raise ValueError(f"'{self.op}' operations need an id")
+        if self.op in ("create", "update") and self.title is None:
+            raise ValueError(f"'{self.op}' operations need a title")
+        if self.op == "patch" and self.completed is None:
+            raise ValueError("'patch' operations need completed")
+        return self
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=5000)
+    mode: Literal["atomic", "best_effort"] = "atomic"
+
+class BatchResult(BaseModel):
+    index: int
+    op: str
+    status: Literal["ok", "not_found", "error"]
+    id: Optional[int] = None
+    error: Optional[str] = None
+    todo: Optional[Todo] = None
+
+class BatchResponse(BaseModel):
+    committed: bool
+    results: List[BatchResult]
+
+class TodoSearchResult(Todo):
+    title_highlight: str
+    snippet: Optional[str] = None
+    rank: float
+
+class BulkUpdateResult(BaseModel):
+    completed: bool
+    status: Literal["done", "running", "failed"] = "done"
+    updated: int
+    # Ids of the changed todos; omitted for background jobs
+    ids: List[int] = []
+    job_id: Optional[str] = None
+
+class TodoChanges(BaseModel):
+    version: int
+    reset: bool = False
+    todos: List[Todo]
+    deleted: List[int]
+    has_more: bool = False
+    # Set while a reset has more pages; pass back with ``version``
+    cursor: Optional[int] = None
 
 # Authentication dependency
-async def get_current_user(session_token: str = Cookie(None)) -> User:
-    print(f"Checking authentication with token: {session_token}")
+def set_session_cookie(response: Response, session_token: str, max_age: int) -> None:
+    response.set_cookie(
+        key="session_token",
+        value=session_token,
+        httponly=True,
+        secure=False,  # Set to False for development
+        samesite="lax",  # Changed from strict to lax
+        max_age=max_age
+    )
+
+def authenticate_signed_token(response: Response, session_token: str) -> User:
+    """Authenticate a signed token without touching the database."""
+    claims = tokens.decode_token(session_token) if tokens.SIGNING_KEYS else None
+    if claims is None or tokens.session_id(claims) in tokens.deny_list:
+        metrics.SESSION_LOOKUPS.inc("invalid")
+        raise HTTPException(status_code=401, detail="Session expired or invalid")
+    metrics.SESSION_LOOKUPS.inc("signed")
+    user = tokens.user_from_claims(claims)
+    remaining = claims["exp"] - time.time()
+    if SESSION_RENEW_INTERVAL and remaining < (SESSION_TTL - SESSION_RENEW_INTERVAL).total_seconds():
+        # Sliding expiry: hand out a fresh token in the same session; the old
+        # one lapses on its own
+        renewed, _ = tokens.issue_token(user, SESSION_TTL, tokens.session_id(claims))
+        set_session_cookie(response, renewed, int(SESSION_TTL.total_seconds()))
+        metrics.SESSIONS_RENEWED.inc()
+    return User(**user)
+
+async def get_current_user(response: Response, session_token: str = Cookie(None)) -> User:
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
+    if tokens.is_signed_token(session_token):
+        return authenticate_signed_token(response, session_token)
     
-    user = verify_session(session_token)
-    print(f"Verified session result: {user}")
+    user = repo.get_cached_session(session_token)
+    if user is not None:
+        metrics.SESSION_LOOKUPS.inc("cache")
+    else:
+        user = await repo.verify_session(session_token)
+        metrics.SESSION_LOOKUPS.inc("db" if user else "invalid")
     if not user:
         raise HTTPException(status_code=401, detail="Session expired or invalid")
+    if 'session_expires_at' in user:
+        # The session's expiry slid forward; keep the cookie alive with it
+        set_session_cookie(response, session_token, int(SESSION_TTL.total_seconds()))
     
+    # Emitted on every authenticated request; sample it via LOG_SAMPLE_RATES
+    logger.debug("Session verified", extra={"user_id": user['id'], "event": "auth.session"})
     return User(**user)
 
+# Conditional reads. A user's todo version changes on every write to their
+# list, so it works as a weak validator for any todo read of that user and
+# costs one primary-key lookup instead of a query over todos.
+def todo_etag(user_id: int, version: int) -> str:
+    return f'W/"{user_id}.{version}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison: W/"x" and "x" match
+    return "*" in candidates or any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
+
+async def conditional_read(user_id: int, if_none_match: Optional[str], response: Response) -> Optional[Response]:
+    """Return a 304 response if the client's copy is current, else tag ``response``.
+
+    The version is read before the data, so a concurrent write can only make
+    the returned ETag older than the body (costing one extra refetch), never
+    newer.
+    """
+    return tag_response(user_id, await repo.get_todo_version(user_id), if_none_match, response)
+
+def tag_response(user_id: int, version: int, if_none_match: Optional[str], response: Response) -> Optional[Response]:
+    etag = todo_etag(user_id, version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# Conditional writes. If-Match takes the ETag of a todo read, or the version
+# from /todos/changes; a PATCH, PUT or DELETE of one todo then only applies
+# if that todo has not changed since, and gets a 409 otherwise. Changes to
+# the user's other todos in between do not conflict.
+def if_match_version(user_id: int, if_match: Optional[str]) -> Optional[int]:
+    if not if_match or if_match.strip() == "*":
+        return None
+    owner, _, version = if_match.strip().removeprefix("W/").strip('"').rpartition(".")
+    if not version.isdigit() or owner not in ("", str(user_id)):
+        raise HTTPException(status_code=400, detail="If-Match must be a todo ETag or version")
+    return int(version)
+
+def client_ip(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
+async def rehash_password(user_id: int, password: str) -> None:
+    """Re-hash with the current BCRYPT_ROUNDS after a successful login."""
+    try:
+        password_hash = await hash_password(password)
+    except PasswordHashBusy:
+        return  # next login tries again
+    if await repo.update_password_hash(user_id, password_hash):
+        metrics.PASSWORD_REHASHES.inc()
+        logger.info("Password rehashed", extra={"user_id": user_id, "event": "auth.rehash"})
+
 @app.post("/auth/signup", response_model=User)
-async def signup(user: UserCreate):
-    print(f"Attempting to create user: {user.username}")
-    result = create_user(user.username, user.email, user.password)
+async def signup(user: UserCreate, request: Request):
+    retry_after = await auth_limiter.check(signup_ip=client_ip(request))
+    if retry_after:
+        raise too_many_requests("Too many signups, try again later", retry_after)
+    password_hash = await hash_password(user.password)
+    result = await repo.create_user(user.username, user.email, password_hash)
     if result is None:
         raise HTTPException(
             status_code=409,
             detail="Username or email already exists"
         )
-    print(f"User created successfully: {result}")
     return result
 
 @app.post("/auth/login", response_model=User)
-async def login(user: UserLogin, response: Response):
-    print(f"Attempting to verify user: {user.username}")
-    result = verify_user(user.username, user.password)
+async def login(user: UserLogin, request: Request, response: Response, background_tasks: BackgroundTasks):
+    retry_after = await auth_limiter.check(login_ip=client_ip(request), login_user=user.username.casefold())
+    if retry_after:
+        logger.warning("Login throttled", extra={"username": user.username, "event": "auth.login_throttled"})
+        raise too_many_requests("Too many login attempts, try again later", retry_after)
+    credentials = await repo.get_user_credentials(user.username)
+    result = None
+    if credentials and await check_password(user.password, credentials['password_hash']):
+        result = {
+            'id': credentials['id'],
+            'username': credentials['username'],
+            'email': credentials['email']
+        }
     if result is None:
+        logger.warning("Failed login", extra={"username": user.username, "event": "auth.login_failed"})
         raise HTTPException(
             status_code=401,
             detail="Invalid username or password"
         )
     
     # Create session token
-    session_token = create_session(result['id'])
+    if tokens.signed_tokens_enabled():
+        session_token, _ = tokens.issue_token(result, SESSION_TTL)
+    else:
+        session_token = await repo.create_session(result['id'])
     if not session_token:
         raise HTTPException(
             status_code=500,
@@ -100,17 +421,13 @@ async def login(user: UserLogin, response: Response):
         )
     
     # Set session cookie
-    response.set_cookie(
-        key="session_token",
-        value=session_token,
-        httponly=True,
-        secure=False,  # Set to False for development
-        samesite="lax",  # Changed from strict to lax
-        max_age=7 * 24 * 60 * 60  # 7 days
-    )
+    set_session_cookie(response, session_token, int(SESSION_TTL.total_seconds()))
     
-    print(f"User verified successfully: {result}")
-    print(f"Session token created: {session_token}")
+    if needs_rehash(credentials['password_hash']):
+        # After the response, so the login itself only pays for one bcrypt
+        background_tasks.add_task(rehash_password, result['id'], user.password)
+
+    logger.info("User logged in", extra={"user_id": result['id'], "event": "auth.login"})
     return result
 
 @app.post("/auth/logout")
@@ -118,9 +435,17 @@ async def logout(
     response: Response,
     session_token: str = Cookie(None)
 ):
-    if session_token:
+    if session_token and tokens.is_signed_token(session_token):
+        claims = tokens.decode_token(session_token) if tokens.SIGNING_KEYS else None
+        if claims:
+            # Deny the whole session until any token of it, including ones
+            # renewed elsewhere up to now, would have expired anyway
+            sid, expires_at = tokens.session_id(claims), time.time() + SESSION_TTL.total_seconds()
+            tokens.deny_list.add(sid, expires_at)
+            await repo.revoke_token(sid, datetime.fromtimestamp(expires_at, timezone.utc).replace(tzinfo=None))
+    elif session_token:
         # Delete the session from database
-        delete_session(session_token)
+        await repo.delete_session(session_token)
     
     # Clear the session cookie
     response.delete_cookie(
@@ -132,129 +457,380 @@ async def logout(
     
     return {"message": "Logged out successfully"}
 
+@app.get("/health")
+async def health():
+    return {"status": "ok", "storage_backend": repo.name, **repo.stats(), "todo_reads": todo_reads.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/todos/", response_model=List[Todo])
-async def get_todos(current_user: User = Depends(get_current_user)):
-    conn = sqlite3.connect('todos.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM todos WHERE user_id = ?', (current_user.id,))
-    todos = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return todos
+async def get_todos(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    completed: Optional[bool] = None,
+    modified_since: Optional[datetime] = None,
+    include_archived: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    """List todos. With ``limit``, returns one page and sets ``X-Next-Cursor``.
 
-@app.post("/todos/", response_model=Todo)
-async def create_todo(todo: TodoCreate, current_user: User = Depends(get_current_user)):
-    conn = sqlite3.connect('todos.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        'INSERT INTO todos (title, description, user_id) VALUES (?, ?, ?)',
-        (todo.title, todo.description, current_user.id)
+    Todos archived after TODO_ARCHIVE_AFTER_DAYS are only listed with
+    ``include_archived``, among the completed ones; ``GET /todos/{id}``
+    finds them either way and editing one makes it active again.
+
+    Identical concurrent reads of the same version share one query and one
+    encoded body (see read_cache.py).
+    """
+    version = await repo.get_todo_version(current_user.id)
+    not_modified = tag_response(current_user.id, version, if_none_match, response)
+    if not_modified:
+        return not_modified
+
+    after = None
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    if modified_since is not None and modified_since.tzinfo is not None:
+        modified_since = modified_since.astimezone(timezone.utc).replace(tzinfo=None)
+
+    async def load():
+        todos = await repo.get_user_todos(
+            current_user.id,
+            limit=limit, cursor=after, completed=completed, modified_since=modified_since,
+            include_archived=include_archived
+        )
+        return (dumps(todo_payloads(todos)) if FAST_SERIALIZATION else todos), next_cursor(todos, limit)
+
+    params = (limit, after, completed, modified_since, include_archived)
+    body, page_cursor = await todo_reads.get(current_user.id, version, params, load)
+    if page_cursor:
+        response.headers["X-Next-Cursor"] = page_cursor
+    if FAST_SERIALIZATION:
+        return body_response(body, response)
+    return body
+
+@app.get("/todos/changes", response_model=TodoChanges)
+async def get_changes(
+    response: Response,
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    cursor: Optional[int] = Query(None, ge=0),
+    current_user: User = Depends(get_current_user)
+):
+    """Todos changed and ids deleted since ``since``; pass back ``version`` next time.
+
+    When ``reset`` is true the client's copy is too old to patch and
+    ``todos`` starts the complete list instead, ``limit`` todos at a time:
+    while ``has_more``, pass back ``cursor`` too and add the todos of each
+    page to the list.
+    """
+    changes = await repo.get_todo_changes(current_user.id, since, limit, cursor)
+    if FAST_SERIALIZATION:
+        return json_response({**changes, 'todos': todo_payloads(changes['todos'])}, response)
+    return changes
+
+STREAM_HEARTBEAT_INTERVAL = float(os.getenv("STREAM_HEARTBEAT_INTERVAL", "15"))
+# Streams end after this long; EventSource reconnects (re-authenticating)
+# and resumes from the last event id
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", "3600"))
+STREAM_MAX_PER_USER = int(os.getenv("STREAM_MAX_PER_USER", "10"))
+STREAM_BATCH_LIMIT = 500
+
+def sse_event(event: str, data, event_id: Optional[int] = None) -> str:
+    metrics.CHANGE_EVENTS.inc(event)
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {dumps(data).decode()}"]
+    return "\n".join(lines) + "\n\n"
+
+async def change_events(user_id: int, since: Optional[int], subscription):
+    deadline = time.monotonic() + STREAM_MAX_SECONDS
+    try:
+        # Tell EventSource how soon to reconnect after the stream ends
+        yield "retry: 2000\n\n"
+        if since is None:
+            since = await repo.get_todo_version(user_id)
+            yield sse_event("ready", {"version": since}, since)
+        cursor = None
+        while time.monotonic() < deadline:
+            changes = await repo.get_todo_changes(user_id, since, STREAM_BATCH_LIMIT, cursor)
+            if changes['reset'] or changes['todos'] or changes['deleted']:
+                # No event id until a paged reset is complete, so a
+                # reconnect in the middle of one starts it over
+                event_id = changes['version'] if changes['cursor'] is None else None
+                yield sse_event("changes", {**changes, 'todos': todo_payloads(changes['todos'])}, event_id)
+            since, cursor = changes['version'], changes['cursor']
+            if changes['has_more']:
+                continue
+            timeout = min(STREAM_HEARTBEAT_INTERVAL, deadline - time.monotonic())
+            if timeout > 0 and not await subscription.wait(timeout):
+                yield ": heartbeat\n\n"
+    finally:
+        changes_broker.unsubscribe(subscription)
+
+@app.get("/todos/stream")
+async def stream_changes(
+    since: Optional[int] = Query(None, ge=0),
+    last_event_id: Optional[int] = Header(None, ge=0),
+    current_user: User = Depends(get_current_user)
+):
+    """Server-Sent Events stream of the user's todo changes.
+
+    Each ``changes`` event carries a TodoChanges payload and the new version
+    as its id, so a reconnecting EventSource resumes via Last-Event-ID.
+    Without ``since`` the stream starts at the current version with a
+    ``ready`` event.
+    """
+    if changes_broker.subscriber_count(current_user.id) >= STREAM_MAX_PER_USER:
+        raise HTTPException(status_code=429, detail="Too many open change streams")
+    # Subscribe before the first read so no change can slip in between
+    subscription = changes_broker.subscribe(current_user.id)
+    return StreamingResponse(
+        change_events(current_user.id, last_event_id if last_event_id is not None else since, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    conn.commit()
-    
-    # Get the created todo
-    cursor.execute(
-        'SELECT * FROM todos WHERE id = ?',
-        (cursor.lastrowid,)
+
+@app.get("/todos/search", response_model=List[TodoSearchResult])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
+):
+    """Full-text search over the user's active todo titles and descriptions.
+
+    Words are prefix-matched, results are ranked by relevance (title matches
+    weigh more) and matches are wrapped in ``<mark>`` in ``title_highlight``
+    and ``snippet``.
+    """
+    return await repo.search_todos(current_user.id, q, limit)
+
+# Exports read EXPORT_BATCH_SIZE rows per query; imports insert
+# IMPORT_CHUNK_SIZE rows per transaction. Neither holds more than that in memory.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+
+async def export_chunks(user_id: int, fmt: str):
+    header = transfer.export_header(fmt)
+    if header:
+        yield header
+    after_id = 0
+    while True:
+        rows = await repo.export_todos(user_id, after_id, EXPORT_BATCH_SIZE)
+        if rows:
+            yield transfer.encode_rows(rows, fmt)
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+        after_id = rows[-1]['id']
+
+@app.get("/todos/export")
+async def export_todos(
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    current_user: User = Depends(get_current_user)
+):
+    """Stream all of the user's todos in id order as NDJSON or CSV."""
+    return StreamingResponse(
+        export_chunks(current_user.id, fmt),
+        media_type=transfer.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="todos.{fmt}"'},
     )
-    created_todo = dict(cursor.fetchone())
-    conn.close()
-    return created_todo
 
-@app.patch("/todos/", response_model=List[Todo])
-async def update_all_todos(request: UpdateAllTodosRequest, current_user: User = Depends(get_current_user)):
-    conn = sqlite3.connect('todos.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    # Update all todos for the current user
-    cursor.execute(
-        'UPDATE todos SET completed = ? WHERE user_id = ?',
-        (request.completed, current_user.id)
+def progress_line(status: str, upload: transfer.TodoImport, imported: int, **extra) -> str:
+    line = {"status": status, "imported": imported, "rejected": upload.rejected, **extra}
+    return json.dumps(line, separators=(',', ':')) + "\n"
+
+async def import_progress(user_id: int, upload: transfer.TodoImport, form):
+    imported = 0
+    try:
+        while True:
+            rows = await asyncio.to_thread(upload.next_chunk, IMPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            if await repo.import_todos(user_id, rows) is None:
+                yield progress_line("failed", upload, imported, errors=upload.errors, error="Failed to save todos")
+                return
+            imported += len(rows)
+            todos_changed(user_id)
+            yield progress_line("running", upload, imported)
+        yield progress_line("done", upload, imported, errors=upload.errors)
+    except (ValueError, csv.Error) as e:
+        yield progress_line("failed", upload, imported, errors=upload.errors, error=str(e))
+    finally:
+        await form.close()
+
+@app.post("/todos/import")
+async def import_todos(
+    request: Request,
+    fmt: Optional[Literal["ndjson", "csv"]] = Query(None, alias="format"),
+    current_user: User = Depends(get_current_user)
+):
+    """Import todos from a multipart upload in the ``file`` field.
+
+    The format defaults to the file name's extension. Rows are inserted
+    IMPORT_CHUNK_SIZE at a time, each chunk in its own transaction, and the
+    response is NDJSON progress: one ``running`` line per committed chunk and
+    a final ``done`` (or ``failed``) line listing rejected rows. Rows
+    committed before a failure stay imported.
+    """
+    form = await request.form()
+    upload = form.get("file")
+    if not isinstance(upload, UploadFile):
+        await form.close()
+        raise HTTPException(status_code=400, detail="Upload the todos as a multipart 'file' field")
+    fmt = fmt or transfer.import_format(upload.filename, upload.content_type)
+    return StreamingResponse(
+        import_progress(current_user.id, transfer.TodoImport(upload.file, fmt), form),
+        media_type=transfer.FORMATS["ndjson"],
     )
-    conn.commit()
-    
-    # Get all updated todos for the current user
-    cursor.execute('SELECT * FROM todos WHERE user_id = ?', (current_user.id,))
-    todos = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return todos
+
+@app.get("/todos/{todo_id}", response_model=Todo)
+async def get_todo(
+    todo_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    not_modified = await conditional_read(current_user.id, if_none_match, response)
+    if not_modified:
+        return not_modified
+
+    todo = await repo.get_user_todo(current_user.id, todo_id)
+    if todo is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    return todo
+
+@app.post("/todos/", response_model=Todo)
+async def create_todo(todo: TodoCreate, current_user: User = Depends(get_current_user)):
+    created_todo = await repo.create_todo(current_user.id, todo.title, todo.description)
+    if created_todo is None:
+        raise HTTPException(status_code=500, detail="Failed to create todo")
+    todos_changed(current_user.id)
+    return created_todo
+
+@app.post("/todos/batch", response_model=BatchResponse)
+async def batch_todos(request: BatchRequest, current_user: User = Depends(get_current_user)):
+    """Apply many operations in one transaction and one commit.
+
+    In ``atomic`` mode nothing is committed if any operation fails, and the
+    response is a 409 whose results say which ones did.
+    """
+    operations = [operation.model_dump() for operation in request.operations]
+    result = await repo.apply_todo_batch(current_user.id, operations, request.mode == "atomic")
+    if not result['committed']:
+        return JSONResponse(status_code=409, content=jsonable_encoder(BatchResponse(**result)))
+    todos_changed(current_user.id)
+    return result
+
+# Bulk status changes above BULK_UPDATE_SYNC_LIMIT rows run as a background
+# job in BULK_UPDATE_CHUNK_SIZE-row transactions, so the write lock is
+# released between chunks and other users' writes can interleave.
+BULK_UPDATE_SYNC_LIMIT = int(os.getenv("BULK_UPDATE_SYNC_LIMIT", "5000"))
+BULK_UPDATE_CHUNK_SIZE = int(os.getenv("BULK_UPDATE_CHUNK_SIZE", "1000"))
+
+# Job status lives in this process only: with several workers a poll that
+# lands on another worker gets a 404, so run a single worker (as Procfile
+# and start.sh do) or pin a client's requests to one. The job itself runs
+# to completion either way; status is kept for an hour, or until 1000 newer
+# jobs push it out.
+bulk_jobs = TTLCache(maxsize=1000, ttl=3600)
+_background_tasks = set()
+
+async def run_bulk_update_job(job_id: str, job: dict):
+    # Updates this job's own dict, so it carries on if bulk_jobs drops it
+    user_id, completed = job["user_id"], job["completed"]
+    try:
+        while True:
+            changed = await repo.update_all_todos_status(user_id, completed, BULK_UPDATE_CHUNK_SIZE)
+            job["updated"] += len(changed)
+            if changed:
+                todos_changed(user_id)
+            if len(changed) < BULK_UPDATE_CHUNK_SIZE:
+                break
+        job["status"] = "done"
+    except Exception:
+        logger.exception("Bulk update job failed", extra={"job_id": job_id, "user_id": user_id})
+        job["status"] = "failed"
+
+@app.patch("/todos/", response_model=BulkUpdateResult)
+async def update_all_todos(
+    request: UpdateAllTodosRequest,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    """Set every active todo's status, touching only the rows that actually change.
+
+    Archived todos are left as they are. Small updates run inline and return the changed ids. Larger ones return
+    202 with a ``job_id`` to poll at ``GET /todos/jobs/{job_id}``, on the same worker (see ``bulk_jobs``).
+    """
+    pending = await repo.count_todos_to_update(current_user.id, request.completed)
+    if pending <= BULK_UPDATE_SYNC_LIMIT:
+        ids = await repo.update_all_todos_status(current_user.id, request.completed)
+        if ids:
+            todos_changed(current_user.id)
+        result = {"completed": request.completed, "status": "done", "updated": len(ids), "ids": ids, "job_id": None}
+        if FAST_SERIALIZATION:
+            return json_response(result, response)
+        return result
+
+    job_id = uuid.uuid4().hex
+    job = {"user_id": current_user.id, "completed": request.completed, "status": "running", "updated": 0}
+    bulk_jobs.set(job_id, job)
+    task = asyncio.create_task(run_bulk_update_job(job_id, job))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    response.status_code = 202
+    return {"completed": request.completed, "status": "running", "updated": 0, "job_id": job_id}
+
+@app.get("/todos/jobs/{job_id}", response_model=BulkUpdateResult)
+async def get_bulk_update_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = bulk_jobs.get(job_id)
+    if job is None or job["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {**job, "job_id": job_id}
 
 @app.patch("/todos/{todo_id}", response_model=Todo)
-async def update_todo(todo_id: int, request: UpdateAllTodosRequest, current_user: User = Depends(get_current_user)):
-    conn = sqlite3.connect('todos.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
+async def update_todo(
+    todo_id: int,
+    request: UpdateAllTodosRequest,
+    if_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
     # Update the specific todo only if it belongs to the current user
-    cursor.execute(
-        'UPDATE todos SET completed = ? WHERE id = ? AND user_id = ?',
-        (request.completed, todo_id, current_user.id)
-    )
-    conn.commit()
-    
-    if cursor.rowcount == 0:
-        conn.close()
+    unchanged_since = if_match_version(current_user.id, if_match)
+    todo = await repo.update_todo_status(current_user.id, todo_id, request.completed, unchanged_since)
+    if todo is None:
         raise HTTPException(status_code=404, detail="Todo not found")
-    
-    # Get the updated todo
-    cursor.execute('SELECT * FROM todos WHERE id = ?', (todo_id,))
-    todo = dict(cursor.fetchone())
-    conn.close()
+    todos_changed(current_user.id)
     return todo
 
 @app.put("/todos/{todo_id}", response_model=Todo)
-async def update_todo(todo_id: int, todo: TodoCreate, current_user: User = Depends(get_current_user)):
-    conn = sqlite3.connect('todos.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    # First check if the todo exists and belongs to the user
-    cursor.execute(
-        'SELECT * FROM todos WHERE id = ? AND user_id = ?',
-        (todo_id, current_user.id)
-    )
-    existing_todo = cursor.fetchone()
-    
-    if not existing_todo:
-        conn.close()
+async def update_todo(
+    todo_id: int,
+    todo: TodoCreate,
+    if_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    unchanged_since = if_match_version(current_user.id, if_match)
+    updated_todo = await repo.update_todo(current_user.id, todo_id, todo.title, todo.description, unchanged_since)
+    if updated_todo is None:
         raise HTTPException(status_code=404, detail="Todo not found")
-    
-    # Update the todo
-    cursor.execute(
-        '''
-        UPDATE todos 
-        SET title = ?, description = ?, last_modified_at = ?
-        WHERE id = ? AND user_id = ?
-        ''',
-        (todo.title, todo.description, datetime.utcnow(), todo_id, current_user.id)
-    )
-    conn.commit()
-    
-    # Get the updated todo
-    cursor.execute('SELECT * FROM todos WHERE id = ?', (todo_id,))
-    updated_todo = dict(cursor.fetchone())
-    conn.close()
-    
+    todos_changed(current_user.id)
     return updated_todo
 
 @app.delete("/todos/{todo_id}")
-async def delete_todo(todo_id: int, current_user: User = Depends(get_current_user)):
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
-    
+async def delete_todo(
+    todo_id: int,
+    if_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
     # Delete the todo only if it belongs to the current user
-    cursor.execute(
-        'DELETE FROM todos WHERE id = ? AND user_id = ?',
-        (todo_id, current_user.id)
-    )
-    conn.commit()
-    
-    if cursor.rowcount == 0:
-        conn.close()
+    if not await repo.delete_todo(current_user.id, todo_id, if_match_version(current_user.id, if_match)):
         raise HTTPException(status_code=404, detail="Todo not found")
-        
-    conn.close()
-    return {"message": "Todo deleted successfully"} 
\ No newline at end of file
+    todos_changed(current_user.id)
+    return {"message": "Todo deleted successfully"}
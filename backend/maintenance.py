@@ -0,0 +1,111 @@
+"""Offline maintenance tasks.
+
+    python maintenance.py migrate
+    python maintenance.py compact-tombstones [--retention-days 30]
+    python maintenance.py rebuild-search
+    python maintenance.py sweep-sessions [--batch-size 500]
+    python maintenance.py archive-todos [--after-days 30] [--batch-size 500]
+    python maintenance.py shards
+    python maintenance.py move-user USER_ID SHARD
+    python maintenance.py rebalance [--shards N|per-user]
+    python maintenance.py split SHARD NEW_SHARD
+
+The shard commands are for STORAGE_BACKEND=sharded (see shards.py) and must
+run while the app is stopped. With that backend compact-tombstones,
+rebuild-search and archive-todos cover every shard.
+"""
+import argparse
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TaskMaster maintenance tasks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("migrate", help="set up or upgrade the STORAGE_BACKEND schema; run once per deploy")
+
+    compact = commands.add_parser("compact-tombstones", help="drop delete tombstones older than the retention")
+    compact.add_argument("--retention-days", type=int, default=30)
+
+    commands.add_parser("rebuild-search", help="rebuild and optimize the full-text search index")
+
+    sweep = commands.add_parser("sweep-sessions", help="delete expired sessions in small batches")
+    sweep.add_argument("--batch-size", type=int, default=500)
+
+    archive = commands.add_parser("archive-todos", help="move todos completed before the cutoff to the archive")
+    archive.add_argument("--after-days", type=float, default=float(os.getenv("TODO_ARCHIVE_AFTER_DAYS", "30")))
+    archive.add_argument("--batch-size", type=int, default=500)
+
+    commands.add_parser("shards", help="list shards with their users, todos and file size")
+
+    move = commands.add_parser("move-user", help="move one user's todos to another shard (\"main\" for the directory)")
+    move.add_argument("user_id", type=int)
+    move.add_argument("shard")
+
+    rebalance = commands.add_parser("rebalance", help="move every user to the shard SQLITE_SHARDS places them on")
+    rebalance.add_argument("--shards", help="shard count or per-user, instead of SQLITE_SHARDS")
+
+    split = commands.add_parser("split", help="move the upper half of a shard's users to a new shard")
+    split.add_argument("shard")
+    split.add_argument("new_shard")
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        from repository import repository_from_env
+        repo = repository_from_env()
+        asyncio.run(repo.migrate())
+        print(f"Migrated {repo.name} storage")
+        return
+
+    # The rest are SQLite-specific
+    from database import archive_todos, compact_tombstones, delete_expired_sessions, rebuild_search_index
+
+    sharded = os.getenv("STORAGE_BACKEND") == "sharded"
+    if sharded or args.command in ("shards", "move-user", "rebalance", "split"):
+        import shards
+        placements = shards.list_shards()
+    else:
+        placements = [None]
+
+    def on_every_shard(func, *func_args):
+        return [shards.on_shard(placement, func)(*func_args) if placement else func(*func_args)
+                for placement in placements]
+
+    if args.command == "compact-tombstones":
+        print(f"Compacted {sum(on_every_shard(compact_tombstones, args.retention_days))} tombstones")
+    elif args.command == "rebuild-search":
+        on_every_shard(rebuild_search_index)
+        print("Search index rebuilt")
+    elif args.command == "archive-todos":
+        completed_before = datetime.utcnow() - timedelta(days=args.after_days)
+        archived = 0
+        while True:
+            counts = on_every_shard(archive_todos, completed_before, args.batch_size)
+            batch = sum(sum(per_user.values()) for per_user in counts)
+            archived += batch
+            if batch == 0:
+                break
+        print(f"Archived {archived} todos")
+    elif args.command == "shards":
+        print(json.dumps(shards.describe(), indent=2))
+    elif args.command == "move-user":
+        print(f"Moved {shards.move_user(args.user_id, args.shard)} todos to {args.shard}")
+    elif args.command == "rebalance":
+        print(json.dumps({"moved_users": shards.rebalance(args.shards)}, indent=2))
+    elif args.command == "split":
+        print(f"Moved {shards.split(args.shard, args.new_shard)} users to {args.new_shard}")
+    elif args.command == "sweep-sessions":
+        swept = 0
+        while True:
+            deleted = delete_expired_sessions(args.batch_size)
+            swept += deleted
+            if deleted < args.batch_size:
+                break
+        print(f"Deleted {swept} expired sessions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""In-process backend for tests and benchmarks: plain dicts, no I/O.
+
+Nothing survives a restart and nothing is shared between workers. Each
+method runs to completion without awaiting, so on the event loop every call
+is atomic without any locking. Timestamps are stored as ``str(datetime)``,
+the same text the sqlite3 adapter writes, so cursors are interchangeable
+with the SQLite backend's.
+"""
+import bisect
+import itertools
+import secrets
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from repository import (
+    SESSION_MAX_PER_USER, SESSION_RENEW_INTERVAL, SESSION_TTL,
+    Repository, TodoConflict, batch_results, check_batch, matches_all, reset_page, rolled_back, search_result,
+    search_terms,
+)
+
+
+class MemoryRepository(Repository):
+    name = "memory"
+
+    def __init__(self):
+        self._user_ids = itertools.count(1)
+        self._todo_ids = itertools.count(1)
+        self._session_ids = itertools.count(1)
+        self._revocation_ids = itertools.count(1)
+        self.users: Dict[int, Dict] = {}
+        self.usernames: Dict[str, int] = {}
+        self.emails: Dict[str, int] = {}
+        self.sessions: Dict[str, Dict] = {}
+        self.revocations: Dict[str, Dict] = {}
+        self.todos: Dict[int, Dict] = {}
+        # user_id -> {todo_id: todo}, so per-user reads skip other users
+        self.user_todos: Dict[int, Dict[int, Dict]] = {}
+        self.versions: Dict[int, int] = {}
+        self.tombstones: Dict[int, List[Dict]] = {}
+        # user_id -> {todo_id: todo} of archived todos
+        self.archive: Dict[int, Dict[int, Dict]] = {}
+
+    def stats(self) -> Dict:
+        return {"users": len(self.users), "todos": len(self.todos), "sessions": len(self.sessions),
+                "archived_todos": sum(len(todos) for todos in self.archive.values())}
+
+    # Users
+    async def create_user(self, username, email, password_hash):
+        if username in self.usernames or email in self.emails:
+            return None
+        user = {'id': next(self._user_ids), 'username': username, 'email': email, 'password_hash': password_hash}
+        self.users[user['id']] = user
+        self.usernames[username] = self.emails[email] = user['id']
+        return self._public_user(user)
+
+    async def get_user_credentials(self, username):
+        user_id = self.usernames.get(username)
+        return dict(self.users[user_id]) if user_id is not None else None
+
+    async def update_password_hash(self, user_id, password_hash):
+        user = self.users.get(user_id)
+        if user is None:
+            return False
+        user['password_hash'] = password_hash
+        return True
+
+    def _public_user(self, user: Dict) -> Dict:
+        return {'id': user['id'], 'username': user['username'], 'email': user['email']}
+
+    # Sessions
+    async def create_session(self, user_id):
+        session_token = secrets.token_urlsafe(24)
+        self.sessions[session_token] = {
+            'id': next(self._session_ids), 'user_id': user_id, 'expires_at': datetime.utcnow() + SESSION_TTL,
+        }
+        if SESSION_MAX_PER_USER > 0:
+            mine = sorted(
+                (s['id'], token) for token, s in self.sessions.items() if s['user_id'] == user_id
+            )
+            for _, token in mine[:-SESSION_MAX_PER_USER]:
+                del self.sessions[token]
+        return session_token
+
+    async def verify_session(self, session_token):
+        session = self.sessions.get(session_token)
+        now = datetime.utcnow()
+        if session is None or session['expires_at'] <= now:
+            return None
+        user = self._public_user(self.users[session['user_id']])
+        if SESSION_RENEW_INTERVAL and session['expires_at'] - now < SESSION_TTL - SESSION_RENEW_INTERVAL:
+            session['expires_at'] = now + SESSION_TTL
+            return {**user, 'session_expires_at': session['expires_at']}
+        return user
+
+    async def delete_session(self, session_token):
+        return self.sessions.pop(session_token, None) is not None
+
+    async def delete_expired_sessions(self, batch_size=500):
+        now = datetime.utcnow()
+        expired = [token for token, s in self.sessions.items() if s['expires_at'] <= now][:batch_size]
+        for token in expired:
+            del self.sessions[token]
+        return len(expired)
+
+    # Signed-token revocations
+    async def revoke_token(self, jti, expires_at):
+        if jti not in self.revocations:
+            self.revocations[jti] = {'id': next(self._revocation_ids), 'jti': jti, 'expires_at': expires_at}
+
+    async def get_revoked_tokens(self, after_id=0):
+        now = datetime.utcnow()
+        return sorted(
+            (dict(r) for r in self.revocations.values() if r['id'] > after_id and r['expires_at'] > now),
+            key=lambda r: r['id']
+        )
+
+    async def delete_expired_revocations(self, batch_size=500):
+        now = datetime.utcnow()
+        expired = [jti for jti, r in self.revocations.items() if r['expires_at'] <= now][:batch_size]
+        for jti in expired:
+            del self.revocations[jti]
+        return len(expired)
+
+    # Todos
+    def _row(self, todo: Dict, with_version: bool = False) -> Dict:
+        row = {
+            'id': todo['id'],
+            'title': todo['title'],
+            'description': todo['description'],
+            'completed': todo['completed'],
+            'created_at': todo['created_at'],
+            'last_modified_at': todo['last_modified_at'],
+            'created_by': self.users[todo['user_id']]['username'],
+        }
+        if with_version:
+            row['version'] = todo['version']
+        return row
+
+    def _bump(self, user_id: int) -> int:
+        version = self.versions.get(user_id, 0) + 1
+        self.versions[user_id] = version
+        return version
+
+    def _insert(self, user_id: int, title: str, description: Optional[str], now: str) -> Dict:
+        todo = {
+            'id': next(self._todo_ids), 'title': title, 'description': description, 'completed': False,
+            'user_id': user_id, 'created_at': now, 'last_modified_at': now, 'version': self._bump(user_id),
+        }
+        self.todos[todo['id']] = todo
+        self.user_todos.setdefault(user_id, {})[todo['id']] = todo
+        return todo
+
+    def _update(self, todo: Dict, now: str, **fields) -> Dict:
+        todo.update(fields, last_modified_at=now, version=self._bump(todo['user_id']))
+        return todo
+
+    def _delete(self, todo: Dict) -> None:
+        del self.todos[todo['id']]
+        del self.user_todos[todo['user_id']][todo['id']]
+        self.tombstones.setdefault(todo['user_id'], []).append(
+            {'todo_id': todo['id'], 'version': self._bump(todo['user_id'])}
+        )
+
+    def _owned(self, user_id: int, todo_id: int) -> Optional[Dict]:
+        return self.user_todos.get(user_id, {}).get(todo_id)
+
+    def _unarchive(self, user_id: int, todo_id: int) -> Optional[Dict]:
+        """Make an archived todo active again, as a new version; None if it is not archived."""
+        todo = self.archive.get(user_id, {}).pop(todo_id, None)
+        if todo is None:
+            return None
+        todo['version'] = self._bump(user_id)
+        self.todos[todo_id] = todo
+        self.user_todos.setdefault(user_id, {})[todo_id] = todo
+        self.tombstones[user_id] = [d for d in self.tombstones.get(user_id, []) if d['todo_id'] != todo_id]
+        return todo
+
+    def _editable(self, user_id: int, todo_id: int, unchanged_since: Optional[int] = None) -> Optional[Dict]:
+        todo = self._owned(user_id, todo_id)
+        if todo is None:
+            if unchanged_since is not None and todo_id in self.archive.get(user_id, {}):
+                # Archiving recorded a tombstone at the version it happened
+                tombstones = self.tombstones.get(user_id, [])
+                archived_at = max((d['version'] for d in tombstones if d['todo_id'] == todo_id), default=0)
+                if archived_at > unchanged_since:
+                    raise TodoConflict(todo_id)
+            return self._unarchive(user_id, todo_id)
+        if unchanged_since is not None and todo['version'] > unchanged_since:
+            raise TodoConflict(todo_id)
+        return todo
+
+    async def get_user_todos(self, user_id, limit=None, cursor=None, completed=None, modified_since=None,
+                             include_archived=False):
+        todos = list(self.user_todos.get(user_id, {}).values())
+        if include_archived:
+            todos += self.archive.get(user_id, {}).values()
+        if completed is not None:
+            todos = [t for t in todos if t['completed'] == completed]
+        if modified_since is not None:
+            todos = [t for t in todos if t['last_modified_at'] >= str(modified_since)]
+        if cursor is not None:
+            group, last_modified_at, todo_id = cursor
+            todos = [
+                t for t in todos
+                if int(t['completed']) > group
+                or (int(t['completed']) == group and (t['last_modified_at'], t['id']) < (last_modified_at, todo_id))
+            ]
+        ordered = sorted(todos, key=lambda t: (-int(t['completed']), t['last_modified_at'], t['id']), reverse=True)
+        return [self._row(t) for t in ordered[:limit]]
+
+    async def get_user_todo(self, user_id, todo_id):
+        todo = self._owned(user_id, todo_id) or self.archive.get(user_id, {}).get(todo_id)
+        return self._row(todo) if todo else None
+
+    async def count_todos_to_update(self, user_id, completed):
+        return sum(1 for t in self.user_todos.get(user_id, {}).values() if t['completed'] != completed)
+
+    async def get_todo_version(self, user_id):
+        return self.versions.get(user_id, 0)
+
+    async def get_todo_versions(self, user_ids):
+        return {user_id: self.versions[user_id] for user_id in user_ids if user_id in self.versions}
+
+    async def get_todo_changes(self, user_id, since, limit=500, cursor=None):
+        current = self.versions.get(user_id, 0)
+        todos = self.user_todos.get(user_id, {}).values()
+        if cursor is not None or since > current:
+            page = sorted((t for t in todos if t['id'] > (cursor or 0)), key=lambda t: t['id'])[:limit + 1]
+            rows = [self._row(t, with_version=True) for t in page]
+            return reset_page(rows, limit, current if cursor is None else since, cursor)
+
+        events = sorted(
+            [(t['version'], self._row(t, with_version=True)) for t in todos if t['version'] > since]
+            + [(d['version'], d) for d in self.tombstones.get(user_id, ()) if d['version'] > since],
+            key=lambda event: event[0]
+        )
+        has_more = len(events) > limit
+        events = events[:limit]
+        return {
+            'version': events[-1][0] if has_more else current,
+            'reset': False,
+            'todos': [event for _, event in events if 'todo_id' not in event],
+            'deleted': [event['todo_id'] for _, event in events if 'todo_id' in event],
+            'has_more': has_more,
+            'cursor': None,
+        }
+
+    async def search_todos(self, user_id, text, limit=20):
+        terms = search_terms(text)
+        if not terms:
+            return []
+        results = [
+            search_result(self._row(t), terms)
+            for t in self.user_todos.get(user_id, {}).values()
+            if matches_all(terms, t['title'], t['description'])
+        ]
+        results.sort(key=lambda r: (r['rank'], -r['id']))
+        return results[:limit]
+
+    async def export_todos(self, user_id, after_id=0, limit=1000):
+        todos = {**self.user_todos.get(user_id, {}), **self.archive.get(user_id, {})}
+        # Unarchived todos are re-inserted out of id order
+        ids = sorted(todos)
+        start = bisect.bisect_right(ids, after_id)
+        return [
+            {key: todos[todo_id][key] for key in ('id', 'title', 'description', 'completed',
+                                                   'created_at', 'last_modified_at')}
+            for todo_id in ids[start:start + limit]
+        ]
+
+    async def create_todo(self, user_id, title, description=None):
+        return self._row(self._insert(user_id, title, description, str(datetime.utcnow())))
+
+    async def update_todo_status(self, user_id, todo_id, completed, unchanged_since=None):
+        todo = self._editable(user_id, todo_id, unchanged_since)
+        if todo is None:
+            return None
+        return self._row(self._update(todo, str(datetime.utcnow()), completed=completed))
+
+    async def update_todo(self, user_id, todo_id, title, description=None, unchanged_since=None):
+        todo = self._editable(user_id, todo_id, unchanged_since)
+        if todo is None:
+            return None
+        return self._row(self._update(todo, str(datetime.utcnow()), title=title, description=description))
+
+    async def delete_todo(self, user_id, todo_id, unchanged_since=None):
+        todo = self._editable(user_id, todo_id, unchanged_since)
+        if todo is None:
+            return False
+        self._delete(todo)
+        return True
+
+    async def update_all_todos_status(self, user_id, completed, limit=None):
+        now = str(datetime.utcnow())
+        pending = [t for t in self.user_todos.get(user_id, {}).values() if t['completed'] != completed][:limit]
+        for todo in pending:
+            self._update(todo, now, completed=completed)
+        return [todo['id'] for todo in pending]
+
+    async def apply_todo_batch(self, user_id, operations, atomic=True):
+        results = batch_results(operations)
+        archived = self.archive.get(user_id, {})
+        check_batch(operations, results, self.user_todos.get(user_id, {}).keys() | archived.keys())
+        if atomic and any(result['status'] != 'ok' for result in results):
+            return rolled_back(results)
+
+        for op, result in zip(operations, results):
+            if result['status'] == 'ok' and op['op'] != 'create' and op['id'] in archived:
+                self._unarchive(user_id, op['id'])
+        now = str(datetime.utcnow())
+        for op, result in zip(operations, results):
+            if result['status'] != 'ok':
+                continue
+            if op['op'] == 'create':
+                result['id'] = self._insert(user_id, op['title'], op.get('description'), now)['id']
+            elif op['op'] == 'update':
+                self._update(self.todos[op['id']], now, title=op['title'], description=op.get('description'))
+            elif op['op'] == 'patch':
+                self._update(self.todos[op['id']], now, completed=op['completed'])
+            else:
+                self._delete(self.todos[op['id']])
+        for result in results:
+            # A later op in the batch may have deleted the row
+            if result['status'] == 'ok' and result['op'] != 'delete' and result['id'] in self.todos:
+                result['todo'] = self._row(self.todos[result['id']])
+        return {'committed': True, 'results': results}
+
+    async def import_todos(self, user_id, rows):
+        now = str(datetime.utcnow())
+        for row in rows:
+            todo = self._insert(user_id, row['title'], row.get('description'), now)
+            todo['completed'] = bool(row.get('completed', False))
+        return len(rows)
+
+    async def archive_todos(self, completed_before, limit=500):
+        cutoff = str(completed_before)
+        due = [t for t in self.todos.values() if t['completed'] and t['last_modified_at'] < cutoff][:limit]
+        archived: Dict[int, int] = {}
+        for todo in due:
+            self._delete(todo)
+            self.archive.setdefault(todo['user_id'], {})[todo['id']] = todo
+            archived[todo['user_id']] = archived.get(todo['user_id'], 0) + 1
+        return archived
@@ -0,0 +1,288 @@
+"""In-process metrics exposed in the Prometheus text format on ``/metrics``.
+
+Deliberately dependency-free and cheap: an observation is a bisect plus a
+couple of additions under a per-metric lock, so the instrumentation can stay
+on in production. Set METRICS_ENABLED=0 to turn all of it off.
+"""
+import bisect
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+# Seconds. Spans a cached session lookup up to a stuck write lock.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics: List["_Metric"] = []
+_collectors: List[Callable[[], Iterable[str]]] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_format(value)}" for key, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labelvalues: str, amount: float = 1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = self.header()
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def register_collector(collector: Callable[[], Iterable[str]]) -> None:
+    """Register a callable producing exposition lines at scrape time."""
+    _collectors.append(collector)
+
+
+def gauge_lines(name: str, documentation: str, values: Dict[str, float], kind: str = "gauge") -> List[str]:
+    """Expose a stats dict (e.g. ``pool.stats()``) as one metric per key."""
+    lines = []
+    for key, value in values.items():
+        metric = f"{name}_{key}"
+        lines += [f"# HELP {metric} {documentation} ({key})", f"# TYPE {metric} {kind}", f"{metric} {value}"]
+    return lines
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _metrics:
+        lines += metric.render()
+    for collector in _collectors:
+        lines += collector()
+    return "\n".join(lines) + "\n"
+
+
+# HTTP
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+
+# Database
+DB_STATEMENT_LATENCY = Histogram(
+    "db_statement_duration_seconds", "SQLite statement execution time", ("operation",)
+)
+DB_WRITE_LOCK_WAIT = Histogram(
+    "db_write_lock_wait_seconds", "Time spent acquiring SQLite's write lock (BEGIN IMMEDIATE)"
+)
+DB_CALL_LATENCY = Histogram(
+    "db_call_duration_seconds", "Time spent in a database helper on a DB worker thread", ("function",)
+)
+DB_QUEUE_WAIT = Histogram(
+    "db_executor_queue_seconds", "Time a database call waited for a free DB worker thread"
+)
+GROUP_COMMIT_LATENCY = Histogram("db_group_commit_seconds", "Time spent in the COMMIT of a write group")
+GROUP_COMMIT_BATCH_SIZE = Histogram(
+    "db_group_commit_batch_size", "Writes committed together in one group",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+WAL_CHECKPOINTS = Counter("db_wal_checkpoints_total", "WAL checkpoints run by the writer", ("mode",))
+
+# Auth
+PASSWORD_HASH_LATENCY = Histogram(
+    "password_hash_duration_seconds", "bcrypt time including executor queueing", ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+PASSWORD_HASHES_IN_FLIGHT = Gauge("password_hashes_in_flight", "bcrypt operations admitted and not finished yet")
+PASSWORD_HASHES_SHED = Counter(
+    "password_hashes_shed_total", "bcrypt operations refused by admission control", ("operation",)
+)
+PASSWORD_REHASHES = Counter("password_rehashes_total", "Password hashes upgraded to BCRYPT_ROUNDS on login")
+AUTH_THROTTLED = Counter("auth_throttled_total", "Login and signup attempts refused by rate limits", ("scope",))
+SESSION_LOOKUPS = Counter("session_lookups_total", "Session lookups by where they were resolved", ("result",))
+SESSIONS_RENEWED = Counter("sessions_renewed_total", "Sessions whose expiry was slid forward")
+SESSIONS_EVICTED = Counter("sessions_evicted_total", "Sessions dropped by the per-user session cap")
+SESSIONS_SWEPT = Counter("sessions_swept_total", "Expired sessions deleted by the sweeper")
+SESSION_SWEEP_LATENCY = Histogram("session_sweep_duration_seconds", "Duration of a full expired-session sweep")
+
+# Change streams
+CHANGE_STREAMS = Gauge("change_streams_open", "Open /todos/stream connections")
+CHANGE_EVENTS = Counter("change_stream_events_total", "Events sent on change streams", ("event",))
+
+# GET /todos/ reads: "query" ran one, "coalesced" shared one in flight, "cache_hit" used a cached body
+TODO_READS = Counter("todo_reads_total", "GET /todos/ reads by how their body was produced", ("result",))
+TODOS_ARCHIVED = Counter("todos_archived_total", "Completed todos moved to the archive")
+
+
+_WRITE_OPERATIONS = frozenset(("INSERT", "UPDATE", "DELETE", "REPLACE"))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Times every statement and isolates write-lock acquisition.
+
+    Before the first write of a transaction the implicit ``BEGIN`` is issued
+    as ``BEGIN IMMEDIATE`` instead, which takes the write lock at the same
+    point a deferred ``BEGIN`` followed by the write would have, but lets the
+    lock wait be measured separately from the statement itself.
+    """
+
+    def _timed(self, method, sql: str, parameters):
+        operation = sql.split(None, 1)[0].upper() if sql.strip() else ""
+        conn = self.connection
+        if operation in _WRITE_OPERATIONS and not conn.in_transaction and conn.isolation_level is not None:
+            start = time.perf_counter()
+            sqlite3.Cursor.execute(self, "BEGIN IMMEDIATE")
+            DB_WRITE_LOCK_WAIT.observe(time.perf_counter() - start)
+        elif operation == "BEGIN" and ("IMMEDIATE" in sql.upper() or "EXCLUSIVE" in sql.upper()):
+            start = time.perf_counter()
+            result = method(self, sql, parameters)
+            DB_WRITE_LOCK_WAIT.observe(time.perf_counter() - start)
+            return result
+        start = time.perf_counter()
+        try:
+            return method(self, sql, parameters)
+        finally:
+            DB_STATEMENT_LATENCY.observe(time.perf_counter() - start, operation)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute() does not go through cursor(), so route it explicitly
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory() -> Optional[type]:
+    return InstrumentedConnection if METRICS_ENABLED else None
+
+
+class MetricsMiddleware:
+    """Per-route latency, status counters and in-flight gauge.
+
+    Routes are labelled by their template (``/todos/{todo_id}``), never the raw
+    path, to keep label cardinality bounded. An optional ``profiler`` is told
+    about every request so it can dump stacks for slow ones, except those to
+    ``unprofiled_paths``: long-lived streams would keep it sampling for as long
+    as they stay open and then always count as slow.
+    """
+
+    def __init__(self, app, profiler=None, unprofiled_paths=()):
+        self.app = app
+        self.profiler = profiler
+        self.unprofiled_paths = frozenset(unprofiled_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profiler = self.profiler if scope["path"] not in self.unprofiled_paths else None
+        HTTP_IN_FLIGHT.inc()
+        if profiler:
+            profiler.request_started()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            end = time.perf_counter()
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_LATENCY.observe(end - start, method, route)
+            HTTP_REQUESTS.inc(method, route, str(status))
+            if profiler:
+                await profiler.request_finished(start, end, f"{method} {route}")
@@ -0,0 +1,432 @@
+"""Versioned schema migrations for the SQLite database.
+
+Each migration is applied at most once, inside its own ``BEGIN IMMEDIATE``
+transaction, and recorded in ``schema_version``. Migrations only ever add to
+the schema; they never drop tables holding user data.
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --check    # also verify the hot queries use indexes
+"""
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Tuple, Union
+
+# Also created on its own by throttle.SQLiteRateLimitStore, whose file may
+# never be migrated (STORAGE_BACKEND=memory or mongo)
+RATE_LIMITS_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        allowed INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_rate_limits_updated_at ON rate_limits (updated_at)',
+]
+
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "base schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS todos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT,
+            completed BOOLEAN DEFAULT FALSE,
+            user_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            session_token TEXT UNIQUE NOT NULL,
+            expires_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+    ]),
+    (2, "indexes for todo listing and session expiry", [
+        # Serves WHERE user_id = ? on its own as well as the
+        # ORDER BY completed, last_modified_at DESC listing order.
+        '''
+        CREATE INDEX IF NOT EXISTS idx_todos_user_status_modified
+        ON todos (user_id, completed, last_modified_at DESC)
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)',
+    ]),
+    (3, "add id tie-breaker to the todo listing index for keyset pagination", [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_todos_user_status_modified_id
+        ON todos (user_id, completed, last_modified_at DESC, id DESC)
+        ''',
+        'DROP INDEX IF EXISTS idx_todos_user_status_modified',
+    ]),
+    (4, "per-user change versions and delete tombstones for delta sync", [
+        '''
+        CREATE TABLE IF NOT EXISTS todo_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            tombstone_floor INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS todo_tombstones (
+            todo_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'ALTER TABLE todos ADD COLUMN version INTEGER NOT NULL DEFAULT 0',
+        # Number existing rows per user so a client syncing from 0 sees them
+        '''
+        UPDATE todos SET version = ranked.version
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id) AS version FROM todos
+        ) AS ranked
+        WHERE todos.id = ranked.id
+        ''',
+        '''
+        INSERT INTO todo_versions (user_id, version)
+        SELECT user_id, MAX(version) FROM todos GROUP BY user_id
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_todos_user_version ON todos (user_id, version)',
+        'CREATE INDEX IF NOT EXISTS idx_tombstones_user_version ON todo_tombstones (user_id, version)',
+        'CREATE INDEX IF NOT EXISTS idx_tombstones_deleted_at ON todo_tombstones (deleted_at)',
+        # Triggers keep versions correct for every write path, including
+        # ones that bypass the helpers in database.py.
+        '''
+        CREATE TRIGGER IF NOT EXISTS todos_version_insert AFTER INSERT ON todos
+        BEGIN
+            INSERT INTO todo_versions (user_id, version) VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+            UPDATE todos SET version = (SELECT version FROM todo_versions WHERE user_id = NEW.user_id)
+            WHERE id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS todos_version_update
+        AFTER UPDATE OF title, description, completed, last_modified_at ON todos
+        BEGIN
+            INSERT INTO todo_versions (user_id, version) VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+            UPDATE todos SET version = (SELECT version FROM todo_versions WHERE user_id = NEW.user_id)
+            WHERE id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS todos_version_delete AFTER DELETE ON todos
+        BEGIN
+            INSERT INTO todo_versions (user_id, version) VALUES (OLD.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+            INSERT OR REPLACE INTO todo_tombstones (todo_id, user_id, version)
+            VALUES (OLD.id, OLD.user_id, (SELECT version FROM todo_versions WHERE user_id = OLD.user_id));
+        END
+        ''',
+    ]),
+    (5, "full-text search over todo titles and descriptions", [
+        # External-content FTS5 index over todos. user_id is indexed as a
+        # token so per-user scoping is part of the MATCH, not a post-filter.
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5(
+            user_id, title, description,
+            content='todos', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS todos_fts_insert AFTER INSERT ON todos
+        BEGIN
+            INSERT INTO todos_fts (rowid, user_id, title, description)
+            VALUES (NEW.id, NEW.user_id, NEW.title, NEW.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS todos_fts_delete AFTER DELETE ON todos
+        BEGIN
+            INSERT INTO todos_fts (todos_fts, rowid, user_id, title, description)
+            VALUES ('delete', OLD.id, OLD.user_id, OLD.title, OLD.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS todos_fts_update AFTER UPDATE OF user_id, title, description ON todos
+        BEGIN
+            INSERT INTO todos_fts (todos_fts, rowid, user_id, title, description)
+            VALUES ('delete', OLD.id, OLD.user_id, OLD.title, OLD.description);
+            INSERT INTO todos_fts (rowid, user_id, title, description)
+            VALUES (NEW.id, NEW.user_id, NEW.title, NEW.description);
+        END
+        ''',
+        "INSERT INTO todos_fts (todos_fts) VALUES ('rebuild')",
+    ]),
+    (6, "index sessions by user for the per-user session cap", [
+        'CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions (user_id, id)',
+    ]),
+    (7, "deny-list for revoked signed session tokens", [
+        '''
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            jti TEXT UNIQUE NOT NULL,
+            expires_at TIMESTAMP NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at ON revoked_tokens (expires_at)',
+    ]),
+    (8, "index todos by user and id for export", [
+        'CREATE INDEX IF NOT EXISTS idx_todos_user_id ON todos (user_id, id)',
+    ]),
+    (9, "shard directory and per-file todo id ranges", [
+        # Directory tables, only used in the main file of the sharded backend
+        '''
+        CREATE TABLE IF NOT EXISTS shards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_shards (
+            user_id INTEGER PRIMARY KEY,
+            shard_id INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (shard_id) REFERENCES shards (id)
+        )
+        ''',
+        # New todos take their id from next_id, so every file can be given
+        # its own id range and a user's todos keep their ids when moved to
+        # another file. Rows from other ranges never advance next_id.
+        '''
+        CREATE TABLE IF NOT EXISTS todo_ids (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            next_id INTEGER NOT NULL,
+            max_id INTEGER NOT NULL
+        )
+        ''',
+        # Continue from AUTOINCREMENT's counter so ids of deleted todos are
+        # never handed out again
+        '''
+        INSERT OR IGNORE INTO todo_ids (id, next_id, max_id)
+        SELECT 1, MAX(
+            COALESCE((SELECT MAX(id) FROM todos), 0),
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'todos'), 0)
+        ) + 1, 4294967295
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS todos_id_insert AFTER INSERT ON todos
+        BEGIN
+            UPDATE todo_ids SET next_id = NEW.id + 1 WHERE NEW.id >= next_id AND NEW.id <= max_id;
+        END
+        ''',
+    ]),
+    (10, "token buckets for login and signup rate limits", RATE_LIMITS_SCHEMA),
+    (11, "cold archive for long-completed todos", [
+        # Same columns as todos (less version, which lives on in the
+        # tombstone written when a todo is archived). Archived rows have
+        # their own b-tree and indexes, so the pages of todos and its
+        # indexes that every list request touches stay few and cached.
+        '''
+        CREATE TABLE IF NOT EXISTS todos_archive (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT,
+            completed BOOLEAN DEFAULT TRUE,
+            user_id INTEGER NOT NULL,
+            created_at TIMESTAMP,
+            last_modified_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_todos_archive_user_modified_id
+        ON todos_archive (user_id, last_modified_at DESC, id DESC)
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_todos_archive_user_id ON todos_archive (user_id, id)',
+        # Only completed rows not archived yet, so it stays small once the
+        # archiver has caught up
+        'CREATE INDEX IF NOT EXISTS idx_todos_archivable ON todos (last_modified_at) WHERE completed = 1',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Hot query shapes from database.py and the index (or any of several
+# equally good indexes) each must use
+HOT_QUERIES: Dict[str, Tuple[str, tuple, Union[str, Tuple[str, ...]]]] = {
+    "get_user_todos": ('''
+        SELECT t.id, t.title, t.description, t.completed, t.created_at,
+               t.last_modified_at, u.username as created_by
+        FROM todos t
+        JOIN users u ON t.user_id = u.id
+        WHERE t.user_id = ? AND t.completed = ?
+        ORDER BY t.last_modified_at DESC, t.id DESC
+    ''', (1, 0), "idx_todos_user_status_modified_id"),
+    "get_user_todos_page": ('''
+        SELECT t.id, t.title, t.description, t.completed, t.created_at,
+               t.last_modified_at, u.username as created_by
+        FROM todos t
+        JOIN users u ON t.user_id = u.id
+        WHERE t.user_id = ? AND t.completed = ? AND (t.last_modified_at, t.id) < (?, ?)
+        ORDER BY t.last_modified_at DESC, t.id DESC
+        LIMIT ?
+    ''', (1, 0, "2000-01-01", 1, 100), "idx_todos_user_status_modified_id"),
+    "update_all_todos_status": (
+        'UPDATE todos SET completed = ?, last_modified_at = ? WHERE user_id = ? AND completed != ? RETURNING id',
+        (1, "2000-01-01", 1, 1),
+        ("idx_todos_user_status_modified_id", "idx_todos_user_version"),
+    ),
+    "todo_changes": (
+        'SELECT id FROM todos WHERE user_id = ? AND version > ? ORDER BY version LIMIT ?',
+        (1, 0, 100), "idx_todos_user_version",
+    ),
+    "todo_changes_reset": (
+        'SELECT id FROM todos WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?',
+        (1, 0, 100), "idx_todos_user_id",
+    ),
+    "tombstone_changes": (
+        'SELECT todo_id FROM todo_tombstones WHERE user_id = ? AND version > ? ORDER BY version LIMIT ?',
+        (1, 0, 100), "idx_tombstones_user_version",
+    ),
+    "export_todos": (
+        'SELECT id, title, description, completed, created_at, last_modified_at FROM todos '
+        'WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?',
+        (1, 0, 1000), "idx_todos_user_id",
+    ),
+    "archivable_todos": (
+        'SELECT id FROM todos WHERE completed = 1 AND last_modified_at < ? LIMIT ?', ("2000-01-01", 500),
+        "idx_todos_archivable",
+    ),
+    "get_archived_todos_page": ('''
+        SELECT t.id, t.title, t.description, t.completed, t.created_at,
+               t.last_modified_at, u.username as created_by
+        FROM todos_archive t
+        JOIN users u ON t.user_id = u.id
+        WHERE t.user_id = ? AND (t.last_modified_at, t.id) < (?, ?)
+        ORDER BY t.last_modified_at DESC, t.id DESC
+        LIMIT ?
+    ''', (1, "2000-01-01", 1, 100), "idx_todos_archive_user_modified_id"),
+    "export_archived_todos": (
+        'SELECT id, title, description, completed, created_at, last_modified_at FROM todos_archive '
+        'WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?',
+        (1, 0, 1000), "idx_todos_archive_user_id",
+    ),
+    "verify_session": ('''
+        SELECT u.id, u.username, u.email, s.expires_at
+        FROM sessions s
+        JOIN users u ON s.user_id = u.id
+        WHERE s.session_token = ? AND s.expires_at > ?
+    ''', ("token", "2000-01-01"), "sqlite_autoindex_sessions_1"),
+    "expired_sessions": (
+        'SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?', ("2000-01-01", 500), "idx_sessions_expires_at",
+    ),
+    "new_revocations": (
+        'SELECT id, jti, expires_at FROM revoked_tokens WHERE id > ? AND expires_at > ? ORDER BY id',
+        (0, "2000-01-01"), "INTEGER PRIMARY KEY",
+    ),
+    "idle_rate_limits": (
+        'SELECT key FROM rate_limits WHERE updated_at < ? LIMIT ?', (0.0, 500), "idx_rate_limits_updated_at",
+    ),
+    "user_sessions_over_cap": (
+        'SELECT id FROM sessions WHERE user_id = ? ORDER BY id DESC LIMIT -1 OFFSET ?', (1, 10),
+        "idx_sessions_user_id",
+    ),
+}
+
+
+def _ensure_version_table(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    _ensure_version_table(conn)
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply every pending migration and return the resulting schema version.
+
+    Safe to call from several workers at once: the version is re-read after
+    taking the write lock, so each migration still runs exactly once.
+    """
+    applied = current_version(conn)
+    for version, description, statements in MIGRATIONS:
+        if version <= applied:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,)).fetchone()
+            if row is None:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(
+                    'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                    (version, description, datetime.utcnow())
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return current_version(conn)
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: tuple) -> List[str]:
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+
+
+def check_query_plans(conn: sqlite3.Connection) -> List[str]:
+    """Return a list of problems; empty when every hot query uses its index."""
+    problems = []
+    for name, (sql, params, indexes) in HOT_QUERIES.items():
+        if isinstance(indexes, str):
+            indexes = (indexes,)
+        plan = explain(conn, sql, params)
+        if not any(index in step for step in plan for index in indexes):
+            problems.append(f"{name}: expected one of {indexes}, got {plan}")
+        if any('USE TEMP B-TREE' in step for step in plan):
+            problems.append(f"{name}: sorts in a temp b-tree: {plan}")
+    return problems
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from database import get_connection
+
+    parser = argparse.ArgumentParser(description="Apply schema migrations")
+    parser.add_argument("--check", action="store_true", help="verify hot query plans use indexes")
+    args = parser.parse_args()
+
+    with get_connection() as conn:
+        print(f"Schema version: {migrate(conn)}")
+        if args.check:
+            for name, (sql, params, _) in HOT_QUERIES.items():
+                print(f"{name}:")
+                for step in explain(conn, sql, params):
+                    print(f"    {step}")
+            problems = check_query_plans(conn)
+            for problem in problems:
+                print(f"FAIL {problem}")
+            sys.exit(1 if problems else 0)
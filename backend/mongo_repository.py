@@ -0,0 +1,518 @@
+"""MongoDB backend on the motor collections from db_config.py.
+
+Documents keep the API's integer ids (allocated from ``counters``) as
+``_id``, and todos carry the same per-user change ``version`` as the SQLite
+schema, with deletes recorded in ``todo_tombstones``. Each write and its
+version bump run in one transaction so /todos/changes never sees a version
+before its row; transactions need a replica set (Atlas always is one). For a
+standalone mongod set MONGODB_TRANSACTIONS=0, at the cost of that guarantee.
+Archived todos live in ``todos_archive``, with the same documents less
+``version``.
+"""
+import logging
+import os
+import secrets
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+import db_config
+from repository import (
+    SESSION_MAX_PER_USER, SESSION_RENEW_INTERVAL, SESSION_TTL,
+    Repository, TodoConflict, batch_results, check_batch, matches_all, reset_page, rolled_back, search_result,
+    search_terms,
+)
+
+logger = logging.getLogger(__name__)
+
+MONGODB_TRANSACTIONS = os.getenv("MONGODB_TRANSACTIONS", "1") == "1"
+
+
+class MongoRepository(Repository):
+    name = "mongo"
+
+    def __init__(self):
+        self.client = None
+        # Usernames never change, so created_by is looked up once per user
+        self._usernames: Dict[int, str] = {}
+
+    def _connect(self) -> None:
+        if self.client is not None:
+            return
+        self.client = db_config.get_client()
+        db = db_config.get_db()
+        self.users = db.users
+        self.sessions = db.sessions
+        self.revocations = db.revoked_tokens
+        self.todos = db.todos
+        self.archive = db.todos_archive
+        self.versions = db.todo_versions
+        self.tombstones = db.todo_tombstones
+        self.counters = db.counters
+
+    async def start(self) -> None:
+        self._connect()
+        await super().start()
+
+    async def migrate(self) -> None:
+        self._connect()
+        await self.users.create_index("username", unique=True)
+        await self.users.create_index("email", unique=True)
+        await self.sessions.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
+        await self.sessions.create_index("expires_at")
+        await self.revocations.create_index("jti", unique=True)
+        await self.revocations.create_index("expires_at")
+        # Same shape as idx_todos_user_completed_modified: one seek per group
+        await self.todos.create_index([
+            ("user_id", ASCENDING), ("completed", ASCENDING),
+            ("last_modified_at", DESCENDING), ("_id", DESCENDING),
+        ])
+        await self.todos.create_index([("user_id", ASCENDING), ("version", ASCENDING)])
+        await self.todos.create_index([("user_id", ASCENDING), ("_id", ASCENDING)])
+        await self.tombstones.create_index([("user_id", ASCENDING), ("version", ASCENDING)])
+        # Only completed todos not archived yet, as idx_todos_archivable
+        await self.todos.create_index(
+            [("last_modified_at", ASCENDING)], partialFilterExpression={"completed": True}
+        )
+        await self.archive.create_index([
+            ("user_id", ASCENDING), ("last_modified_at", DESCENDING), ("_id", DESCENDING),
+        ])
+        await self.archive.create_index([("user_id", ASCENDING), ("_id", ASCENDING)])
+
+    async def close(self) -> None:
+        if self.client is not None:
+            self.client.close()
+
+    @asynccontextmanager
+    async def _transaction(self):
+        if not MONGODB_TRANSACTIONS:
+            yield None
+            return
+        async with await self.client.start_session() as session:
+            async with session.start_transaction():
+                yield session
+
+    async def _next_ids(self, name: str, count: int = 1, session=None) -> List[int]:
+        counter = await self.counters.find_one_and_update(
+            {"_id": name}, {"$inc": {"seq": count}},
+            upsert=True, return_document=ReturnDocument.AFTER, session=session,
+        )
+        return list(range(counter["seq"] - count + 1, counter["seq"] + 1))
+
+    async def _bump(self, user_id: int, count: int = 1, session=None) -> List[int]:
+        """Reserve the next ``count`` versions of a user's todo list."""
+        doc = await self.versions.find_one_and_update(
+            {"_id": user_id}, {"$inc": {"version": count}},
+            upsert=True, return_document=ReturnDocument.AFTER, session=session,
+        )
+        return list(range(doc["version"] - count + 1, doc["version"] + 1))
+
+    async def _username(self, user_id: int) -> str:
+        if user_id not in self._usernames:
+            user = await self.users.find_one({"_id": user_id}, {"username": 1})
+            self._usernames[user_id] = user["username"] if user else None
+        return self._usernames[user_id]
+
+    async def _row(self, doc: Dict, with_version: bool = False) -> Dict:
+        row = {
+            'id': doc['_id'],
+            'title': doc['title'],
+            'description': doc.get('description'),
+            'completed': doc['completed'],
+            'created_at': str(doc['created_at']),
+            'last_modified_at': str(doc['last_modified_at']),
+            'created_by': await self._username(doc['user_id']),
+        }
+        if with_version:
+            row['version'] = doc['version']
+        return row
+
+    # Users
+    async def create_user(self, username, email, password_hash):
+        user_id, = await self._next_ids("users")
+        try:
+            await self.users.insert_one(
+                {"_id": user_id, "username": username, "email": email, "password_hash": password_hash}
+            )
+        except DuplicateKeyError as e:
+            logger.info("User already exists", extra={"username": username, "error": str(e)})
+            return None
+        return {'id': user_id, 'username': username, 'email': email}
+
+    async def get_user_credentials(self, username):
+        user = await self.users.find_one({"username": username})
+        if user is None:
+            return None
+        return {'id': user['_id'], 'username': user['username'], 'email': user['email'],
+                'password_hash': user['password_hash']}
+
+    async def update_password_hash(self, user_id, password_hash):
+        result = await self.users.update_one({"_id": user_id}, {"$set": {"password_hash": password_hash}})
+        return result.matched_count > 0
+
+    # Sessions
+    async def create_session(self, user_id):
+        session_token = secrets.token_urlsafe(24)
+        now = datetime.utcnow()
+        await self.sessions.insert_one(
+            {"_id": session_token, "user_id": user_id, "created_at": now, "expires_at": now + SESSION_TTL}
+        )
+        if SESSION_MAX_PER_USER > 0:
+            dropped = await self.sessions.find(
+                {"user_id": user_id}, {"_id": 1}
+            ).sort("created_at", DESCENDING).skip(SESSION_MAX_PER_USER).to_list(None)
+            if dropped:
+                await self.sessions.delete_many({"_id": {"$in": [doc["_id"] for doc in dropped]}})
+        return session_token
+
+    async def verify_session(self, session_token):
+        now = datetime.utcnow()
+        session = await self.sessions.find_one({"_id": session_token, "expires_at": {"$gt": now}})
+        if session is None:
+            return None
+        user = await self.users.find_one({"_id": session["user_id"]}, {"username": 1, "email": 1})
+        if user is None:
+            return None
+        user = {'id': user['_id'], 'username': user['username'], 'email': user['email']}
+        if SESSION_RENEW_INTERVAL and session['expires_at'] - now < SESSION_TTL - SESSION_RENEW_INTERVAL:
+            expires_at = now + SESSION_TTL
+            await self.sessions.update_one({"_id": session_token}, {"$set": {"expires_at": expires_at}})
+            return {**user, 'session_expires_at': expires_at}
+        return user
+
+    async def delete_session(self, session_token):
+        result = await self.sessions.delete_one({"_id": session_token})
+        return result.deleted_count > 0
+
+    async def _delete_expired(self, collection, batch_size: int) -> int:
+        expired = await collection.find(
+            {"expires_at": {"$lte": datetime.utcnow()}}, {"_id": 1}
+        ).limit(batch_size).to_list(None)
+        if not expired:
+            return 0
+        result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in expired]}})
+        return result.deleted_count
+
+    async def delete_expired_sessions(self, batch_size=500):
+        return await self._delete_expired(self.sessions, batch_size)
+
+    # Signed-token revocations
+    async def revoke_token(self, jti, expires_at):
+        if await self.revocations.find_one({"jti": jti}, {"_id": 1}):
+            return
+        revocation_id, = await self._next_ids("revoked_tokens")
+        try:
+            await self.revocations.insert_one({"_id": revocation_id, "jti": jti, "expires_at": expires_at})
+        except DuplicateKeyError:
+            pass
+
+    async def get_revoked_tokens(self, after_id=0):
+        docs = await self.revocations.find(
+            {"_id": {"$gt": after_id}, "expires_at": {"$gt": datetime.utcnow()}}
+        ).sort("_id", ASCENDING).to_list(None)
+        return [{'id': doc['_id'], 'jti': doc['jti'], 'expires_at': doc['expires_at']} for doc in docs]
+
+    async def delete_expired_revocations(self, batch_size=500):
+        return await self._delete_expired(self.revocations, batch_size)
+
+    # Todo reads
+    async def get_user_todos(self, user_id, limit=None, cursor=None, completed=None, modified_since=None,
+                             include_archived=False):
+        todos = []
+        groups = [bool(completed)] if completed is not None else [False, True]
+        for group in groups:
+            if cursor is not None and int(group) < cursor[0]:
+                continue
+            query: Dict = {"user_id": user_id, "completed": group}
+            if cursor is not None and int(group) == cursor[0]:
+                last_modified_at = datetime.fromisoformat(cursor[1])
+                query["$or"] = [
+                    {"last_modified_at": {"$lt": last_modified_at}},
+                    {"last_modified_at": last_modified_at, "_id": {"$lt": cursor[2]}},
+                ]
+            if modified_since is not None:
+                query["last_modified_at"] = {"$gte": modified_since}
+            collections = [self.todos, self.archive] if include_archived and group else [self.todos]
+            docs = []
+            for collection in collections:
+                find = collection.find(query).sort([("last_modified_at", DESCENDING), ("_id", DESCENDING)])
+                if limit is not None:
+                    find = find.limit(limit - len(todos))
+                docs.extend(await find.to_list(None))
+            if len(collections) > 1:
+                docs.sort(key=lambda doc: (doc["last_modified_at"], doc["_id"]), reverse=True)
+                if limit is not None:
+                    docs = docs[:limit - len(todos)]
+            todos.extend([await self._row(doc) for doc in docs])
+            if limit is not None and len(todos) >= limit:
+                break
+        return todos
+
+    async def get_user_todo(self, user_id, todo_id):
+        doc = (await self.todos.find_one({"_id": todo_id, "user_id": user_id})
+               or await self.archive.find_one({"_id": todo_id, "user_id": user_id}))
+        return await self._row(doc) if doc else None
+
+    async def count_todos_to_update(self, user_id, completed):
+        return await self.todos.count_documents({"user_id": user_id, "completed": {"$ne": completed}})
+
+    async def get_todo_version(self, user_id):
+        doc = await self.versions.find_one({"_id": user_id})
+        return doc["version"] if doc else 0
+
+    async def get_todo_versions(self, user_ids):
+        docs = await self.versions.find({"_id": {"$in": list(user_ids)}}).to_list(None)
+        return {doc["_id"]: doc["version"] for doc in docs}
+
+    async def get_todo_changes(self, user_id, since, limit=500, cursor=None):
+        async with self._transaction() as session:
+            doc = await self.versions.find_one({"_id": user_id}, session=session)
+            current = doc["version"] if doc else 0
+            if cursor is not None or since > current:
+                docs = await self.todos.find(
+                    {"user_id": user_id, "_id": {"$gt": cursor or 0}}, session=session
+                ).sort("_id").limit(limit + 1).to_list(None)
+                todos = [await self._row(d, with_version=True) for d in docs]
+                return reset_page(todos, limit, current if cursor is None else since, cursor)
+
+            changed = await self.todos.find(
+                {"user_id": user_id, "version": {"$gt": since}}, session=session
+            ).sort("version").limit(limit + 1).to_list(None)
+            deleted = await self.tombstones.find(
+                {"user_id": user_id, "version": {"$gt": since}}, {"_id": 0, "todo_id": 1, "version": 1},
+                session=session,
+            ).sort("version").limit(limit + 1).to_list(None)
+
+        events = sorted(
+            [(d['version'], await self._row(d, with_version=True)) for d in changed]
+            + [(d['version'], d) for d in deleted],
+            key=lambda event: event[0]
+        )
+        has_more = len(events) > limit
+        events = events[:limit]
+        return {
+            'version': events[-1][0] if has_more else current,
+            'reset': False,
+            'todos': [event for _, event in events if 'todo_id' not in event],
+            'deleted': [event['todo_id'] for _, event in events if 'todo_id' in event],
+            'has_more': has_more,
+            'cursor': None,
+        }
+
+    async def search_todos(self, user_id, text, limit=20):
+        terms = search_terms(text)
+        if not terms:
+            return []
+        # No index can do accent-insensitive prefix matching, so match like
+        # the memory backend does over the user's titles and descriptions
+        docs = [
+            doc for doc in await self.todos.find({"user_id": user_id}).to_list(None)
+            if matches_all(terms, doc['title'], doc.get('description'))
+        ]
+        results = [search_result(await self._row(doc), terms) for doc in docs]
+        results.sort(key=lambda r: (r['rank'], -r['id']))
+        return results[:limit]
+
+    async def export_todos(self, user_id, after_id=0, limit=1000):
+        docs = []
+        for collection in (self.todos, self.archive):
+            docs.extend(await collection.find(
+                {"user_id": user_id, "_id": {"$gt": after_id}},
+                {"title": 1, "description": 1, "completed": 1, "created_at": 1, "last_modified_at": 1},
+            ).sort("_id", ASCENDING).limit(limit).to_list(None))
+        docs = sorted(docs, key=lambda doc: doc["_id"])[:limit]
+        return [{
+            'id': doc['_id'], 'title': doc['title'], 'description': doc.get('description'),
+            'completed': doc['completed'], 'created_at': str(doc['created_at']),
+            'last_modified_at': str(doc['last_modified_at']),
+        } for doc in docs]
+
+    # Todo writes
+    async def create_todo(self, user_id, title, description=None):
+        now = datetime.utcnow()
+        async with self._transaction() as session:
+            todo_id, = await self._next_ids("todos", session=session)
+            version, = await self._bump(user_id, session=session)
+            doc = {"_id": todo_id, "title": title, "description": description, "completed": False,
+                   "user_id": user_id, "created_at": now, "last_modified_at": now, "version": version}
+            await self.todos.insert_one(doc, session=session)
+        return await self._row(doc)
+
+    async def _unarchive(self, user_id: int, todo_ids: List[int], session) -> List[int]:
+        """Move the user's archived todos among ``todo_ids`` back, as new versions."""
+        docs = await self.archive.find({"_id": {"$in": todo_ids}, "user_id": user_id}, session=session).to_list(None)
+        if not docs:
+            return []
+        ids = [doc["_id"] for doc in docs]
+        versions = await self._bump(user_id, len(docs), session=session)
+        # Upserts, so a move left half done without transactions can be redone
+        await self.todos.bulk_write([
+            ReplaceOne({"_id": doc["_id"]}, {key: value for key, value in doc.items() if key != "archived_at"}
+                       | {"version": version}, upsert=True)
+            for doc, version in zip(docs, versions)
+        ], ordered=False, session=session)
+        await self.archive.delete_many({"_id": {"$in": ids}}, session=session)
+        await self.tombstones.delete_many({"user_id": user_id, "todo_id": {"$in": ids}}, session=session)
+        return ids
+
+    async def _editable(self, user_id: int, todo_id: int, session, unchanged_since: Optional[int] = None) -> bool:
+        """Whether the user has this todo, making it active again if it was archived."""
+        doc = await self.todos.find_one({"_id": todo_id, "user_id": user_id}, {"version": 1}, session=session)
+        if doc:
+            if unchanged_since is not None and doc.get("version", 0) > unchanged_since:
+                raise TodoConflict(todo_id)
+            return True
+        if unchanged_since is not None:
+            # An archived todo's version is that of the tombstone archiving wrote
+            tombstone = await self.tombstones.find_one(
+                {"user_id": user_id, "todo_id": todo_id}, {"version": 1}, sort=[("version", DESCENDING)],
+                session=session,
+            )
+            if tombstone and tombstone["version"] > unchanged_since and await self.archive.find_one(
+                {"_id": todo_id, "user_id": user_id}, {"_id": 1}, session=session
+            ):
+                raise TodoConflict(todo_id)
+        return bool(await self._unarchive(user_id, [todo_id], session))
+
+    async def _update_one(self, user_id: int, todo_id: int, fields: Dict,
+                          unchanged_since: Optional[int] = None) -> Optional[Dict]:
+        async with self._transaction() as session:
+            if not await self._editable(user_id, todo_id, session, unchanged_since):
+                return None
+            version, = await self._bump(user_id, session=session)
+            doc = await self.todos.find_one_and_update(
+                {"_id": todo_id, "user_id": user_id},
+                {"$set": {**fields, "last_modified_at": datetime.utcnow(), "version": version}},
+                return_document=ReturnDocument.AFTER, session=session,
+            )
+        return await self._row(doc) if doc else None
+
+    async def update_todo_status(self, user_id, todo_id, completed, unchanged_since=None):
+        return await self._update_one(user_id, todo_id, {"completed": completed}, unchanged_since)
+
+    async def update_todo(self, user_id, todo_id, title, description=None, unchanged_since=None):
+        return await self._update_one(user_id, todo_id, {"title": title, "description": description},
+                                      unchanged_since)
+
+    async def _delete_docs(self, user_id: int, todo_ids: List[int], session) -> None:
+        versions = await self._bump(user_id, len(todo_ids), session=session)
+        now = datetime.utcnow()
+        await self.todos.delete_many({"_id": {"$in": todo_ids}, "user_id": user_id}, session=session)
+        await self.tombstones.insert_many([
+            {"user_id": user_id, "todo_id": todo_id, "version": version, "deleted_at": now}
+            for todo_id, version in zip(todo_ids, versions)
+        ], session=session)
+
+    async def delete_todo(self, user_id, todo_id, unchanged_since=None):
+        async with self._transaction() as session:
+            if not await self._editable(user_id, todo_id, session, unchanged_since):
+                return False
+            await self._delete_docs(user_id, [todo_id], session)
+        return True
+
+    async def update_all_todos_status(self, user_id, completed, limit=None):
+        async with self._transaction() as session:
+            find = self.todos.find({"user_id": user_id, "completed": {"$ne": completed}}, {"_id": 1}, session=session)
+            if limit is not None:
+                find = find.limit(limit)
+            ids = [doc["_id"] for doc in await find.to_list(None)]
+            if not ids:
+                return []
+            versions = await self._bump(user_id, len(ids), session=session)
+            now = datetime.utcnow()
+            await self.todos.bulk_write([
+                UpdateOne({"_id": todo_id}, {"$set": {"completed": completed, "last_modified_at": now,
+                                                      "version": version}})
+                for todo_id, version in zip(ids, versions)
+            ], ordered=False, session=session)
+        return ids
+
+    async def apply_todo_batch(self, user_id, operations, atomic=True):
+        results = batch_results(operations)
+        async with self._transaction() as session:
+            referenced = [op['id'] for op in operations if op['op'] != 'create']
+            existing = {doc["_id"] for doc in await self.todos.find(
+                {"_id": {"$in": referenced}, "user_id": user_id}, {"_id": 1}, session=session
+            ).to_list(None)}
+            archived = {doc["_id"] for doc in await self.archive.find(
+                {"_id": {"$in": referenced}, "user_id": user_id}, {"_id": 1}, session=session
+            ).to_list(None)}
+            check_batch(operations, results, existing | archived)
+            if atomic and any(result['status'] != 'ok' for result in results):
+                return rolled_back(results)
+
+            apply = [(op, result) for op, result in zip(operations, results) if result['status'] == 'ok']
+            if archived:
+                await self._unarchive(user_id, [op['id'] for op, _ in apply if op['id'] in archived], session)
+            creates = sum(1 for op, _ in apply if op['op'] == 'create')
+            new_ids = iter(await self._next_ids("todos", creates, session=session) if creates else [])
+            versions = iter(await self._bump(user_id, len(apply), session=session) if apply else [])
+            now = datetime.utcnow()
+            for op, result in apply:
+                version = next(versions)
+                if op['op'] == 'create':
+                    result['id'] = next(new_ids)
+                    await self.todos.insert_one({
+                        "_id": result['id'], "title": op['title'], "description": op.get('description'),
+                        "completed": False, "user_id": user_id, "created_at": now, "last_modified_at": now,
+                        "version": version,
+                    }, session=session)
+                elif op['op'] == 'delete':
+                    await self.todos.delete_one({"_id": op['id']}, session=session)
+                    await self.tombstones.insert_one(
+                        {"user_id": user_id, "todo_id": op['id'], "version": version, "deleted_at": now},
+                        session=session,
+                    )
+                else:
+                    fields = ({"completed": op['completed']} if op['op'] == 'patch'
+                              else {"title": op['title'], "description": op.get('description')})
+                    await self.todos.update_one(
+                        {"_id": op['id']}, {"$set": {**fields, "last_modified_at": now, "version": version}},
+                        session=session,
+                    )
+
+            touched = [result['id'] for _, result in apply if result['op'] != 'delete']
+            rows = {doc["_id"]: doc for doc in await self.todos.find(
+                {"_id": {"$in": touched}}, session=session
+            ).to_list(None)}
+        for _, result in apply:
+            if result['op'] != 'delete' and result['id'] in rows:
+                result['todo'] = await self._row(rows[result['id']])
+        return {'committed': True, 'results': results}
+
+    async def import_todos(self, user_id, rows):
+        if not rows:
+            return 0
+        now = datetime.utcnow()
+        async with self._transaction() as session:
+            ids = await self._next_ids("todos", len(rows), session=session)
+            versions = await self._bump(user_id, len(rows), session=session)
+            await self.todos.insert_many([
+                {"_id": todo_id, "title": row['title'], "description": row.get('description'),
+                 "completed": bool(row.get('completed', False)), "user_id": user_id,
+                 "created_at": now, "last_modified_at": now, "version": version}
+                for row, todo_id, version in zip(rows, ids, versions)
+            ], ordered=False, session=session)
+        return len(rows)
+
+    async def archive_todos(self, completed_before, limit=500):
+        docs = await self.todos.find(
+            {"completed": True, "last_modified_at": {"$lt": completed_before}}
+        ).limit(limit).to_list(None)
+        by_user: Dict[int, List[Dict]] = {}
+        for doc in docs:
+            by_user.setdefault(doc["user_id"], []).append(doc)
+        now = datetime.utcnow()
+        for user_id, user_docs in by_user.items():
+            async with self._transaction() as session:
+                await self.archive.bulk_write([
+                    ReplaceOne({"_id": doc["_id"]},
+                               {key: value for key, value in doc.items() if key != "version"} | {"archived_at": now},
+                               upsert=True)
+                    for doc in user_docs
+                ], ordered=False, session=session)
+                await self._delete_docs(user_id, [doc["_id"] for doc in user_docs], session)
+        return {user_id: len(user_docs) for user_id, user_docs in by_user.items()}
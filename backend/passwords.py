@@ -0,0 +1,135 @@
+import asyncio
+import math
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+import bcrypt
+
+from metrics import PASSWORD_HASH_LATENCY, PASSWORD_HASHES_IN_FLIGHT, PASSWORD_HASHES_SHED
+
+# bcrypt is deliberately CPU-heavy, so it gets its own small worker pool. A
+# burst of logins can then only ever occupy PASSWORD_HASH_WORKERS cores and
+# never the threads that serve todo traffic.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# "thread" (bcrypt releases the GIL while hashing) or "process"
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+# Cost factor for new hashes. Existing hashes with another cost are
+# rehashed on the user's next successful login (see ``needs_rehash``).
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Admission control. Rather than queueing behind the workers, a hash is
+# refused with PasswordHashBusy when this many are already in flight or when
+# the queue ahead of it is expected to take longer than
+# PASSWORD_HASH_MAX_QUEUE_SECONDS, judged from recent bcrypt times, so the
+# limit adapts to BCRYPT_ROUNDS and the hardware. 0 disables either check.
+PASSWORD_HASH_MAX_IN_FLIGHT = int(os.getenv("PASSWORD_HASH_MAX_IN_FLIGHT", str(PASSWORD_HASH_WORKERS * 8)))
+PASSWORD_HASH_MAX_QUEUE_SECONDS = float(os.getenv("PASSWORD_HASH_MAX_QUEUE_SECONDS", "1.0"))
+
+_executor: Optional[Executor] = None
+
+
+class PasswordHashBusy(Exception):
+    """Too much bcrypt work is queued already; try again after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Password hashing is busy, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class _Admission:
+    """In-flight count and a moving average of bcrypt time for this process.
+
+    Only touched from the event loop, so it needs no lock.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.average: Optional[float] = None
+
+    def queue_seconds(self) -> float:
+        """Expected wait before a newly admitted hash starts running."""
+        if self.average is None or self.in_flight < PASSWORD_HASH_WORKERS:
+            return 0.0
+        return self.average * (self.in_flight - PASSWORD_HASH_WORKERS + 1) / PASSWORD_HASH_WORKERS
+
+    def admit(self, operation: str) -> None:
+        if (0 < PASSWORD_HASH_MAX_IN_FLIGHT <= self.in_flight
+                or 0 < PASSWORD_HASH_MAX_QUEUE_SECONDS < self.queue_seconds()):
+            PASSWORD_HASHES_SHED.inc(operation)
+            # Roughly when everything in flight now will have finished
+            drain = (self.average or 0.0) * self.in_flight / PASSWORD_HASH_WORKERS
+            raise PasswordHashBusy(max(1.0, math.ceil(drain)))
+        self.in_flight += 1
+        PASSWORD_HASHES_IN_FLIGHT.inc()
+
+    def done(self, seconds: Optional[float]) -> None:
+        self.in_flight -= 1
+        PASSWORD_HASHES_IN_FLIGHT.dec()
+        if seconds is not None:
+            self.average = seconds if self.average is None else 0.8 * self.average + 0.2 * seconds
+
+
+admission = _Admission()
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+            )
+    return _executor
+
+
+def _hashpw(password: bytes, rounds: int) -> Tuple[bytes, float]:
+    start = time.perf_counter()
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)), time.perf_counter() - start
+
+
+def _checkpw(password: bytes, password_hash: bytes) -> Tuple[bool, float]:
+    start = time.perf_counter()
+    return bcrypt.checkpw(password, password_hash), time.perf_counter() - start
+
+
+async def _run(operation: str, func, *args):
+    admission.admit(operation)
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    elapsed = None
+    try:
+        result, elapsed = await loop.run_in_executor(_get_executor(), func, *args)
+        return result
+    finally:
+        admission.done(elapsed)
+        PASSWORD_HASH_LATENCY.observe(time.perf_counter() - start, operation)
+
+
+async def hash_password(password: str) -> bytes:
+    """Hash a password on the password worker pool; raises PasswordHashBusy when overloaded."""
+    return await _run("hash", _hashpw, password.encode('utf-8'), BCRYPT_ROUNDS)
+
+
+async def check_password(password: str, password_hash: bytes) -> bool:
+    """Check a password against its bcrypt hash; raises PasswordHashBusy when overloaded."""
+    return await _run("check", _checkpw, password.encode('utf-8'), bytes(password_hash))
+
+
+def needs_rehash(password_hash: bytes) -> bool:
+    """Whether a bcrypt hash was made with another cost than BCRYPT_ROUNDS."""
+    try:
+        return int(bytes(password_hash).split(b'$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+def shutdown() -> None:
+    """Stop the hashing workers; called from the app's lifespan on shutdown."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
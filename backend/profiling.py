@@ -0,0 +1,109 @@
+"""Opt-in sampling profiler that dumps stacks for slow requests.
+
+Enable with PROFILE_SLOW_REQUESTS_MS=<threshold>. While any request is in
+flight a background thread samples every thread's stack every
+PROFILE_INTERVAL_MS; when a request takes longer than the threshold, the
+samples taken during it are written to PROFILE_DIR in the collapsed
+("folded") format that flamegraph.pl and speedscope read directly. Each stack
+is rooted at its thread name, so event-loop, sqlite and bcrypt time show up
+as separate towers.
+
+Samples cover the whole process, so with concurrent requests a dump also
+contains whatever else was running at the time.
+"""
+import asyncio
+import collections
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler:
+    def __init__(self, threshold: float, interval: float = 0.005, out_dir: str = "profiles",
+                 max_samples: int = 100_000):
+        self.threshold = threshold
+        self.interval = interval
+        self.out_dir = out_dir
+        self._samples: "collections.deque" = collections.deque(maxlen=max_samples)
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            os.makedirs(self.out_dir, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            # Sleep until a request is in flight, then sample at the interval
+            self._wake.wait()
+            time.sleep(self.interval)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            now = time.perf_counter()
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    self._samples.append((now, f"{names.get(ident, ident)};{_fold(frame)}"))
+
+    def request_started(self) -> None:
+        with self._lock:
+            self._active += 1
+            self._wake.set()
+
+    async def request_finished(self, start: float, end: float, label: str) -> None:
+        with self._lock:
+            self._active -= 1
+            if not self._active:
+                self._wake.clear()
+        if end - start >= self.threshold:
+            # Counting up to max_samples stacks and writing the file would stall the loop
+            await asyncio.to_thread(self._dump, start, end, label)
+
+    def _dump(self, start: float, end: float, label: str) -> None:
+        counts = collections.Counter(stack for t, stack in list(self._samples) if start <= t <= end)
+        if not counts:
+            return
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")
+        duration_ms = (end - start) * 1000
+        path = os.path.join(self.out_dir, f"{time.strftime('%Y%m%dT%H%M%S')}-{slug}-{int(duration_ms)}ms.folded")
+        try:
+            with open(path, "w") as out:
+                for stack, count in counts.most_common():
+                    out.write(f"{stack} {count}\n")
+        except OSError:
+            logger.exception("Could not write profile", extra={"path": path})
+            return
+        logger.warning("Slow request profiled", extra={
+            "route": label, "duration_ms": round(duration_ms, 1), "profile": path,
+        })
+
+
+def profiler_from_env() -> Optional[SlowRequestProfiler]:
+    threshold_ms = os.getenv("PROFILE_SLOW_REQUESTS_MS")
+    if not threshold_ms:
+        return None
+    profiler = SlowRequestProfiler(
+        threshold=float(threshold_ms) / 1000,
+        interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+        out_dir=os.getenv("PROFILE_DIR", "profiles"),
+    )
+    profiler.start()
+    return profiler
@@ -0,0 +1,99 @@
+"""Coalescing and micro-caching of identical GET /todos/ reads.
+
+Several tabs or devices of one user tend to ask for the same list at the
+same moment. Reads are keyed by (user_id, todo version, query parameters);
+concurrent reads with the same key share one query and one encoded body
+(single-flight, READ_COALESCING=1, the default), and with READ_CACHE_TTL_MS
+above 0 the encoded body is also kept that long for the next identical read.
+
+The todo version is read before anything else and changes with every write
+(whichever worker makes it), so a read that starts after a write has
+completed always has a new key: it can neither join a query started before
+the write nor be served a body cached before it. Mutation routes also drop
+the user's cached bodies in this process (``invalidate``) so they do not
+linger. ``python -m benchmarks.read_coalescing`` checks this under load.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import metrics
+from cache import TTLCache
+
+READ_COALESCING = os.getenv("READ_COALESCING", "1") == "1"
+READ_CACHE_TTL = float(os.getenv("READ_CACHE_TTL_MS", "0")) / 1000
+# Users with cached bodies, and distinct queries kept per user
+READ_CACHE_SIZE = int(os.getenv("READ_CACHE_SIZE", "10000"))
+READ_CACHE_QUERIES_PER_USER = 16
+
+# An encoded body and its X-Next-Cursor
+Body = Tuple[bytes, Optional[str]]
+
+
+class TodoReads:
+    def __init__(self, coalescing: bool = READ_COALESCING, ttl: float = READ_CACHE_TTL,
+                 maxsize: int = READ_CACHE_SIZE):
+        self.coalescing = coalescing
+        self.ttl = ttl
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        # user_id -> (version, {params: (body, expires_at)})
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl) if ttl > 0 else None
+
+    async def get(self, user_id: int, version: int, params: Hashable, load: Callable[[], Awaitable[Body]]) -> Body:
+        """The body for this read: cached, shared with an identical read in flight, or ``load()``ed."""
+        cached = self._cached(user_id, version, params)
+        if cached is not None:
+            metrics.TODO_READS.inc("cache_hit")
+            return cached
+        if not self.coalescing:
+            metrics.TODO_READS.inc("query")
+            return self._store(user_id, version, params, await load())
+
+        key = (user_id, version, params)
+        flight = self._flights.get(key)
+        if flight is not None:
+            metrics.TODO_READS.inc("coalesced")
+        else:
+            metrics.TODO_READS.inc("query")
+            flight = asyncio.create_task(load())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        # Shielded: one client going away must not cancel the others' read
+        return self._store(user_id, version, params, await asyncio.shield(flight))
+
+    def invalidate(self, user_id: int) -> None:
+        if self._cache is not None:
+            self._cache.delete(user_id)
+
+    def _cached(self, user_id: int, version: int, params: Hashable) -> Optional[Body]:
+        if self._cache is None:
+            return None
+        entry = self._cache.get(user_id)
+        if entry is None or entry[0] != version:
+            return None
+        hit = entry[1].get(params)
+        if hit is None or hit[1] <= time.monotonic():
+            return None
+        return hit[0]
+
+    def _store(self, user_id: int, version: int, params: Hashable, body: Body) -> Body:
+        if self._cache is None:
+            return body
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[0] > version:
+            return body  # a newer version is cached already
+        if entry is None or entry[0] != version:
+            entry = (version, {})
+        queries = entry[1]
+        queries[params] = (body, time.monotonic() + self.ttl)
+        while len(queries) > READ_CACHE_QUERIES_PER_USER:
+            queries.pop(next(iter(queries)))
+        self._cache.set(user_id, entry)
+        return body
+
+    def stats(self) -> Dict:
+        stats = {'in_flight': len(self._flights)}
+        if self._cache is not None:
+            stats.update(self._cache.stats())
+        return stats
@@ -0,0 +1,364 @@
+"""Storage backend interface used by the API routes.
+
+Every route in main.py reads and writes through a ``Repository``; which one
+is picked by STORAGE_BACKEND:
+
+    sqlite  (default) database.py's sqlite3 helpers, run off the event loop
+    sharded the same helpers, with each user's todos in a shard file (shards.py)
+    memory  plain dicts in this process; for tests and benchmarks
+    mongo   motor, on the collections from db_config.py
+
+All backends return the same dicts as the sqlite helpers (``Optional[Dict]``
+for single rows, ``None``/``False`` when a row does not exist or does not
+belong to the user) and must pass ``python -m benchmarks.repository_conformance``.
+Backend modules are only imported when selected, so running on one backend
+does not need the others' drivers installed.
+"""
+import base64
+import functools
+import json
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Session settings shared by every backend
+SESSION_TTL = timedelta(days=int(os.getenv("SESSION_TTL_DAYS", "7")))
+# Sliding expiry: a session used more than this long after its last renewal
+# is pushed out to a full SESSION_TTL again, so renewals cost at most one
+# write per session per interval rather than one per request. 0 disables.
+SESSION_RENEW_INTERVAL = timedelta(seconds=int(os.getenv("SESSION_RENEW_INTERVAL", "3600")))
+# Live sessions kept per user; the oldest are dropped on login. 0 = no cap.
+SESSION_MAX_PER_USER = int(os.getenv("SESSION_MAX_PER_USER", "0"))
+
+# With 0, schema setup is left to `python maintenance.py migrate` at deploy
+# time, and every worker only checks it is done instead of redoing it.
+MIGRATE_ON_START = os.getenv("MIGRATE_ON_START", "1") == "1"
+
+
+class TodoConflict(Exception):
+    """A conditional todo write found the todo changed after the caller's version."""
+
+
+def encode_cursor(todo: Dict) -> str:
+    """Opaque keyset cursor pointing just past ``todo`` in listing order."""
+    key = [int(todo['completed']), str(todo['last_modified_at']), todo['id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[int, str, int]:
+    """Inverse of ``encode_cursor``; raises ValueError for malformed cursors."""
+    try:
+        completed, last_modified_at, todo_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return int(completed), str(last_modified_at), int(todo_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def next_cursor(todos: List[Dict], limit: Optional[int]) -> Optional[str]:
+    """Cursor for the page after ``todos``, or None when it was the last one."""
+    if limit is None or len(todos) < limit:
+        return None
+    return encode_cursor(todos[-1])
+
+
+def fold(text: str) -> str:
+    """Lower-case ``text`` and strip accents, one character at a time.
+
+    Matches FTS5's unicode61 tokenizer with remove_diacritics, and keeps
+    offsets in the folded text valid in the original.
+    """
+    return ''.join(_fold_char(c) for c in text.lower())
+
+
+@functools.lru_cache(maxsize=4096)
+def _fold_char(c: str) -> str:
+    if c.isascii():
+        return c
+    base = ''.join(ch for ch in unicodedata.normalize('NFKD', c) if not unicodedata.combining(ch))
+    return base[0] if base else c
+
+
+def search_terms(text: str) -> List[str]:
+    """Folded words of a search query; each is matched as a word prefix."""
+    return [fold(word) for word in text.split()]
+
+
+def highlight(text: Optional[str], terms: List[str]) -> Tuple[str, int]:
+    """Wrap words starting with any of ``terms`` in ``<mark>``; also return the match count.
+
+    Used by backends without a full-text index to mimic FTS5's
+    ``highlight()``. The text is not escaped, same as FTS5.
+    """
+    if not text or not terms:
+        return text or '', 0
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\w*')
+    parts, end, hits = [], 0, 0
+    for match in pattern.finditer(fold(text)):
+        parts += [text[end:match.start()], '<mark>', text[match.start():match.end()], '</mark>']
+        end = match.end()
+        hits += 1
+    return ''.join(parts) + text[end:], hits
+
+
+@functools.lru_cache(maxsize=65536)
+def search_words(*texts: Optional[str]) -> frozenset:
+    """Folded words of ``texts``; cached since titles are searched far more often than edited."""
+    return frozenset(re.findall(r'\w+', fold(' '.join(t for t in texts if t))))
+
+
+def matches_all(terms: List[str], *texts: Optional[str]) -> bool:
+    """True when every term prefixes some word of ``texts`` (FTS5 AND semantics)."""
+    words = search_words(*texts)
+    return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+def search_result(todo: Dict, terms: List[str]) -> Dict:
+    """Add title_highlight, snippet and rank (lower is better) to a matching todo."""
+    title, title_hits = highlight(todo['title'], terms)
+    snippet, description_hits = highlight(todo.get('description'), terms)
+    # Same column weights as the bm25() call in database.search_todos
+    return {
+        **todo,
+        'title_highlight': title,
+        'snippet': snippet or None,
+        'rank': -(10.0 * title_hits + 4.0 * description_hits),
+    }
+
+
+class Repository:
+    """Users, sessions and todos for the API.
+
+    Everything is a coroutine except ``get_cached_session`` and ``stats``,
+    which must not block.
+    """
+
+    name = "base"
+
+    async def migrate(self) -> None:
+        """Create or upgrade the schema/indexes; safe to run repeatedly."""
+
+    async def start(self) -> None:
+        """Called from the app's lifespan, once per process, before serving."""
+        if MIGRATE_ON_START:
+            await self.migrate()
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict:
+        """Backend-specific numbers for /health."""
+        return {}
+
+    # Users
+    async def create_user(self, username: str, email: str, password_hash: bytes) -> Optional[Dict]:
+        """Create a user; None if the username or email is taken."""
+        raise NotImplementedError
+
+    async def get_user_credentials(self, username: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def update_password_hash(self, user_id: int, password_hash: bytes) -> bool:
+        """Replace a user's password hash (e.g. after a cost change); False if no such user."""
+        raise NotImplementedError
+
+    # Sessions
+    async def create_session(self, user_id: int) -> Optional[str]:
+        raise NotImplementedError
+
+    def get_cached_session(self, session_token: str) -> Optional[Dict]:
+        """The user for a session token if known without I/O, else None."""
+        return None
+
+    async def verify_session(self, session_token: str) -> Optional[Dict]:
+        """The session's user, with ``session_expires_at`` added when its expiry slid."""
+        raise NotImplementedError
+
+    async def delete_session(self, session_token: str) -> bool:
+        raise NotImplementedError
+
+    async def delete_expired_sessions(self, batch_size: int = 500) -> int:
+        raise NotImplementedError
+
+    # Signed-token revocations. ``jti`` is the revoked id: the session id
+    # (``sid`` claim) shared by a login's token and all its renewals.
+    async def revoke_token(self, jti: str, expires_at: datetime) -> None:
+        raise NotImplementedError
+
+    async def get_revoked_tokens(self, after_id: int = 0) -> List[Dict]:
+        raise NotImplementedError
+
+    async def delete_expired_revocations(self, batch_size: int = 500) -> int:
+        raise NotImplementedError
+
+    # Todo reads
+    async def get_user_todos(
+        self,
+        user_id: int,
+        limit: Optional[int] = None,
+        cursor: Optional[Tuple[int, str, int]] = None,
+        completed: Optional[bool] = None,
+        modified_since: Optional[datetime] = None,
+        include_archived: bool = False,
+    ) -> List[Dict]:
+        """Active first, then most recently modified first; see ``encode_cursor``.
+
+        Archived todos are only listed with ``include_archived``, among the
+        completed ones.
+        """
+        raise NotImplementedError
+
+    async def get_user_todo(self, user_id: int, todo_id: int) -> Optional[Dict]:
+        """The todo if the user owns it, archived or not."""
+        raise NotImplementedError
+
+    async def count_todos_to_update(self, user_id: int, completed: bool) -> int:
+        raise NotImplementedError
+
+    async def get_todo_version(self, user_id: int) -> int:
+        raise NotImplementedError
+
+    async def get_todo_versions(self, user_ids: List[int]) -> Dict[int, int]:
+        raise NotImplementedError
+
+    async def get_todo_changes(self, user_id: int, since: int, limit: int = 500,
+                               cursor: Optional[int] = None) -> Dict:
+        """Up to ``limit`` todos changed and ids deleted after version ``since``, oldest first.
+
+        If the client cannot be patched from ``since`` (tombstones it needs
+        were compacted, or ``since`` is ahead of the user's version) the
+        result has ``reset`` and the first ``limit`` todos of the full list
+        in id order instead. While it ``has_more``, the next page comes from
+        passing back ``version`` and ``cursor``; those pages list further
+        todos as plain changes, and changes since ``version`` then cover
+        anything that changed in between.
+        """
+        raise NotImplementedError
+
+    async def search_todos(self, user_id: int, text: str, limit: int = 20) -> List[Dict]:
+        raise NotImplementedError
+
+    async def export_todos(self, user_id: int, after_id: int = 0, limit: int = 1000) -> List[Dict]:
+        """Up to ``limit`` todos, archived included, with id above ``after_id``, in id order (no ``created_by``)."""
+        raise NotImplementedError
+
+    # Todo writes; every change bumps the user's todo version. Updating or
+    # deleting an archived todo moves it back to the active todos first.
+    # With ``unchanged_since`` a single-todo write only happens if the todo
+    # has not changed after that version of the user's todos, checked in the
+    # same transaction as the write; otherwise it raises TodoConflict.
+    # An archived todo last changed when it was archived, which bumped the
+    # version like a delete.
+    async def create_todo(self, user_id: int, title: str, description: Optional[str] = None) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def update_todo_status(self, user_id: int, todo_id: int, completed: bool,
+                                 unchanged_since: Optional[int] = None) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def update_todo(self, user_id: int, todo_id: int, title: str, description: Optional[str] = None,
+                          unchanged_since: Optional[int] = None) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def delete_todo(self, user_id: int, todo_id: int, unchanged_since: Optional[int] = None) -> bool:
+        raise NotImplementedError
+
+    async def update_all_todos_status(self, user_id: int, completed: bool,
+                                      limit: Optional[int] = None) -> List[int]:
+        raise NotImplementedError
+
+    async def apply_todo_batch(self, user_id: int, operations: List[Dict], atomic: bool = True) -> Dict:
+        raise NotImplementedError
+
+    async def import_todos(self, user_id: int, rows: List[Dict]) -> Optional[int]:
+        """Insert rows of title/description/completed all-or-nothing; None on failure."""
+        raise NotImplementedError
+
+    async def archive_todos(self, completed_before: datetime, limit: int = 500) -> Dict[int, int]:
+        """Archive up to ``limit`` todos, of any users, completed before ``completed_before``.
+
+        Returns how many were archived per user. Archiving bumps each
+        owner's version and records a tombstone per todo, since the todo
+        leaves their default list.
+        """
+        raise NotImplementedError
+
+
+def batch_results(operations: List[Dict]) -> List[Dict]:
+    """Initial per-operation results for ``apply_todo_batch``."""
+    return [
+        {'index': i, 'op': op['op'], 'id': op.get('id'), 'status': 'ok', 'error': None, 'todo': None}
+        for i, op in enumerate(operations)
+    ]
+
+
+def reset_page(todos: List[Dict], limit: int, version: int, cursor: Optional[int]) -> Dict:
+    """A ``get_todo_changes`` page of the full list from up to ``limit + 1`` todos in id order.
+
+    The first page (no ``cursor``) is the ``reset``; later ones are plain
+    changes at the first page's ``version``.
+    """
+    has_more = len(todos) > limit
+    todos = todos[:limit]
+    return {
+        'version': version,
+        'reset': cursor is None,
+        'todos': todos,
+        'deleted': [],
+        'has_more': has_more,
+        'cursor': todos[-1]['id'] if has_more else None,
+    }
+
+
+def rolled_back(results: List[Dict]) -> Dict:
+    """The ``apply_todo_batch`` response for a batch that was not committed.
+
+    Ids handed to creates inside the rolled-back transaction never existed,
+    so they are left out.
+    """
+    for result in results:
+        if result['op'] == 'create':
+            result['id'] = None
+    return {'committed': False, 'results': results}
+
+
+def check_batch(operations: List[Dict], results: List[Dict], existing: set) -> None:
+    """Mark operations on todos that are missing (or deleted earlier in the batch) as not_found.
+
+    For backends that validate a batch up front instead of relying on the
+    database's rowcounts; ``existing`` is the user's todo ids.
+    """
+    existing = set(existing)
+    for op, result in zip(operations, results):
+        if op['op'] == 'create':
+            continue
+        if op['id'] not in existing:
+            result['status'] = 'not_found'
+            result['error'] = 'Todo not found'
+        elif op['op'] == 'delete':
+            existing.discard(op['id'])
+
+
+BACKENDS = ("sqlite", "sharded", "memory", "mongo")
+
+
+def repository_from_env(kind: Optional[str] = None) -> Repository:
+    kind = kind or os.getenv("STORAGE_BACKEND", "sqlite")
+    if kind == "sqlite":
+        from sqlite_repository import SQLiteRepository
+        return SQLiteRepository()
+    if kind == "sharded":
+        from sharded_repository import ShardedSQLiteRepository
+        return ShardedSQLiteRepository()
+    if kind == "memory":
+        from memory_repository import MemoryRepository
+        return MemoryRepository()
+    if kind == "mongo":
+        from mongo_repository import MongoRepository
+        return MongoRepository()
+    raise ValueError(f"Unknown STORAGE_BACKEND {kind!r} (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,101 @@
+"""SQLite with each user's todos in their own shard file (see shards.py).
+
+Users, sessions and revocations are the SQLite backend's, on the main file.
+Every todo call first looks up the user's shard (cached) and then runs the
+same database.py helper against that shard's pool. Shard writes go through
+``run_db``: group commit only applies to the main file.
+"""
+from collections import defaultdict
+from typing import Dict
+
+import database
+import shards
+from database import run_db, run_write
+from sqlite_repository import SQLiteRepository
+
+
+class ShardedSQLiteRepository(SQLiteRepository):
+    name = "sharded"
+
+    async def migrate(self) -> None:
+        await super().migrate()
+        for placement in await run_db(shards.list_shards):
+            await run_db(shards.shard_pool, placement)
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "shards": shards.stats()}
+
+    async def _on_shard(self, func, user_id, *args, **kwargs):
+        placement = shards.placement_cache.get(user_id)
+        if placement is None:
+            placement = await run_db(shards.get_user_shard, user_id)
+        return await run_db(shards.on_shard(placement, func), user_id, *args, **kwargs)
+
+    async def create_user(self, username, email, password_hash):
+        user = await run_write(database.create_user, username, email, password_hash)
+        if user is not None:
+            await run_db(shards.place_user, user)
+        return user
+
+    async def get_user_todos(self, user_id, limit=None, cursor=None, completed=None, modified_since=None,
+                             include_archived=False):
+        return await self._on_shard(
+            database.get_user_todos, user_id,
+            limit=limit, cursor=cursor, completed=completed, modified_since=modified_since,
+            include_archived=include_archived
+        )
+
+    async def get_user_todo(self, user_id, todo_id):
+        return await self._on_shard(database.get_user_todo, user_id, todo_id)
+
+    async def count_todos_to_update(self, user_id, completed):
+        return await self._on_shard(database.count_todos_to_update, user_id, completed)
+
+    async def get_todo_version(self, user_id):
+        return await self._on_shard(database.get_todo_version, user_id)
+
+    async def get_todo_versions(self, user_ids):
+        by_shard = defaultdict(list)
+        for user_id, placement in (await run_db(shards.get_user_shards, list(user_ids))).items():
+            by_shard[placement].append(user_id)
+        versions = {}
+        for placement, ids in by_shard.items():
+            versions.update(await run_db(shards.on_shard(placement, database.get_todo_versions), ids))
+        return versions
+
+    async def get_todo_changes(self, user_id, since, limit=500, cursor=None):
+        return await self._on_shard(database.get_todo_changes, user_id, since, limit, cursor)
+
+    async def search_todos(self, user_id, text, limit=20):
+        return await self._on_shard(database.search_todos, user_id, text, limit)
+
+    async def export_todos(self, user_id, after_id=0, limit=1000):
+        return await self._on_shard(database.export_todos, user_id, after_id, limit)
+
+    async def create_todo(self, user_id, title, description=None):
+        return await self._on_shard(database.create_todo, user_id, title, description)
+
+    async def update_todo_status(self, user_id, todo_id, completed, unchanged_since=None):
+        return await self._on_shard(database.update_todo_status, user_id, todo_id, completed, unchanged_since)
+
+    async def update_todo(self, user_id, todo_id, title, description=None, unchanged_since=None):
+        return await self._on_shard(database.update_todo, user_id, todo_id, title, description, unchanged_since)
+
+    async def delete_todo(self, user_id, todo_id, unchanged_since=None):
+        return await self._on_shard(database.delete_todo, user_id, todo_id, unchanged_since)
+
+    async def update_all_todos_status(self, user_id, completed, limit=None):
+        return await self._on_shard(database.update_all_todos_status, user_id, completed, limit)
+
+    async def apply_todo_batch(self, user_id, operations, atomic=True):
+        return await self._on_shard(database.apply_todo_batch, user_id, operations, atomic)
+
+    async def import_todos(self, user_id, rows):
+        return await self._on_shard(database.import_todos, user_id, rows)
+
+    async def archive_todos(self, completed_before, limit=500):
+        """One batch of up to ``limit`` on every shard, each in its own transaction."""
+        archived = {}
+        for placement in await run_db(shards.list_shards):
+            archived.update(await run_db(shards.on_shard(placement, database.archive_todos), completed_before, limit))
+        return archived
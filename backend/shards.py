@@ -0,0 +1,393 @@
+"""Per-user sharding of todos across SQLite files (STORAGE_BACKEND=sharded).
+
+The SQLITE_PATH file becomes a small directory: users, sessions and token
+revocations stay there, next to ``user_shards``, which says which file holds
+each user's todos. New users are placed by SQLITE_SHARDS:
+
+    SQLITE_SHARDS=4         users spread by id over shard-0.db .. shard-3.db
+    SQLITE_SHARDS=per-user  one file per user, user-<id>.db
+
+Users without a ``user_shards`` row (everyone created before sharding was
+turned on) keep their todos in the main file until moved with
+``python maintenance.py move-user`` or ``rebalance``. Each file has its own
+write lock, so writers for users on different shards never wait on each
+other (``python -m benchmarks.sharding``).
+
+Every file hands out todo ids from its own range (see migration 9): the main
+file below 2**32, the shard with directory id N from N * 2**32. Todo ids are
+therefore unique across files and stay the same when a user is moved.
+"""
+import functools
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+import database
+import metrics
+from cache import TTLCache
+from db_pool import ConnectionPool
+from migrations import migrate
+
+load_dotenv()
+
+SQLITE_SHARDS = os.getenv("SQLITE_SHARDS", "4")
+SQLITE_SHARD_DIR = os.getenv("SQLITE_SHARD_DIR") or os.path.join(os.path.dirname(database.SQLITE_PATH), "shards")
+SQLITE_SHARD_POOL_SIZE = int(os.getenv("SQLITE_SHARD_POOL_SIZE", "4"))
+# Shard pools kept open at once; the least recently used are closed past this
+SQLITE_SHARD_OPEN_MAX = int(os.getenv("SQLITE_SHARD_OPEN_MAX", "64"))
+
+SHARD_ID_RANGE = 2 ** 32
+
+# (shard id, name) of users that have no user_shards row
+MAIN = (0, "main")
+
+Placement = Tuple[int, str]
+
+# user_id -> placement. Placements only change offline (move-user), so a
+# short TTL is enough to pick up a move without restarting.
+placement_cache = TTLCache(
+    maxsize=int(os.getenv("SHARD_PLACEMENT_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SHARD_PLACEMENT_CACHE_TTL", "60")),
+)
+
+_pools: "OrderedDict[int, ConnectionPool]" = OrderedDict()
+_pools_lock = threading.Lock()
+# Shard files migrated by this process; a pool reopened after eviction skips setup
+_set_up: Set[str] = set()
+
+
+def placement_name(user_id: int, shards: Optional[str] = None) -> str:
+    """Name of the shard a new user goes to under SQLITE_SHARDS (or ``shards``)."""
+    shards = shards or SQLITE_SHARDS
+    if shards == "per-user":
+        return f"user-{user_id}"
+    return f"shard-{user_id % int(shards)}"
+
+
+def shard_path(placement: Placement) -> str:
+    if placement == MAIN:
+        return database.SQLITE_PATH
+    return os.path.join(SQLITE_SHARD_DIR, f"{placement[1]}.db")
+
+
+def _setup_shard(conn: sqlite3.Connection, shard_id: int) -> None:
+    """Migrate a shard file and move its todo ids into the shard's own range."""
+    migrate(conn)
+    base = shard_id * SHARD_ID_RANGE
+    conn.execute(
+        'UPDATE todo_ids SET next_id = MAX(next_id, ?), max_id = ? WHERE max_id != ?',
+        (base, base + SHARD_ID_RANGE - 1, base + SHARD_ID_RANGE - 1)
+    )
+    conn.commit()
+
+
+def shard_pool(placement: Placement) -> ConnectionPool:
+    """Connection pool of a shard, creating and migrating its file on first use."""
+    shard_id, _ = placement
+    if placement == MAIN:
+        return database.pool
+    with _pools_lock:
+        pool = _pools.get(shard_id)
+        if pool is not None:
+            _pools.move_to_end(shard_id)
+            return pool
+
+    os.makedirs(SQLITE_SHARD_DIR, exist_ok=True)
+    path = shard_path(placement)
+    pool = ConnectionPool(
+        path,
+        size=SQLITE_SHARD_POOL_SIZE,
+        timeout=database.pool.timeout,
+        busy_timeout=database.pool.busy_timeout,
+        pragmas=database.SQLITE_PRAGMAS,
+        factory=metrics.connection_factory(),
+    )
+    with _pools_lock:
+        set_up = path in _set_up
+    if not set_up:
+        with pool.connection() as conn:
+            _setup_shard(conn, shard_id)
+
+    with _pools_lock:
+        _set_up.add(path)
+        if shard_id in _pools:
+            # Another thread opened it meanwhile
+            pool.close()
+            return _pools[shard_id]
+        _pools[shard_id] = pool
+        while len(_pools) > SQLITE_SHARD_OPEN_MAX:
+            _, evicted = _pools.popitem(last=False)
+            evicted.close()
+    return pool
+
+
+def on_shard(placement: Placement, func):
+    """``func``, with the database.py helpers it calls using the shard's pool."""
+    if placement == MAIN:
+        return func
+
+    @functools.wraps(func)
+    def call(*args, **kwargs):
+        token = database.current_pool.set(shard_pool(placement))
+        try:
+            return func(*args, **kwargs)
+        finally:
+            database.current_pool.reset(token)
+    return call
+
+
+def stats() -> Dict:
+    with _pools_lock:
+        pools = list(_pools.values())
+    totals = [pool.stats() for pool in pools]
+    return {
+        'open': len(pools),
+        'in_use': sum(s['in_use'] for s in totals),
+        'checkouts': sum(s['checkouts'] for s in totals),
+        'waits': sum(s['waits'] for s in totals),
+        'timeouts': sum(s['timeouts'] for s in totals),
+    }
+
+
+# Directory (run against the main file)
+def _shard_id(conn: sqlite3.Connection, name: str) -> int:
+    # Looked up first: a conflicting INSERT would still use up an id, and
+    # with it a whole id range
+    row = conn.execute('SELECT id FROM shards WHERE name = ?', (name,)).fetchone()
+    if row is None:
+        conn.execute('INSERT OR IGNORE INTO shards (name) VALUES (?)', (name,))
+        row = conn.execute('SELECT id FROM shards WHERE name = ?', (name,)).fetchone()
+    return row[0]
+
+
+def _placements(conn: sqlite3.Connection, user_ids: List[int]) -> Dict[int, Placement]:
+    placements = {user_id: MAIN for user_id in user_ids}
+    for i in range(0, len(user_ids), database.SQL_CHUNK_SIZE):
+        chunk = user_ids[i:i + database.SQL_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        for user_id, shard_id, name in conn.execute(f'''
+            SELECT us.user_id, s.id, s.name
+            FROM user_shards us
+            JOIN shards s ON s.id = us.shard_id
+            WHERE us.user_id IN ({placeholders})
+        ''', chunk):
+            placements[user_id] = (shard_id, name)
+    return placements
+
+
+def get_user_shard(user_id: int) -> Placement:
+    placement = placement_cache.get(user_id)
+    if placement is None:
+        with database.get_connection() as conn:
+            placement = _placements(conn, [user_id])[user_id]
+        placement_cache.set(user_id, placement)
+    return placement
+
+
+def get_user_shards(user_ids: List[int]) -> Dict[int, Placement]:
+    placements = {}
+    missing = []
+    for user_id in user_ids:
+        placement = placement_cache.get(user_id)
+        if placement is None:
+            missing.append(user_id)
+        else:
+            placements[user_id] = placement
+    if missing:
+        with database.get_connection() as conn:
+            found = _placements(conn, missing)
+        for user_id, placement in found.items():
+            placement_cache.set(user_id, placement)
+        placements.update(found)
+    return placements
+
+
+def list_shards() -> List[Placement]:
+    """Every shard in the directory, main first."""
+    with database.get_connection() as conn:
+        rows = conn.execute('SELECT id, name FROM shards ORDER BY id').fetchall()
+    return [MAIN] + [(row[0], row[1]) for row in rows]
+
+
+def _mirror_user(conn: sqlite3.Connection, user) -> None:
+    # Only there for the todos foreign key and the created_by join;
+    # credentials stay in the directory.
+    conn.execute('''
+        INSERT INTO users (id, username, email, password_hash) VALUES (?, ?, ?, x'')
+        ON CONFLICT (id) DO UPDATE SET username = excluded.username, email = excluded.email
+    ''', (user['id'], user['username'], user['email']))
+
+
+def place_user(user: Dict) -> Placement:
+    """Put a newly created user on their shard (see ``placement_name``)."""
+    name = placement_name(user['id'])
+    with database.get_connection() as conn:
+        placement = (_shard_id(conn, name), name)
+        conn.commit()
+    # The shard's copy of the user comes first: until the directory row
+    # exists the user simply stays in main.
+    with shard_pool(placement).connection() as conn:
+        _mirror_user(conn, user)
+        conn.commit()
+    with database.get_connection() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO user_shards (user_id, shard_id) VALUES (?, ?)', (user['id'], placement[0])
+        )
+        conn.commit()
+    placement_cache.set(user['id'], placement)
+    return placement
+
+
+# Offline tooling (python maintenance.py shards | move-user | rebalance | split)
+def _clear_user(conn: sqlite3.Connection, schema: str, user_id: int) -> None:
+    # The delete trigger bumps the version and writes tombstones; both go too
+    conn.execute(f'DELETE FROM {schema}.todos WHERE user_id = ?', (user_id,))
+    conn.execute(f'DELETE FROM {schema}.todos_archive WHERE user_id = ?', (user_id,))
+    conn.execute(f'DELETE FROM {schema}.todo_tombstones WHERE user_id = ?', (user_id,))
+    conn.execute(f'DELETE FROM {schema}.todo_versions WHERE user_id = ?', (user_id,))
+
+
+def move_user(user_id: int, name: str) -> int:
+    """Move a user's todos, archived todos, change versions and tombstones to shard ``name``.
+
+    Offline: nothing may write the user's todos while this runs. The copy is
+    committed on the target before the directory points at it, and the source
+    is only cleared after that, so a crash at any step leaves the user whole
+    on one side; a copy left behind is replaced by the next move to that file.
+    Returns the number of todos moved.
+    """
+    with database.get_connection() as conn:
+        user = conn.execute('SELECT id, username, email FROM users WHERE id = ?', (user_id,)).fetchone()
+        if user is None:
+            raise ValueError(f"No user with id {user_id}")
+        source = _placements(conn, [user_id])[user_id]
+        target = MAIN if name == MAIN[1] else (_shard_id(conn, name), name)
+        conn.commit()
+    if source == target:
+        return 0
+
+    shard_pool(target)
+    conn = sqlite3.connect(shard_path(target), timeout=database.pool.busy_timeout)
+    try:
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute('ATTACH DATABASE ? AS src', (shard_path(source),))
+        columns = ', '.join(row[1] for row in conn.execute('PRAGMA main.table_info(todos)'))
+        archive_columns = ', '.join(row[1] for row in conn.execute('PRAGMA main.table_info(todos_archive)'))
+
+        conn.execute('BEGIN IMMEDIATE')
+        _clear_user(conn, 'main', user_id)
+        if target != MAIN:
+            _mirror_user(conn, {'id': user[0], 'username': user[1], 'email': user[2]})
+        moved = conn.execute(
+            f'INSERT INTO main.todos ({columns}) SELECT {columns} FROM src.todos WHERE user_id = ?', (user_id,)
+        ).rowcount
+        # The insert trigger renumbered the rows; clients keep syncing from
+        # the versions they already have
+        conn.execute('''
+            UPDATE main.todos AS t SET version = s.version
+            FROM src.todos s
+            WHERE t.id = s.id AND t.user_id = ?
+        ''', (user_id,))
+        conn.execute(f'''
+            INSERT INTO main.todos_archive ({archive_columns})
+            SELECT {archive_columns} FROM src.todos_archive WHERE user_id = ?
+        ''', (user_id,))
+        conn.execute('DELETE FROM main.todo_versions WHERE user_id = ?', (user_id,))
+        conn.execute('''
+            INSERT INTO main.todo_versions (user_id, version, tombstone_floor)
+            SELECT user_id, version, tombstone_floor FROM src.todo_versions WHERE user_id = ?
+        ''', (user_id,))
+        conn.execute('''
+            INSERT OR REPLACE INTO main.todo_tombstones (todo_id, user_id, version, deleted_at)
+            SELECT todo_id, user_id, version, deleted_at FROM src.todo_tombstones WHERE user_id = ?
+        ''', (user_id,))
+        conn.commit()
+
+        with database.get_connection() as directory:
+            if target == MAIN:
+                directory.execute('DELETE FROM user_shards WHERE user_id = ?', (user_id,))
+            else:
+                directory.execute(
+                    'INSERT OR REPLACE INTO user_shards (user_id, shard_id) VALUES (?, ?)', (user_id, target[0])
+                )
+            directory.commit()
+        placement_cache.delete(user_id)
+
+        conn.execute('BEGIN IMMEDIATE')
+        _clear_user(conn, 'src', user_id)
+        if source != MAIN:
+            conn.execute('DELETE FROM src.users WHERE id = ?', (user_id,))
+        conn.commit()
+        return moved
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _users(conn: sqlite3.Connection, placement: Optional[Placement] = None) -> List[int]:
+    if placement is None:
+        return [row[0] for row in conn.execute('SELECT id FROM users ORDER BY id')]
+    if placement == MAIN:
+        return [row[0] for row in conn.execute(
+            'SELECT id FROM users WHERE id NOT IN (SELECT user_id FROM user_shards) ORDER BY id'
+        )]
+    return [row[0] for row in conn.execute(
+        'SELECT user_id FROM user_shards WHERE shard_id = ? ORDER BY user_id', (placement[0],)
+    )]
+
+
+def rebalance(shards: Optional[str] = None) -> Dict[str, int]:
+    """Move every user to where ``placement_name`` puts them now.
+
+    ``shards`` overrides SQLITE_SHARDS, e.g. to grow from 4 to 8 shards.
+    Returns the number of users moved per target shard.
+    """
+    with database.get_connection() as conn:
+        user_ids = _users(conn)
+        placements = _placements(conn, user_ids)
+    moved: Dict[str, int] = {}
+    for user_id in user_ids:
+        name = placement_name(user_id, shards)
+        if placements[user_id][1] != name:
+            move_user(user_id, name)
+            moved[name] = moved.get(name, 0) + 1
+    return moved
+
+
+def split(name: str, new_name: str) -> int:
+    """Move the upper half (by user id) of shard ``name``'s users to ``new_name``."""
+    with database.get_connection() as conn:
+        row = conn.execute('SELECT id FROM shards WHERE name = ?', (name,)).fetchone()
+        if row is None and name != MAIN[1]:
+            raise ValueError(f"No shard named {name!r}")
+        user_ids = _users(conn, MAIN if row is None else (row[0], name))
+    for user_id in user_ids[len(user_ids) // 2:]:
+        move_user(user_id, new_name)
+    return len(user_ids) - len(user_ids) // 2
+
+
+def describe() -> List[Dict]:
+    """Users, todos and file size of every shard in the directory."""
+    report = []
+    for placement in list_shards():
+        with database.get_connection() as conn:
+            user_ids = _users(conn, placement)
+        path = shard_path(placement)
+        todos = archived = 0
+        if os.path.exists(path):
+            with shard_pool(placement).connection() as conn:
+                todos = conn.execute('SELECT COUNT(*) FROM todos').fetchone()[0]
+                archived = conn.execute('SELECT COUNT(*) FROM todos_archive').fetchone()[0]
+        report.append({
+            'id': placement[0], 'name': placement[1], 'path': path, 'users': len(user_ids), 'todos': todos,
+            'archived_todos': archived,
+            'bytes': os.path.getsize(path) if os.path.exists(path) else 0,
+        })
+    return report
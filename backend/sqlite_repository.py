@@ -0,0 +1,116 @@
+"""The default backend: database.py's sqlite3 helpers behind ``Repository``.
+
+Reads go to the database worker threads via ``run_db``; writes go through
+``run_write``, so they take part in group commit when it is enabled.
+"""
+from typing import Dict
+
+import database
+from database import run_db, run_write
+from repository import MIGRATE_ON_START, Repository
+
+
+class SQLiteRepository(Repository):
+    name = "sqlite"
+
+    async def migrate(self) -> None:
+        if await run_db(database.init_db) is None:
+            raise RuntimeError("Database migration failed")
+
+    async def start(self) -> None:
+        if MIGRATE_ON_START:
+            await self.migrate()
+        else:
+            await run_db(database.check_schema)
+
+    def stats(self) -> Dict:
+        return {"db_pool": database.pool_stats(), "session_cache": database.session_cache.stats()}
+
+    async def create_user(self, username, email, password_hash):
+        return await run_write(database.create_user, username, email, password_hash)
+
+    async def get_user_credentials(self, username):
+        return await run_db(database.get_user_credentials, username)
+
+    async def update_password_hash(self, user_id, password_hash):
+        return await run_write(database.update_password_hash, user_id, password_hash)
+
+    async def create_session(self, user_id):
+        return await run_write(database.create_session, user_id)
+
+    def get_cached_session(self, session_token):
+        return database.get_cached_session(session_token)
+
+    async def verify_session(self, session_token):
+        user = await run_db(database.verify_session, session_token)
+        if user and user.pop('session_renewal_due', False):
+            return await run_write(database.renew_session, session_token, user)
+        return user
+
+    async def delete_session(self, session_token):
+        return await run_write(database.delete_session, session_token)
+
+    async def delete_expired_sessions(self, batch_size=500):
+        return await run_write(database.delete_expired_sessions, batch_size)
+
+    async def revoke_token(self, jti, expires_at):
+        await run_write(database.revoke_token, jti, expires_at)
+
+    async def get_revoked_tokens(self, after_id=0):
+        return await run_db(database.get_revoked_tokens, after_id)
+
+    async def delete_expired_revocations(self, batch_size=500):
+        return await run_write(database.delete_expired_revocations, batch_size)
+
+    async def get_user_todos(self, user_id, limit=None, cursor=None, completed=None, modified_since=None,
+                             include_archived=False):
+        return await run_db(
+            database.get_user_todos, user_id,
+            limit=limit, cursor=cursor, completed=completed, modified_since=modified_since,
+            include_archived=include_archived
+        )
+
+    async def get_user_todo(self, user_id, todo_id):
+        return await run_db(database.get_user_todo, user_id, todo_id)
+
+    async def count_todos_to_update(self, user_id, completed):
+        return await run_db(database.count_todos_to_update, user_id, completed)
+
+    async def get_todo_version(self, user_id):
+        return await run_db(database.get_todo_version, user_id)
+
+    async def get_todo_versions(self, user_ids):
+        return await run_db(database.get_todo_versions, user_ids)
+
+    async def get_todo_changes(self, user_id, since, limit=500, cursor=None):
+        return await run_db(database.get_todo_changes, user_id, since, limit, cursor)
+
+    async def search_todos(self, user_id, text, limit=20):
+        return await run_db(database.search_todos, user_id, text, limit)
+
+    async def export_todos(self, user_id, after_id=0, limit=1000):
+        return await run_db(database.export_todos, user_id, after_id, limit)
+
+    async def create_todo(self, user_id, title, description=None):
+        return await run_write(database.create_todo, user_id, title, description)
+
+    async def update_todo_status(self, user_id, todo_id, completed, unchanged_since=None):
+        return await run_write(database.update_todo_status, user_id, todo_id, completed, unchanged_since)
+
+    async def update_todo(self, user_id, todo_id, title, description=None, unchanged_since=None):
+        return await run_write(database.update_todo, user_id, todo_id, title, description, unchanged_since)
+
+    async def delete_todo(self, user_id, todo_id, unchanged_since=None):
+        return await run_write(database.delete_todo, user_id, todo_id, unchanged_since)
+
+    async def update_all_todos_status(self, user_id, completed, limit=None):
+        return await run_write(database.update_all_todos_status, user_id, completed, limit)
+
+    async def apply_todo_batch(self, user_id, operations, atomic=True):
+        return await run_write(database.apply_todo_batch, user_id, operations, atomic)
+
+    async def import_todos(self, user_id, rows):
+        return await run_write(database.import_todos, user_id, rows)
+
+    async def archive_todos(self, completed_before, limit=500):
+        return await run_write(database.archive_todos, completed_before, limit)
@@ -1,2 +1,4 @@
 #!/bin/bash
-python -m uvicorn main:app --host 0.0.0.0 --port $PORT 
\ No newline at end of file
+# Schema setup runs once here, not in every worker at startup
+python maintenance.py migrate
+MIGRATE_ON_START=0 exec python -m uvicorn main:app --host 0.0.0.0 --port $PORT 
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""The real ``main:app`` behind a TestClient, on a throwaway SQLite file.
+
+database.py reads SQLITE_PATH when it is imported, so it is set here before
+any test imports ``main``.
+"""
+import os
+import tempfile
+import uuid
+
+import pytest
+
+os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="taskmaster-test-"), "todos.db")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+    # As a context manager the client runs the lifespan, which sets up the schema
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def user(client):
+    """Sign up and log in a new user; the client keeps their session cookie."""
+    username = f"user-{uuid.uuid4().hex[:8]}"
+    password = "test-password"
+    client.post("/auth/signup", json={"username": username, "email": f"{username}@example.com", "password": password})
+    response = client.post("/auth/login", json={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return response.json()
@@ -0,0 +1,97 @@
+"""Concurrent edits of one todo: If-Match writes and the 409 on stale ones."""
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _create(client, title="shared"):
+    response = client.post("/todos/", json={"title": title})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _etag(client):
+    return client.get("/todos/").headers["ETag"]
+
+
+def test_second_update_from_the_same_version_conflicts(client, user):
+    todo = _create(client)
+    etag = _etag(client)
+
+    first = client.put(f"/todos/{todo['id']}", json={"title": "from tab one"}, headers={"If-Match": etag})
+    second = client.put(f"/todos/{todo['id']}", json={"title": "from tab two"}, headers={"If-Match": etag})
+
+    assert first.status_code == 200
+    assert second.status_code == 409
+    assert client.get(f"/todos/{todo['id']}").json()["title"] == "from tab one"
+
+
+def test_simultaneous_updates_one_wins(client, user):
+    todo = _create(client)
+    etag = _etag(client)
+
+    def rename(title):
+        return client.put(f"/todos/{todo['id']}", json={"title": title}, headers={"If-Match": etag})
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        responses = list(pool.map(rename, ["tab one", "tab two"]))
+
+    assert sorted(response.status_code for response in responses) == [200, 409]
+    winner = next(response for response in responses if response.status_code == 200)
+    assert client.get(f"/todos/{todo['id']}").json()["title"] == winner.json()["title"]
+
+
+def test_stale_toggle_and_delete_conflict(client, user):
+    todo = _create(client)
+    etag = _etag(client)
+    assert client.patch(f"/todos/{todo['id']}", json={"completed": True}, headers={"If-Match": etag}).status_code == 200
+
+    stale_toggle = client.patch(f"/todos/{todo['id']}", json={"completed": False}, headers={"If-Match": etag})
+    stale_delete = client.delete(f"/todos/{todo['id']}", headers={"If-Match": etag})
+
+    assert stale_toggle.status_code == 409
+    assert stale_delete.status_code == 409
+    assert client.get(f"/todos/{todo['id']}").json()["completed"] is True
+
+
+def test_edits_to_other_todos_do_not_conflict(client, user):
+    mine, theirs = _create(client, "mine"), _create(client, "theirs")
+    etag = _etag(client)
+    client.put(f"/todos/{theirs['id']}", json={"title": "edited elsewhere"})
+
+    response = client.put(f"/todos/{mine['id']}", json={"title": "edited here"}, headers={"If-Match": etag})
+
+    assert response.status_code == 200
+
+
+def test_changes_version_as_if_match(client, user):
+    todo = _create(client)
+    version = client.get("/todos/changes", params={"since": 0}).json()["version"]
+    client.put(f"/todos/{todo['id']}", json={"title": "edited elsewhere"})
+
+    response = client.put(f"/todos/{todo['id']}", json={"title": "edited here"}, headers={"If-Match": str(version)})
+
+    assert response.status_code == 409
+
+
+def test_unconditional_writes_still_apply(client, user):
+    todo = _create(client)
+    etag = _etag(client)
+    client.put(f"/todos/{todo['id']}", json={"title": "edited elsewhere"})
+
+    assert client.put(f"/todos/{todo['id']}", json={"title": "last write wins"}).status_code == 200
+    any_version = client.put(f"/todos/{todo['id']}", json={"title": "any version"}, headers={"If-Match": "*"})
+    assert any_version.status_code == 200
+    assert client.put(f"/todos/{todo['id']}", json={"title": "x"}, headers={"If-Match": etag}).status_code == 409
+
+
+def test_malformed_if_match(client, user):
+    todo = _create(client)
+
+    response = client.put(f"/todos/{todo['id']}", json={"title": "x"}, headers={"If-Match": '"not-a-version"'})
+
+    assert response.status_code == 400
+
+
+def test_missing_todo_is_not_a_conflict(client, user):
+    etag = _etag(client)
+
+    assert client.delete("/todos/999999", headers={"If-Match": etag}).status_code == 404
@@ -0,0 +1,71 @@
+"""GET /todos/ with coalescing and the micro-cache on must still read its writes."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+from read_cache import TodoReads
+
+
+@pytest.fixture
+def cached_reads(monkeypatch):
+    # A cache long enough that only invalidation or a new version can refresh it
+    monkeypatch.setattr(main, "todo_reads", TodoReads(coalescing=True, ttl=60.0))
+
+
+def _titles(client):
+    response = client.get("/todos/")
+    assert response.status_code == 200
+    return [todo["title"] for todo in response.json()]
+
+
+def test_read_after_write(cached_reads, client, user):
+    todo = client.post("/todos/", json={"title": "before"}).json()
+    assert _titles(client) == ["before"]
+    assert _titles(client) == ["before"]  # served from the cache
+
+    client.put(f"/todos/{todo['id']}", json={"title": "after"})
+
+    assert _titles(client) == ["after"]
+
+
+def test_read_after_write_from_another_worker(cached_reads, client, user):
+    todo = client.post("/todos/", json={"title": "before"}).json()
+    assert _titles(client) == ["before"]
+
+    # Straight through the repository, as another worker would: nothing in
+    # this process invalidates the cached body
+    client.portal.call(main.repo.update_todo, user["id"], todo["id"], "after")
+
+    assert _titles(client) == ["after"]
+
+
+def test_read_started_after_a_write_does_not_join_an_older_read(cached_reads, client, user, monkeypatch):
+    todo = client.post("/todos/", json={"title": "before"}).json()
+    get_user_todos = main.repo.get_user_todos
+    entered, release = threading.Event(), threading.Event()
+    calls = 0
+
+    async def held_first_read(*args, **kwargs):
+        # The first list query is held open until the test releases it
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            entered.set()
+            await main.asyncio.to_thread(release.wait, 10)
+        return await get_user_todos(*args, **kwargs)
+
+    monkeypatch.setattr(main.repo, "get_user_todos", held_first_read)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        older = pool.submit(_titles, client)
+        assert entered.wait(10)
+        client.put(f"/todos/{todo['id']}", json={"title": "after"})
+        newer = pool.submit(_titles, client)
+        try:
+            # Had it joined the held read it would still be waiting here
+            assert newer.result(timeout=5) == ["after"]
+        finally:
+            release.set()
+        older.result(timeout=10)
+    assert calls == 2
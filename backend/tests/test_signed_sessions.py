@@ -0,0 +1,64 @@
+"""Logout of a signed session also revokes its earlier, pre-renewal tokens."""
+import time
+from datetime import timedelta
+
+import pytest
+
+import main
+import tokens
+
+
+@pytest.fixture
+def signed_sessions(monkeypatch):
+    monkeypatch.setattr(tokens, "SESSION_TOKEN_MODE", "signed")
+    monkeypatch.setattr(tokens, "SIGNING_KEYS", [("test", "test-signing-secret")])
+    # SESSION_RENEW_INTERVAL=1: any request a second after login renews the token
+    monkeypatch.setattr(main, "SESSION_RENEW_INTERVAL", timedelta(seconds=1))
+
+
+def _use(client, token):
+    client.cookies.clear()
+    client.cookies.set("session_token", token)
+
+
+def _renew(client, token):
+    time.sleep(1.1)
+    _use(client, token)
+    response = client.get("/todos/")
+    assert response.status_code == 200
+    renewed = response.cookies.get("session_token")
+    assert renewed and renewed != token
+    return renewed
+
+
+def test_renewal_keeps_the_session_id(signed_sessions, client, user):
+    original = client.cookies["session_token"]
+    renewed = _renew(client, original)
+
+    before, after = tokens.decode_token(original), tokens.decode_token(renewed)
+    assert after["sid"] == before["sid"]
+    assert after["jti"] != before["jti"]
+
+
+def test_logout_revokes_tokens_from_before_the_renewal(signed_sessions, client, user):
+    original = client.cookies["session_token"]
+    renewed = _renew(client, original)
+
+    _use(client, renewed)
+    assert client.post("/auth/logout").status_code == 200
+
+    for token in (original, renewed):
+        _use(client, token)
+        assert client.get("/todos/").status_code == 401
+
+
+def test_logout_leaves_other_sessions_alone(signed_sessions, client, user):
+    first = client.cookies["session_token"]
+    response = client.post("/auth/login", json={"username": user["username"], "password": "test-password"})
+    second = response.cookies["session_token"]
+
+    _use(client, first)
+    client.post("/auth/logout")
+
+    _use(client, second)
+    assert client.get("/todos/").status_code == 200
@@ -0,0 +1,142 @@
+"""Token-bucket rate limits for /auth/login and /auth/signup.
+
+Each attempt takes a token from its client IP's bucket and, for logins, from
+the username's bucket. A bucket holds up to ``burst`` tokens and regains
+``per_minute`` of them a minute; an attempt that finds no token is refused
+with 429 and Retry-After before any bcrypt work is done.
+
+Stores (AUTH_RATE_LIMIT_STORE):
+    memory  (default) per process; with N workers a client gets up to N
+            times the limits
+    sqlite  a ``rate_limits`` table in SQLITE_PATH, shared by every worker
+            (and host) using that file; created there on first use, so it
+            works with STORAGE_BACKEND=memory or mongo too
+
+Anything else (e.g. Redis) can be added by implementing ``RateLimitStore``.
+
+Client IPs are ``request.client.host``. Behind a reverse proxy that is the
+proxy unless uvicorn trusts its X-Forwarded-For, so set FORWARDED_ALLOW_IPS
+to the proxy's address there.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from metrics import AUTH_THROTTLED
+
+# scope -> (burst, per_minute); a burst of 0 turns that limit off
+AUTH_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "login_ip": (float(os.getenv("LOGIN_IP_BURST", "30")), float(os.getenv("LOGIN_IP_PER_MINUTE", "30"))),
+    "login_user": (float(os.getenv("LOGIN_USER_BURST", "10")), float(os.getenv("LOGIN_USER_PER_MINUTE", "5"))),
+    "signup_ip": (float(os.getenv("SIGNUP_IP_BURST", "10")), float(os.getenv("SIGNUP_IP_PER_MINUTE", "10"))),
+}
+
+
+class RateLimitStore:
+    """Token buckets by key."""
+
+    async def take(self, key: str, burst: float, per_second: float) -> float:
+        """Take a token; 0 if one was taken, else seconds until one is available."""
+        raise NotImplementedError
+
+    async def prune(self, idle_seconds: float) -> int:
+        """Forget buckets idle for ``idle_seconds`` (long enough to be full again)."""
+        return 0
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Buckets in an LRU dict; evicting one only resets it to full."""
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key, burst, per_second):
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * per_second)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return 0.0 if allowed else (1 - tokens) / per_second
+
+    async def prune(self, idle_seconds):
+        cutoff = time.monotonic() - idle_seconds
+        pruned = 0
+        # Least recently used first, so stop at the first recent bucket
+        while self._buckets:
+            key, (_, updated_at) = next(iter(self._buckets.items()))
+            if updated_at >= cutoff:
+                break
+            del self._buckets[key]
+            pruned += 1
+        return pruned
+
+
+class SQLiteRateLimitStore(RateLimitStore):
+    """Buckets in the ``rate_limits`` table; each take is one atomic upsert."""
+
+    def __init__(self):
+        self._created = False
+
+    async def _database(self):
+        import database
+        # Only the sqlite and sharded backends migrate SQLITE_PATH
+        if not self._created:
+            await database.run_write(database.create_rate_limits_table)
+            self._created = True
+        return database
+
+    async def take(self, key, burst, per_second):
+        database = await self._database()
+        return await database.run_write(database.take_rate_token, key, burst, per_second, time.time())
+
+    async def prune(self, idle_seconds):
+        database = await self._database()
+        pruned = 0
+        while True:
+            deleted = await database.run_write(database.delete_idle_rate_limits, time.time() - idle_seconds)
+            pruned += deleted
+            if deleted < 500:
+                return pruned
+
+
+class AuthRateLimiter:
+    def __init__(self, store: RateLimitStore, limits: Dict[str, Tuple[float, float]]):
+        self.store = store
+        self.limits = limits
+
+    async def check(self, **keys: Optional[str]) -> float:
+        """Take a token in each ``scope=key`` bucket, in order.
+
+        Returns 0 when every bucket had one, else the Retry-After of the first
+        that did not; later buckets are then left untouched.
+        """
+        for scope, key in keys.items():
+            burst, per_minute = self.limits[scope]
+            if key is None or burst <= 0 or per_minute <= 0:
+                continue
+            retry_after = await self.store.take(f"{scope}:{key}", burst, per_minute / 60)
+            if retry_after:
+                AUTH_THROTTLED.inc(scope)
+                return retry_after
+        return 0.0
+
+    async def prune(self) -> int:
+        refill = [burst / (per_minute / 60) for burst, per_minute in self.limits.values() if per_minute > 0]
+        return await self.store.prune(max(refill, default=0))
+
+
+def limiter_from_env() -> AuthRateLimiter:
+    kind = os.getenv("AUTH_RATE_LIMIT_STORE", "memory")
+    if kind == "sqlite":
+        store = SQLiteRateLimitStore()
+    elif kind == "memory":
+        store = MemoryRateLimitStore(int(os.getenv("AUTH_RATE_LIMIT_MAX_KEYS", "100000")))
+    else:
+        raise ValueError(f"Unknown AUTH_RATE_LIMIT_STORE {kind!r} (expected 'memory' or 'sqlite')")
+    return AuthRateLimiter(store, AUTH_RATE_LIMITS)
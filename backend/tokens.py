@@ -0,0 +1,136 @@
+"""Signed, stateless session tokens.
+
+With SESSION_TOKEN_MODE=signed, login issues a JWT carrying the user's id,
+username, email and expiry, and authentication becomes a signature check in
+CPU instead of a sessions-table lookup. Opaque database sessions keep working
+alongside, so switching modes does not log anyone out.
+
+Keys come from SESSION_SIGNING_KEYS as comma-separated ``kid:secret`` pairs.
+The first key signs new tokens; all of them verify, so a key is rotated by
+putting a new one first and dropping the old one once its tokens have
+expired (SESSION_TTL_DAYS).
+
+Every token of one login, however often sliding expiry renews it, carries
+the same session id (``sid``). Revocation (logout) goes through a deny-list
+of session ids that every worker keeps in memory and refreshes from the
+database in the background, so logging out also revokes tokens renewed or
+issued before the renewal the client last saw.
+"""
+import os
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+# jose (and the crypto backends it loads) is imported on first use, so
+# processes that only use database sessions never pay for it at startup.
+
+SESSION_TOKEN_MODE = os.getenv("SESSION_TOKEN_MODE", "db")
+SESSION_TOKEN_ALGORITHM = os.getenv("SESSION_TOKEN_ALGORITHM", "HS256")
+
+
+def _parse_keys(value: str) -> List[Tuple[str, str]]:
+    keys = []
+    for item in value.split(","):
+        kid, sep, secret = item.strip().partition(":")
+        if sep and kid and secret:
+            keys.append((kid, secret))
+    return keys
+
+
+SIGNING_KEYS = _parse_keys(os.getenv("SESSION_SIGNING_KEYS", ""))
+
+if SESSION_TOKEN_MODE == "signed" and not SIGNING_KEYS:
+    raise RuntimeError("SESSION_TOKEN_MODE=signed requires SESSION_SIGNING_KEYS (kid:secret,...)")
+
+
+def signed_tokens_enabled() -> bool:
+    return SESSION_TOKEN_MODE == "signed"
+
+
+def is_signed_token(token: str) -> bool:
+    # JWTs have three dot-separated parts; opaque session tokens have no dots
+    return token.count(".") == 2
+
+
+def issue_token(user: Dict, ttl: timedelta, sid: Optional[str] = None) -> Tuple[str, datetime]:
+    """Return a signed token for ``user`` and its (naive UTC) expiry.
+
+    Renewals pass the ``sid`` of the token they replace; without one this
+    starts a new session.
+    """
+    from jose import jwt
+
+    kid, secret = SIGNING_KEYS[0]
+    now = int(time.time())
+    exp = now + int(ttl.total_seconds())
+    claims = {
+        "sub": str(user["id"]),
+        "username": user["username"],
+        "email": user["email"],
+        "iat": now,
+        "exp": exp,
+        "jti": secrets.token_urlsafe(12),
+        "sid": sid or secrets.token_urlsafe(12),
+    }
+    token = jwt.encode(claims, secret, algorithm=SESSION_TOKEN_ALGORITHM, headers={"kid": kid})
+    return token, datetime.fromtimestamp(exp, timezone.utc).replace(tzinfo=None)
+
+
+def decode_token(token: str) -> Optional[Dict]:
+    """Verify a signed token and return its claims, or None if invalid or expired."""
+    from jose import JWTError, jwt
+
+    keys = dict(SIGNING_KEYS)
+    try:
+        secret = keys.get(jwt.get_unverified_header(token).get("kid"))
+        if secret is None:
+            return None
+        return jwt.decode(token, secret, algorithms=[SESSION_TOKEN_ALGORITHM])
+    except JWTError:
+        return None
+
+
+def session_id(claims: Dict) -> str:
+    # Tokens issued before sessions had ids are their own session
+    return claims.get("sid", claims["jti"])
+
+
+def user_from_claims(claims: Dict) -> Dict:
+    return {"id": int(claims["sub"]), "username": claims["username"], "email": claims["email"]}
+
+
+class DenyList:
+    """Revoked session ids, mirrored from the revoked_tokens table.
+
+    Entries are kept only until the last token of the session they revoke
+    would have expired anyway. ``last_id`` tracks how far the table has been read so each
+    refresh only fetches new revocations.
+    """
+
+    def __init__(self):
+        self._revoked: Dict[str, float] = {}
+        self.last_id = 0
+
+    def add(self, jti: str, expires_at: float) -> None:
+        self._revoked[jti] = expires_at
+
+    def load(self, rows: List[Dict]) -> None:
+        """Merge rows of (id, jti, expires_at) and drop expired entries."""
+        for row in rows:
+            expires_at = row["expires_at"]
+            if isinstance(expires_at, str):
+                expires_at = datetime.fromisoformat(expires_at)
+            self.add(row["jti"], (expires_at - datetime(1970, 1, 1)).total_seconds())
+            self.last_id = max(self.last_id, row["id"])
+        now = time.time()
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+
+deny_list = DenyList()
@@ -0,0 +1,135 @@
+"""NDJSON and CSV encoding for /todos/export and parsing for /todos/import.
+
+Both directions work a bounded batch at a time: exports encode one batch of
+rows per chunk of the response, and ``TodoImport`` reads an uploaded file
+(which Starlette spools to disk past 1 MB) a chunk of rows at a time, so
+memory use does not grow with the number of todos.
+
+Exported rows carry id, title, description, completed, created_at and
+last_modified_at. Imports only use title, description and completed; other
+columns (such as an earlier export's ids and timestamps) are ignored, so an
+export can be imported again as is.
+"""
+import csv
+import io
+import json
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+import orjson
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_FIELDS = ('id', 'title', 'description', 'completed', 'created_at', 'last_modified_at')
+# Only the first few rejected rows are reported back, the rest are counted
+IMPORT_MAX_ERRORS = 100
+
+_TRUE = {"1", "true", "yes", "y", "t"}
+_FALSE = {"", "0", "false", "no", "n", "f"}
+
+
+class ImportFormatError(ValueError):
+    """The upload as a whole cannot be read (as opposed to one bad row)."""
+
+
+def import_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    """Guess the format of an upload from its name, then its content type."""
+    name = (filename or "").lower()
+    if name.endswith(".csv") or (content_type or "").startswith("text/csv"):
+        return "csv"
+    return "ndjson"
+
+
+def export_header(fmt: str) -> bytes:
+    return _csv_lines([EXPORT_FIELDS]) if fmt == "csv" else b""
+
+
+def encode_rows(rows: List[Dict], fmt: str) -> bytes:
+    if fmt == "csv":
+        return _csv_lines([
+            [row['id'], row['title'], row['description'], "true" if row['completed'] else "false",
+             row['created_at'], row['last_modified_at']]
+            for row in rows
+        ])
+    return b"".join(
+        orjson.dumps({**{field: row[field] for field in EXPORT_FIELDS}, 'completed': bool(row['completed'])},
+                     default=str, option=orjson.OPT_APPEND_NEWLINE)
+        for row in rows
+    )
+
+
+def _csv_lines(records) -> bytes:
+    out = io.StringIO()
+    csv.writer(out).writerows(records)
+    return out.getvalue().encode()
+
+
+def _records(file: BinaryIO, fmt: str) -> Iterator[Tuple[int, Union[Dict, str]]]:
+    """Yield (line number, record) or (line number, error message) per row."""
+    if fmt == "csv":
+        reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+        if reader.fieldnames is None:
+            return
+        if 'title' not in reader.fieldnames:
+            raise ImportFormatError("CSV header must include a 'title' column")
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line_no, line in enumerate(io.TextIOWrapper(file, encoding="utf-8-sig"), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, f"invalid JSON: {e.msg}"
+            continue
+        yield line_no, record if isinstance(record, dict) else "expected a JSON object"
+
+
+def import_row(record: Dict) -> Dict:
+    """Validate one imported record; raises ValueError with a short reason."""
+    title = record.get('title')
+    if not isinstance(title, str) or not title.strip():
+        raise ValueError("title is required")
+    description = record.get('description')
+    if description is not None and not isinstance(description, str):
+        raise ValueError("description must be a string")
+
+    completed = record.get('completed')
+    if completed is None or isinstance(completed, bool):
+        completed = bool(completed)
+    elif isinstance(completed, int) and completed in (0, 1):
+        completed = bool(completed)
+    elif isinstance(completed, str) and completed.strip().lower() in _TRUE | _FALSE:
+        completed = completed.strip().lower() in _TRUE
+    else:
+        raise ValueError("completed must be true or false")
+    return {'title': title, 'description': description or None, 'completed': completed}
+
+
+class TodoImport:
+    """Reads valid rows from an upload a chunk at a time (blocking I/O)."""
+
+    def __init__(self, file: BinaryIO, fmt: str):
+        self._records = _records(file, fmt)
+        self.rejected = 0
+        self.errors: List[Dict] = []
+
+    def next_chunk(self, size: int) -> List[Dict]:
+        """Up to ``size`` valid rows; an empty list once the upload is exhausted.
+
+        Raises ImportFormatError (or UnicodeDecodeError, csv.Error) if the
+        upload cannot be parsed any further.
+        """
+        rows = []
+        for line_no, record in self._records:
+            try:
+                if isinstance(record, str):
+                    raise ValueError(record)
+                rows.append(import_row(record))
+            except ValueError as e:
+                self.rejected += 1
+                if len(self.errors) < IMPORT_MAX_ERRORS:
+                    self.errors.append({'line': line_no, 'error': str(e)})
+            if len(rows) >= size:
+                break
+        return rows
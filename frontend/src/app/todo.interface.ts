@@ -8,4 +8,22 @@ export interface Todo {
 export interface TodoCreate {
     title: string;
     description?: string;
-} 
\ No newline at end of file
+}
+
+export interface TodoChanges {
+    version: number;
+    reset: boolean;
+    todos: Todo[];
+    deleted: number[];
+    has_more: boolean;
+    // Set while a reset has more pages; pass back with `version`
+    cursor?: number | null;
+}
+
+export interface BulkUpdateResult {
+    completed: boolean;
+    status: 'done' | 'running' | 'failed';
+    updated: number;
+    ids: number[];
+    job_id?: string;
+}
@@ -1,7 +1,7 @@
-import { Injectable } from '@angular/core';
+import { Injectable, NgZone } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
 import { Observable, catchError, throwError } from 'rxjs';
-import { Todo, TodoCreate } from './todo.interface';
+import { BulkUpdateResult, Todo, TodoChanges, TodoCreate } from './todo.interface';
 
 @Injectable({
   providedIn: 'root'
@@ -9,7 +9,7 @@ import { Todo, TodoCreate } from './todo.interface';
 export class TodoService {
   private apiUrl = 'http://localhost:8000';
 
-  constructor(private http: HttpClient) { }
+  constructor(private http: HttpClient, private zone: NgZone) { }
 
   getTodos(): Observable<Todo[]> {
     return this.http.get<Todo[]>(`${this.apiUrl}/todos/`, { withCredentials: true })
@@ -21,6 +21,45 @@ export class TodoService {
       );
   }
 
+  getChanges(since: number, cursor?: number | null): Observable<TodoChanges> {
+    return this.http.get<TodoChanges>(`${this.apiUrl}/todos/changes`, {
+      params: cursor == null ? { since } : { since, cursor },
+      withCredentials: true
+    }).pipe(
+      catchError(error => {
+        console.error('Error loading todo changes:', error);
+        return throwError(() => error);
+      })
+    );
+  }
+
+  /**
+   * Server-Sent Events stream of changes to the user's todos. Emits a
+   * TodoChanges with only `version` set once the stream is ready, then one
+   * per change. EventSource reconnects and resumes by itself.
+   */
+  streamChanges(): Observable<TodoChanges> {
+    return new Observable<TodoChanges>(subscriber => {
+      const source = new EventSource(`${this.apiUrl}/todos/stream`, { withCredentials: true });
+      const emit = (event: MessageEvent, ready: boolean) => this.zone.run(() => {
+        const data = JSON.parse(event.data);
+        subscriber.next(ready
+          ? { version: data.version, reset: false, todos: [], deleted: [], has_more: false }
+          : data);
+      });
+      source.addEventListener('ready', event => emit(event as MessageEvent, true));
+      source.addEventListener('changes', event => emit(event as MessageEvent, false));
+      // Transient errors are retried by EventSource; CLOSED means it gave up
+      // (e.g. a 401), which the caller handles like any failed request
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          this.zone.run(() => subscriber.error(new Error('Change stream closed')));
+        }
+      };
+      return () => source.close();
+    });
+  }
+
   createTodo(todo: TodoCreate): Observable<Todo> {
     return this.http.post<Todo>(`${this.apiUrl}/todos/`, todo, { withCredentials: true })
       .pipe(
@@ -57,8 +96,8 @@ export class TodoService {
     );
   }
 
-  updateAllTodos(completed: boolean): Observable<Todo[]> {
-    return this.http.patch<Todo[]>(
+  updateAllTodos(completed: boolean): Observable<BulkUpdateResult> {
+    return this.http.patch<BulkUpdateResult>(
       `${this.apiUrl}/todos/`,
       { completed },
       { withCredentials: true }
@@ -1,11 +1,12 @@
-import { Component, OnInit } from '@angular/core';
+import { Component, OnDestroy, OnInit } from '@angular/core';
 import { CommonModule } from '@angular/common';
 import { FormsModule } from '@angular/forms';
 import { Router } from '@angular/router';
 import { TodoService } from '../todo.service';
 import { AuthService } from '../auth.service';
 import { ThemeService } from '../theme.service';
-import { Todo, TodoCreate } from '../todo.interface';
+import { Subscription } from 'rxjs';
+import { Todo, TodoChanges, TodoCreate } from '../todo.interface';
 
 @Component({
   selector: 'app-todo',
@@ -415,7 +416,7 @@ import { Todo, TodoCreate } from '../todo.interface';
     }
   `]
 })
-export class TodoComponent implements OnInit {
+export class TodoComponent implements OnInit, OnDestroy {
   todos: Todo[] = [];
   newTodo: TodoCreate = {
     title: '',
@@ -424,6 +425,9 @@ export class TodoComponent implements OnInit {
   editingTodo: Todo | null = null;
   error: string | null = null;
   isLoading = false;
+  private changesSubscription?: Subscription;
+  // Stream events that arrive before the initial list has loaded
+  private pendingChanges: TodoChanges[] | null = null;
 
   constructor(
     private todoService: TodoService,
@@ -433,7 +437,54 @@ export class TodoComponent implements OnInit {
   ) {}
 
   ngOnInit() {
-    this.loadTodos();
+    // Listen for changes from other tabs and devices instead of polling.
+    // The list is loaded once the stream is ready, so nothing is missed.
+    let loaded = false;
+    this.changesSubscription = this.todoService.streamChanges().subscribe({
+      next: changes => {
+        if (!loaded) {
+          loaded = true;
+          this.pendingChanges = [];
+          this.loadTodos();
+        } else if (this.pendingChanges !== null) {
+          this.pendingChanges.push(changes);
+        } else {
+          this.applyChanges(changes);
+        }
+      },
+      // Without a stream, fall back to a plain load
+      error: () => {
+        if (!loaded) {
+          loaded = true;
+          this.loadTodos();
+        }
+      }
+    });
+  }
+
+  ngOnDestroy() {
+    this.changesSubscription?.unsubscribe();
+  }
+
+  private applyChanges(changes: TodoChanges) {
+    if (changes.reset) {
+      this.todos = changes.todos;
+      return;
+    }
+    const deleted = new Set(changes.deleted);
+    const todos = this.todos.filter(todo => !deleted.has(todo.id));
+    changes.todos.forEach(changed => this.upsert(todos, changed));
+    this.todos = todos;
+  }
+
+  // Replace the todo with the same id, or add it if the list has none
+  private upsert(todos: Todo[], changed: Todo) {
+    const index = todos.findIndex(todo => todo.id === changed.id);
+    if (index === -1) {
+      todos.push(changed);
+    } else {
+      todos[index] = changed;
+    }
   }
 
   loadTodos() {
@@ -442,6 +493,10 @@ export class TodoComponent implements OnInit {
     this.todoService.getTodos().subscribe({
       next: (todos) => {
         this.todos = todos;
+        // Changes are idempotent upserts/deletes, so replaying any that
+        // the list already reflects is harmless
+        (this.pendingChanges ?? []).forEach(changes => this.applyChanges(changes));
+        this.pendingChanges = null;
         this.isLoading = false;
       },
       error: (error) => {
@@ -462,7 +517,8 @@ export class TodoComponent implements OnInit {
       this.error = null;
       this.todoService.createTodo(this.newTodo).subscribe({
         next: (todo) => {
-          this.todos.push(todo);
+          // The change stream may have delivered this todo already
+          this.upsert(this.todos, todo);
           this.newTodo = { title: '', description: '' };
           this.isLoading = false;
         },
@@ -485,8 +541,9 @@ export class TodoComponent implements OnInit {
     this.error = null;
     
     this.todoService.updateAllTodos(!allCompleted).subscribe({
-      next: (todos) => {
-        this.todos = todos;
+      next: (result) => {
+        // The server only reports what changed; every task now has this status
+        this.todos = this.todos.map(todo => ({ ...todo, completed: result.completed }));
         this.isLoading = false;
       },
       error: (error) => {